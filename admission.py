@@ -0,0 +1,177 @@
+"""Upstream eşzamanlılık sınırları (global + host başına) ve kısa, adil bekleme kuyruğu
+
+Sınır doluysa istek kuyrukta en çok `timeout` saniye bekler; kuyruk da doluysa ya da
+süre dolarsa Overloaded yükselir (yanıt: 503 + Retry-After). Boşalan slot kuyruktaki ilk
+uygun isteğe doğrudan devredilir - sonradan gelen istek kuyruğu atlayamaz, dolu bir host'u
+bekleyen istek başka host'ların isteklerini de bekletmez.
+
+Hem thread/greenlet (acquire) hem asyncio (acquire_async) bekleyicileri desteklenir.
+"""
+import asyncio
+import threading
+from collections import deque
+
+
+class Overloaded(Exception):
+    """Slot alınamadı (kuyruk dolu ya da bekleme süresi doldu)"""
+
+    def __init__(self, host, reason):
+        super().__init__(f"upstream {host} overloaded ({reason})")
+        self.host = host
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ('host', 'wake', 'granted')
+
+    def __init__(self, host, wake):
+        self.host = host
+        self.wake = wake
+        self.granted = False
+
+
+class AdmissionControl:
+    def __init__(self, limit=0, host_limit=0, host_limits=None, queue_size=100, timeout=2.0):
+        self.limit = limit  # tüm host'lar toplamı, 0 = sınırsız
+        self.host_limit = host_limit  # host başına varsayılan, 0 = sınırsız
+        self.host_limits = host_limits or {}
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.enabled = bool(limit or host_limit or any(self.host_limits.values()))
+        self.active = 0
+        self.admitted = 0
+        self.waited = 0
+        self.rejected = {'queue_full': 0, 'timeout': 0}
+        self._hosts = {}  # host -> aktif slot
+        self._queued = {}  # host -> bekleyen
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _fits(self, host):
+        if self.limit and self.active >= self.limit:
+            return False
+        limit = self.host_limits.get(host, self.host_limit)
+        return not limit or self._hosts.get(host, 0) < limit
+
+    def _take(self, host):
+        self.active += 1
+        self.admitted += 1
+        self._hosts[host] = self._hosts.get(host, 0) + 1
+
+    def _enter(self, host, wake, timeout):
+        """Slot hemen alındıysa None, yoksa kuyruğa eklenen bekleyen; kuyruk doluysa Overloaded"""
+        with self._lock:
+            # Uygun bekleyen her release'te slotunu alır - kuyrukta kalanlar sığmayanlardır
+            if self._fits(host):
+                self._take(host)
+                return None
+            if timeout <= 0 or len(self._waiters) >= self.queue_size:
+                self.rejected['queue_full'] += 1
+                raise Overloaded(host, 'queue full')
+            waiter = _Waiter(host, wake)
+            self._waiters.append(waiter)
+            self._queued[host] = self._queued.get(host, 0) + 1
+            self.waited += 1
+            return waiter
+
+    def _leave(self, waiter, timed_out):
+        """Bekleyeni kuyruktan çıkar; slot bu arada devredildiyse True"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            self._dequeued(waiter.host)
+            if timed_out:
+                self.rejected['timeout'] += 1
+            return False
+
+    def _dequeued(self, host):
+        left = self._queued[host] - 1
+        if left:
+            self._queued[host] = left
+        else:
+            del self._queued[host]
+
+    def acquire(self, host, timeout=None):
+        """Slot al (thread/greenlet); alınamazsa Overloaded. Her başarılı çağrı release ile kapanmalı"""
+        timeout = self.timeout if timeout is None else timeout
+        event = threading.Event()
+        waiter = self._enter(host, event.set, timeout)
+        if waiter is None:
+            return
+        try:
+            granted = event.wait(timeout)
+        except BaseException:
+            if self._leave(waiter, False):
+                self.release(host)
+            raise
+        if not granted and not self._leave(waiter, True):
+            raise Overloaded(host, 'queue timeout')
+
+    async def acquire_async(self, host, timeout=None):
+        """acquire'ın asyncio karşılığı"""
+        timeout = self.timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(_resolve, fut)
+        waiter = self._enter(host, wake, timeout)
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            if not self._leave(waiter, True):
+                raise Overloaded(host, 'queue timeout') from None
+        except BaseException:
+            if self._leave(waiter, False):
+                self.release(host)
+            raise
+
+    def release(self, host):
+        """Slotu bırak ve sığan ilk bekleyenlere (FIFO) devret"""
+        wake = []
+        with self._lock:
+            self.active -= 1
+            left = self._hosts[host] - 1
+            if left:
+                self._hosts[host] = left
+            else:
+                del self._hosts[host]
+            for waiter in list(self._waiters):
+                if self.limit and self.active >= self.limit:
+                    break
+                if self._fits(waiter.host):
+                    self._waiters.remove(waiter)
+                    self._dequeued(waiter.host)
+                    self._take(waiter.host)
+                    waiter.granted = True
+                    wake.append(waiter.wake)
+        for fn in wake:
+            fn()
+
+    def queue_depths(self):
+        return dict(self._queued)
+
+    def active_hosts(self):
+        return dict(self._hosts)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "limit": self.limit,
+            "host_limit": self.host_limit,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "waited": self.waited,
+            "rejected": dict(self.rejected),
+            "hosts": {host: {"active": self._hosts.get(host, 0), "queued": self._queued.get(host, 0)}
+                      for host in set(self._hosts) | set(self._queued)}
+        }
+
+
+def _resolve(fut):
+    if not fut.done():
+        fut.set_result(True)
@@ -0,0 +1,1100 @@
+"""asyncio sunucu modu (aiohttp) - gevent/Flask rotalarının native async karşılığı
+
+Çalıştırma: SERVER_MODE=asyncio python app.py  veya  python aio_server.py
+Önbellekler, metrikler, rewriter ve circuit breaker app.py ile ortaktır.
+"""
+import os
+
+# app import edilmeden önce: asyncio modunda gevent monkey patch yapılmaz
+os.environ.setdefault('SERVER_MODE', 'asyncio')
+
+import asyncio
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from aiohttp import ClientConnectionError, ClientRequest, ClientTimeout, TCPConnector, ClientSession, TraceConfig, web
+from yarl import URL
+
+import admission
+import hls_rewriter
+import app as core
+import tracing
+
+logger = core.logger
+
+# PERFORMANS İYİLEŞTİRMESİ: Tek havuzlu async HTTP istemcisi
+AIO_CONNECTION_LIMIT = int(os.environ.get('AIO_CONNECTION_LIMIT', '0'))  # 0 = sınırsız
+AIO_RESOLVE_THREADS = int(os.environ.get('AIO_RESOLVE_THREADS', '32'))
+UPSTREAM_RETRIES = 2  # gevent modundaki Retry(total=2) ile aynı
+RETRY_STATUSES = (500, 502, 503, 504)
+M3U_CONTENT_TYPE = "application/vnd.apple.mpegurl"
+UPLOAD_SPOOL_BYTES = 1024 * 1024  # daha büyük liste yüklemeleri diske taşar
+
+_http = None  # ClientSession (on_startup'ta oluşturulur)
+_loop = None
+# resolve_fast senkron (requests) - event loop'u bloklamaması için thread havuzunda çalışır
+_resolve_pool = ThreadPoolExecutor(max_workers=AIO_RESOLVE_THREADS, thread_name_prefix='resolve')
+# launcher.py altında paylaşılan önbellek daemon'u: okumalar ve (sıralı) yazmalar olay döngüsü dışında
+_shared_reads = ThreadPoolExecutor(max_workers=core.SHARED_CACHE_CONNECTIONS, thread_name_prefix='shared-cache')
+_shared_writes = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shared-cache-write')
+
+
+def on_event_loop():
+    """core.on_event_loop yerine"""
+    try:
+        return asyncio.get_running_loop() is _loop
+    except RuntimeError:
+        return False
+
+
+def shared_write(fn, *args):
+    """core.shared_write yerine: yanıtsız daemon çağrıları sırayla yazma thread'inde"""
+    _shared_writes.submit(fn, *args)
+
+
+async def shared_fill(cache, key):
+    """Yerelde taze kayıt yoksa daemon'daki kaydı ayrı thread'de yerele çek - ardından core'un
+    senkron okumaları (olay döngüsünde daemon'a gitmez) yerelden karşılanır"""
+    if isinstance(cache, core.SharedTTLCache) and not cache.fresh(key):
+        await asyncio.get_running_loop().run_in_executor(_shared_reads, cache.get_entry, key)
+
+
+async def open_upstream(url, headers, connect=2, read=8, method='GET'):
+    """Upstream isteği - circuit breaker, sağlık ölçümü ve retry ile. Yanıt release edilmeli."""
+    health = core.host_health(urlparse(url).hostname)
+    timeout = ClientTimeout(sock_connect=connect, sock_read=read)
+    attempt = 0
+    while True:
+        if not health.allow():
+            raise core.CircuitOpenError(f"Circuit open for {health.host}")
+        start = time.time()
+        try:
+            with tracing.upstream(method, health.host) as span:
+                resp = await _http.request(method, url, headers=headers, timeout=timeout, allow_redirects=True)
+                span.set(status=resp.status)
+        except (ClientConnectionError, asyncio.TimeoutError):
+            health.record(time.time() - start, False)
+            if attempt >= UPSTREAM_RETRIES:
+                raise
+        else:
+            ok = resp.status < 500 and resp.status != 429
+            elapsed = time.time() - start
+            health.record(elapsed, ok)
+            core.UPSTREAM_TTFB.observe((health.host,), elapsed)
+            if resp.status not in RETRY_STATUSES or attempt >= UPSTREAM_RETRIES:
+                return resp
+            resp.release()
+        await asyncio.sleep(0.1 * (2 ** attempt))
+        attempt += 1
+
+
+# aiohttp bağlantı olayları -> aktif upstream span'ine dns/connect süresi (connect TLS dahil)
+async def _on_dns_start(session, ctx, params):
+    ctx.dns_start = time.perf_counter()
+
+
+async def _on_dns_end(session, ctx, params):
+    ctx.dns = time.perf_counter() - ctx.dns_start
+    tracing.upstream_timing('dns', ctx.dns)
+
+
+async def _on_connect_start(session, ctx, params):
+    ctx.dns = 0
+    ctx.connect_start = time.perf_counter()
+
+
+async def _on_connect_end(session, ctx, params):
+    tracing.upstream_timing('connect', time.perf_counter() - ctx.connect_start - ctx.dns)
+
+
+async def prewarm_upstream(url, count):
+    """app._prewarm_pool'un asyncio karşılığı: aiohttp havuzuna count bağlantı aç (TCP + TLS)"""
+    if core.host_health(urlparse(url).hostname).state != 'closed':
+        return
+    req = ClientRequest('GET', URL(url), loop=asyncio.get_running_loop())
+    timeout = ClientTimeout(sock_connect=core.PREWARM_CONNECT_TIMEOUT)
+    results = await asyncio.gather(*(_http.connector.connect(req, [], timeout) for _ in range(count)),
+                                   return_exceptions=True)
+    for conn in results:
+        if isinstance(conn, Exception):
+            core._prewarm_counts['failed'] += 1
+            logger.debug(f"Prewarm to {req.host} failed: {conn}")
+        else:
+            conn.release()  # istek yapılmadı - bağlantı keep-alive havuzuna döner
+            core._prewarm_counts['opened'] += 1
+
+
+def schedule_prewarm(url, count):
+    """core.prewarm_connections yerine: resolve thread'lerinden event loop'a ısıtma görevi"""
+    _loop.call_soon_threadsafe(spawn_task, prewarm_upstream(url, count))
+
+
+def upstream_trace_config():
+    config = TraceConfig()
+    config.on_dns_resolvehost_start.append(_on_dns_start)
+    config.on_dns_resolvehost_end.append(_on_dns_end)
+    config.on_connection_create_start.append(_on_connect_start)
+    config.on_connection_create_end.append(_on_connect_end)
+    return config
+
+
+class AsyncSingleFlight:
+    """Anahtar başına tek coroutine - diğerleri aynı future'ı bekler"""
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, fn, *args):
+        fut = self._calls.get(key)
+        if fut is not None:
+            return await asyncio.shield(fut), True
+        fut = asyncio.get_running_loop().create_future()
+        self._calls[key] = fut
+        try:
+            result = await fn(*args)
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()  # bekleyen yoksa "never retrieved" uyarısı olmasın
+            raise
+        else:
+            fut.set_result(result)
+        finally:
+            del self._calls[key]
+        return result, False
+
+
+_playlist_flight = AsyncSingleFlight()
+_live_flight = AsyncSingleFlight()
+_key_flight = AsyncSingleFlight()
+
+
+async def admit(url, timeout=None):
+    """app.admit'in async karşılığı - release için host ya da None"""
+    if not core.admission_control.enabled:
+        return None
+    host = urlparse(url).hostname
+    with tracing.span('admission', host=host):
+        await core.admission_control.acquire_async(host, timeout)
+    return host
+
+
+def overloaded_response(error):
+    return web.Response(text=f"Upstream busy: {error}", status=503,
+                        headers={'Retry-After': str(core.ADMISSION_RETRY_AFTER)})
+
+
+def _abort_stalled(transport):
+    core.metrics['slow_clients'] += 1
+    transport.abort()
+
+
+async def write_client(request, pace, size, write):
+    """write'ı (istemciye yazan awaitable) bekle. Yazması CLIENT_WRITE_TIMEOUT'u aşan ya da
+    eşiğin altında okuyan istemcinin bağlantısı kesilir; bağlantı yoksa False döner"""
+    transport = request.transport
+    if transport is None or transport.is_closing():
+        write.close()
+        return False
+    started = time.time()
+    stalled = asyncio.get_running_loop().call_later(core.CLIENT_WRITE_TIMEOUT, _abort_stalled, transport)
+    try:
+        await write
+    except ConnectionError:
+        return False
+    finally:
+        stalled.cancel()
+    if pace.wrote(size, time.time() - started):
+        transport.abort()
+        return False
+    return True
+
+
+async def resolve(url, headers):
+    """get_cached_resolve'u (senkron) thread havuzunda çalıştır"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_resolve_pool, tracing.bind(core.get_cached_resolve), url, headers)
+
+
+async def get_cached_playlist(resolved_url, headers):
+    """app.get_cached_playlist'in async karşılığı (aynı önbellek)"""
+    cache_key = core.resolve_cache_key(resolved_url, headers)
+    if core.PREFETCH_ENABLED:
+        core._playlist_polls.set(cache_key, True)
+    with tracing.span('playlist') as span:
+        await shared_fill(core._playlist_cache, cache_key)
+        body = core._playlist_cache.get(cache_key)
+        if body is not None:
+            core.metrics['playlist_cache_hits'] += 1
+            span.set(cache='hit')
+            return body
+
+        body, shared = await _playlist_flight.do(cache_key, _fetch_playlist, cache_key, resolved_url, headers)
+        if shared:
+            core.metrics['playlist_coalesced'] += 1
+        else:
+            core.metrics['playlist_cache_misses'] += 1
+        span.set(cache='coalesced' if shared else 'miss')
+        return body
+
+
+async def _fetch_playlist(cache_key, resolved_url, headers):
+    body = core._playlist_cache.get(cache_key)
+    if body is not None:
+        return body
+    return await _load_playlist(cache_key, resolved_url, headers)
+
+
+async def _load_playlist(cache_key, resolved_url, headers):
+    started = time.time()
+    resp = await open_upstream(resolved_url, headers, read=8)
+    try:
+        content = await resp.text(errors='replace')
+        final = str(resp.url)
+        status = resp.status
+    finally:
+        resp.release()
+    core.observe_upstream_total(resolved_url, started, len(content))
+
+    body, hint = core.store_playlist(cache_key, content, final, status, headers)
+    if hint is not None:
+        preload_part(hint, headers)
+    return body
+
+
+async def get_live_playlist(resolved_url, headers, msn, part):
+    """app.get_live_playlist'in async karşılığı (aynı canlı uç kayıtları)"""
+    cache_key = core.resolve_cache_key(resolved_url, headers)
+    edge = core._live_edges.get(cache_key)
+    if edge is None:
+        body = await get_cached_playlist(resolved_url, headers)
+        edge = core._live_edges.get(cache_key)
+        if edge is None:
+            return 200, body
+    deadline = time.time() + edge.block_timeout()
+    result = core.live_result(edge, msn, part, deadline)
+    if result is not None and result[0] == 400:
+        # Önbellekteki uç eski olabilir - reddetmeden önce upstream'den bir kez tazele
+        try:
+            await _live_flight.do(cache_key, _load_playlist, cache_key, resolved_url, headers)
+        except Exception as e:
+            logger.debug(f"Live edge refresh failed: {e}")
+        edge = core._live_edges.get(cache_key) or edge
+        result = core.live_result(edge, msn, part, deadline)
+    if result is not None:
+        if result[0] == 200:
+            core.metrics['llhls_immediate'] += 1
+        return result
+
+    core.metrics['llhls_blocked'] += 1
+    with tracing.span('llhls_block', msn=msn, part=part):
+        while result is None:
+            await _live_flight.do((cache_key, msn, part), _fetch_live, cache_key, resolved_url, headers, edge, msn,
+                                  part)
+            edge = core._live_edges.get(cache_key) or edge
+            result = core.live_result(edge, msn, part, deadline)
+    return result
+
+
+async def _fetch_live(cache_key, resolved_url, headers, edge, msn, part):
+    if edge.can_block:
+        url = core.blocking_url(resolved_url, msn, part)
+    else:
+        await asyncio.sleep(edge.poll_interval())
+        url = resolved_url
+    resp = await open_upstream(url, headers, read=edge.block_timeout() + 2)
+    try:
+        content = await resp.text(errors='replace')
+        final = str(resp.url)
+        status = resp.status
+    finally:
+        resp.release()
+    core.metrics['llhls_upstream'] += 1
+    _, hint = core.store_playlist(cache_key, content, final, status, headers)
+    if hint is not None:
+        preload_part(hint, headers)
+    current = core._live_edges.get(cache_key)
+    if edge.can_block and (current is None or current.position <= edge.position):
+        await asyncio.sleep(edge.poll_interval())
+
+
+class AsyncSegmentFetch(core.SegmentBody):
+    """app.SegmentFetch'in async karşılığı - tek upstream indirmesi, çok okuyucu"""
+
+    def __init__(self, url, headers):
+        self.url = url
+        self.headers = headers
+        self._init_body()
+        self._cond = asyncio.Condition()
+
+    async def _notify(self):
+        async with self._cond:
+            self._cond.notify_all()
+
+    async def run(self):
+        slot = None
+        try:
+            url, headers, byterange = self._upstream()
+            slot = await admit(url, 0 if self.background else None)
+            started = time.time()
+            resp = await open_upstream(url, headers, read=20)
+            try:
+                self._start(resp.status, resp.headers, byterange)
+                await self._notify()
+                async for chunk in resp.content.iter_chunked(core.SEGMENT_CHUNK_SIZE):
+                    if chunk:
+                        self._append(chunk)
+                        await self._notify()
+                    if self.window is not None and not self.window[1]:
+                        break
+                core.observe_upstream_total(url, started, self.size)
+            finally:
+                resp.release()
+        except Exception as e:
+            self.error = e
+            logger.warning(f"Segment fetch error: {e}")
+            tracing.error(e, 'segment')
+        finally:
+            core.release_slot(slot)
+            self._store()
+            self.done = True
+            await self._notify()
+            if _inflight.get(self.url) is self:
+                del _inflight[self.url]
+            self._release_body()
+
+    async def wait_headers(self, timeout=22):
+        try:
+            async with self._cond:
+                await asyncio.wait_for(
+                    self._cond.wait_for(lambda: self.status is not None or self.done), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.status is not None
+
+    async def iter_chunks(self, timeout=20):
+        """Baştan itibaren tüm parçalar. Okuyucu kaydı generator'ın dışındadır: başlamadan kapatılan
+        async generator finally'sini çalıştırmaz - çağıran bitince detach çağırır"""
+        cursor = seen = 0
+        while True:
+            if self.size <= seen and not self.done:
+                try:
+                    async with self._cond:
+                        await asyncio.wait_for(
+                            self._cond.wait_for(lambda: self.size > seen or self.done), timeout)
+                except asyncio.TimeoutError:
+                    return
+            nxt = self._piece(cursor)
+            if nxt is None:
+                return
+            piece, cursor = nxt
+            seen += len(piece)
+            yield piece
+
+    def detach(self):
+        self.readers -= 1
+        self._release_body()
+
+
+_inflight = {}
+_tasks = set()  # arka plan görevlerine referans (GC'ye karşı)
+
+
+def get_segment_fetch(url, headers):
+    """Devam eden indirmeyi döndür ya da başlat; çağıran okuyucu olarak kaydolur"""
+    fetch = _inflight.get(url)
+    if fetch is not None and not fetch.passthrough:
+        fetch.readers += 1
+        return fetch, False
+    fetch = _inflight[url] = AsyncSegmentFetch(url, headers)
+    fetch.readers = 1
+    spawn_task(fetch.run())
+    return fetch, True
+
+
+def spawn_prefetch(channel_key, url, headers):
+    """core.spawn_prefetch yerine: ön-yükleme _inflight'a kaydolur (istemciler aynı indirmeye katılır),
+    aiohttp havuzunu ve admission'ı kullanır"""
+    _loop.call_soon_threadsafe(spawn_task, prefetch_segment(channel_key, url, headers))
+
+
+async def prefetch_segment(channel_key, url, headers):
+    try:
+        if not core.prefetch_wanted(channel_key, url) or url in _inflight:
+            return
+        fetch = _inflight[url] = AsyncSegmentFetch(url, headers)
+        fetch.background = True
+        core.metrics['prefetch_started'] += 1
+        await fetch.run()
+        core.prefetch_done(url, fetch.size)
+    finally:
+        core._prefetch_state['active'] -= 1
+
+
+def preload_part(url, headers):
+    """app.preload_part'ın async karşılığı - okuyucusuz indirme, istemciler katılır"""
+    if url in _inflight or core.segment_cache.get(url) is not None:
+        return
+    fetch = _inflight[url] = AsyncSegmentFetch(url, headers)
+    fetch.background = True
+    core.metrics['llhls_preloads'] += 1
+    spawn_task(fetch.run())
+
+
+def spawn_task(coro):
+    task = asyncio.get_running_loop().create_task(coro)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+async def release_when_flushed(request, release, timeout=30):
+    """Taşıma katmanı memoryview'ları tutuyor olabilir - buffer'ı ancak yazma tamponu boşalınca bırak"""
+    transport = request.transport
+    deadline = time.time() + timeout
+    while (transport is not None and not transport.is_closing()
+           and transport.get_write_buffer_size() and time.time() < deadline):
+        await asyncio.sleep(0.05)
+    release()
+
+
+def _error(e):
+    return web.Response(text=f"Error: {e}", status=500)
+
+
+def m3u_response(request, version):
+    """app.m3u_response'un aiohttp karşılığı"""
+    status, data, headers = core.playlist_response(version, request.headers.get('If-None-Match'),
+                                                   request.headers.get('Accept-Encoding'))
+    return web.Response(body=data, status=status, headers=headers, content_type=M3U_CONTENT_TYPE)
+
+
+async def proxy_m3u(request):
+    url = request.query.get('url', '').strip()
+    if not url:
+        return web.Response(text="No URL", status=400)
+
+    core.metrics['total_requests'] += 1
+    h = core.parse_headers(request.query, dict(core.DEFAULT_M3U_HEADERS))
+    url = core.normalize_stream_url(url)
+    try:
+        ll = core.ll_request(request.query)
+    except ValueError as e:
+        return web.Response(text=f"Invalid LL-HLS request: {e}", status=400)
+
+    try:
+        with core.active_stream():
+            result = await resolve(url, h)
+            if not result["resolved_url"]:
+                return web.Response(text="Failed to resolve", status=500)
+            if ll is not None:
+                status, body = await get_live_playlist(result["resolved_url"], result["headers"], *ll)
+                if status != 200:
+                    return web.Response(text=body, status=status)
+            else:
+                body = await get_cached_playlist(result["resolved_url"], result["headers"])
+        return m3u_response(request, core.playlist_version(
+            core.resolve_cache_key(result["resolved_url"], result["headers"]), body))
+    except Exception as e:
+        logger.error(f"M3U error: {e}")
+        return _error(e)
+
+
+async def proxy_resolve(request):
+    url = request.query.get('url', '').strip()
+    if not url:
+        return web.Response(text="No URL", status=400)
+
+    core.metrics['total_requests'] += 1
+    h = core.parse_headers(request.query, {})
+    try:
+        result = await resolve(url, h)
+        if not result["resolved_url"]:
+            return web.Response(text="Failed", status=500)
+        body = core.resolve_playlist_body(result['resolved_url'], result["headers"])
+        return m3u_response(request, core.playlist_version(f"resolve:{result['resolved_url']}", body))
+    except Exception as e:
+        return _error(e)
+
+
+async def proxy_ts(request):
+    url = request.query.get('url', '').strip()
+    if not url:
+        return web.Response(text="No URL", status=400)
+    byterange = request.query.get('br')
+    if byterange and not core.BYTERANGE_RE.match(byterange):
+        return web.Response(text="Bad byte range", status=400)
+    key = core.segment_key(url, byterange)
+
+    h = core.parse_headers(request.query)
+    try:
+        if core._prefetched:
+            core.mark_prefetch_used(key)
+        cached = core.segment_cache.acquire(key)
+        if cached is not None:
+            data, content_type, _ = cached
+            core.metrics['segment_cache_hits'] += 1
+
+            def write_view(resp, start, end):
+                return resp.write(data.view(start, end))
+            try:
+                return await send_stored(request, url, 'cache', len(data), content_type, write_view)
+            finally:
+                spawn_task(release_when_flushed(request, data.release))
+
+        # Disk deposu: sendfile ile çekirdekten doğrudan soket'e
+        found = core.disk_store.lookup(key) if core.disk_store is not None else None
+        if found is not None:
+            try:
+                f = open(found[0], 'rb')
+            except OSError:
+                core.disk_store.forget(key)  # indekslendikten sonra silinmiş - upstream'e düş
+            else:
+                def write_file(resp, start, end):
+                    return asyncio.get_running_loop().sendfile(request.transport, f, start, end - start)
+                with f:
+                    return await send_stored(request, url, 'disk', found[1], 'video/mp2t', write_file)
+
+        client_range = request.headers.get('Range')
+        if request.method == 'HEAD':
+            if byterange:
+                _, (start, end) = core.split_segment_key(key)
+                return await send_stored(request, url, None, end - start, 'video/mp2t', None)
+            return await upstream_passthrough(request, url, h, 'HEAD', client_range)
+        if client_range and not byterange:
+            return await upstream_passthrough(request, url, h, 'GET', client_range)
+
+        fetch, leader = get_segment_fetch(key, h)
+        if leader:
+            core.metrics['segment_cache_misses'] += 1
+        else:
+            core.metrics['segment_coalesced'] += 1
+
+        try:
+            ready = await fetch.wait_headers()
+        except BaseException:
+            fetch.detach()  # istemci beklerken koptu
+            raise
+        if not ready:
+            fetch.detach()
+            if isinstance(fetch.error, admission.Overloaded):
+                return overloaded_response(fetch.error)
+            return _error(fetch.error or 'upstream timeout')
+    except admission.Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return _error(e)
+
+    source = 'upstream' if leader else 'coalesced'
+    start = time.time()
+    sent = 0
+    pace = core.ClientPace()
+    pieces = fetch.iter_chunks()
+    # Okuyucu kaydı (buffer referansı) akış bitene ve taşıma tamponu boşalana kadar tutulur
+    try:
+        resp = web.StreamResponse(status=fetch.status, headers=core.TS_HEADERS)
+        resp.content_type = fetch.content_type
+        if fetch.length:
+            resp.content_length = fetch.length  # chunked kodlama yok -> parçalar kopyasız yazılır
+        await resp.prepare(request)
+        with core.active_stream():
+            try:
+                async for piece in pieces:
+                    if not await write_client(request, pace, len(piece), resp.write(piece)):
+                        return resp  # istemci koptu ya da koparıldı
+                    sent += len(piece)
+            except core.SlowClientError:
+                if request.transport is not None:
+                    request.transport.abort()  # önbelleksiz aktarımın gerisinde kaldı
+                return resp
+        await resp.write_eof()
+    finally:
+        await pieces.aclose()
+        core.record_stream(url, sent, time.time() - start, source)
+        spawn_task(release_when_flushed(request, fetch.detach))
+    return resp
+
+
+async def send_stored(request, url, source, size, content_type, write_slice):
+    """Boyutu bilinen gövdeyi Range/HEAD planına göre gönder; write_slice(resp, start, end) dilimi yazar"""
+    status, headers, parts = core.range_plan(request.headers.get('Range'), size, content_type)
+    start = time.time()
+    sent = 0
+    pace = core.ClientPace()
+    resp = web.StreamResponse(status=status, headers=dict(core.TS_HEADERS, **headers))
+    await resp.prepare(request)
+    try:
+        if request.method != 'HEAD':
+            with core.active_stream():
+                for part in parts:
+                    if isinstance(part, bytes):
+                        await resp.write(part)
+                    elif await write_client(request, pace, part[1] - part[0], write_slice(resp, *part)):
+                        sent += part[1] - part[0]
+                    else:
+                        return resp  # istemci koptu ya da koparıldı
+        await resp.write_eof()
+    finally:
+        if sent:
+            core.record_stream(url, sent, time.time() - start, source)
+    return resp
+
+
+async def upstream_passthrough(request, url, headers, method, client_range=None):
+    """Önbellekte olmayan segment için HEAD/Range isteğini upstream'e ilet"""
+    if client_range:
+        headers = dict(headers, Range=client_range)
+    started = time.time()
+    # Slot, istemci akışı bitene (ya da yavaş istemci koparılana) kadar tutulur
+    slot = await admit(url)
+    try:
+        upstream = await open_upstream(url, headers, read=20, method=method)
+    except BaseException:
+        core.release_slot(slot)
+        raise
+    start = time.time()
+    sent = 0
+    pace = core.ClientPace()
+    try:
+        resp = web.StreamResponse(status=upstream.status, headers=core.passthrough_headers(upstream.headers))
+        await resp.prepare(request)
+        if method != 'HEAD':
+            with core.active_stream():
+                async for chunk in upstream.content.iter_chunked(core.SEGMENT_CHUNK_SIZE):
+                    if not await write_client(request, pace, len(chunk), resp.write(chunk)):
+                        return resp  # istemci koptu ya da koparıldı
+                    sent += len(chunk)
+        await resp.write_eof()
+        core.observe_upstream_total(url, started, sent)
+    finally:
+        upstream.release()
+        core.release_slot(slot)
+        if sent:
+            core.record_stream(url, sent, time.time() - start, 'range')
+    return resp
+
+
+class AsyncLiveChannel(core.LiveBroadcast):
+    """app.LiveChannel'ın async karşılığı - çekici event loop'ta görev olarak çalışır"""
+
+    def __init__(self, key, url, headers):
+        self._init_broadcast(key, url, headers)
+        self._changed = asyncio.Event()
+
+    def _wake(self):
+        # Tek seferlik event: bekleyenler uyanır, sonrakiler yenisini bekler
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def write(self, data, segment_start=False):
+        self._append(data, segment_start)
+        self._wake()
+
+    async def read(self, cursor, timeout=core.LIVE_READ_TIMEOUT):
+        if cursor >= self.next and not self.closed:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._read(cursor)
+
+    async def wait_ready(self, timeout=core.LIVE_START_TIMEOUT):
+        deadline = time.time() + timeout
+        while not self.next and not self.closed and time.time() < deadline:
+            try:
+                await asyncio.wait_for(self._changed.wait(), deadline - time.time())
+            except asyncio.TimeoutError:
+                pass
+        return self.next > 0
+
+    def close(self):
+        self.closed = True
+        self._wake()
+
+    async def run(self):
+        try:
+            while not self.expire():
+                target = core.PLAYLIST_DEFAULT_TTL
+                try:
+                    segments, target, headers = await self._playlist()
+                    for msn, key in self.pending(segments):
+                        await self._pull_segment(key, headers)
+                        self.next_msn = msn + 1
+                except Exception as e:
+                    if self.failed(e):
+                        return
+                await asyncio.sleep(self.poll_interval(target))
+        finally:
+            with core._live_lock:
+                self.unregister()
+            self.close()
+
+    async def _playlist(self):
+        result = await resolve(self.url, self.headers)
+        if not result["resolved_url"]:
+            raise ValueError("failed to resolve")
+        headers = result["headers"]
+        body = await get_cached_playlist(result["resolved_url"], headers)
+        variant = core.live_variant(body)
+        if variant is not None:
+            body = await get_cached_playlist(variant, headers)
+        return core.live_segments(body) + (headers,)
+
+    async def _pull_segment(self, key, headers):
+        core.metrics['live_segments'] += 1
+        cached = core.segment_cache.acquire(key)
+        if cached is not None:
+            data = cached[0]
+            try:
+                view = data.view()
+                for start in range(0, len(view), core.SEGMENT_CHUNK_SIZE):
+                    self.write(bytes(view[start:start + core.SEGMENT_CHUNK_SIZE]), start == 0)
+            finally:
+                data.release()
+            return
+        fetch, _ = get_segment_fetch(key, headers)
+        try:
+            if not await fetch.wait_headers() or fetch.status != 200:
+                raise ValueError(f"segment fetch failed: {fetch.error or fetch.status}")
+            first = True
+            async for piece in fetch.iter_chunks():
+                self.write(bytes(piece), first)
+                first = False
+        finally:
+            fetch.detach()
+
+
+def join_live_channel(url, headers):
+    """app.join_live_channel'ın async karşılığı (aynı kanal kaydı)"""
+    key = core.resolve_cache_key(url, headers)
+    with core._live_lock:
+        channel = core._live_channels.get(key)
+        if channel is None or channel.closed:
+            channel = core._live_channels[key] = AsyncLiveChannel(key, url, headers)
+            spawn_task(channel.run())
+        channel.join()
+    return channel
+
+
+async def proxy_live(request):
+    url = request.query.get('url', '').strip()
+    if not url:
+        return web.Response(text="No URL", status=400)
+
+    core.metrics['total_requests'] += 1
+    h = core.parse_headers(request.query, dict(core.DEFAULT_M3U_HEADERS))
+    url = core.normalize_stream_url(url)
+
+    channel = join_live_channel(url, h)
+    start = time.time()
+    sent = 0
+    pace = core.ClientPace()
+    try:
+        if not await channel.wait_ready():
+            return web.Response(text=f"Error: {channel.error or 'no data from upstream'}", status=502)
+        resp = web.StreamResponse(headers=core.LIVE_HEADERS)
+        resp.content_type = 'video/mp2t'
+        await resp.prepare(request)
+        cursor = channel.start_cursor()
+        with core.active_stream():
+            while True:
+                chunks, cursor = await channel.read(cursor)
+                if not chunks and channel.closed:
+                    break
+                for chunk in chunks:
+                    if not await write_client(request, pace, len(chunk), resp.write(chunk)):
+                        return resp  # istemci koptu ya da koparıldı
+                    sent += len(chunk)
+        await resp.write_eof()
+        return resp
+    finally:
+        channel.leave()
+        if sent:
+            core.record_stream(url, sent, time.time() - start, 'live')
+
+
+async def spool_body(request):
+    """POST gövdesini (multipart ise 'file' alanını) geçici dosyaya aktar - liste belleğe alınmaz"""
+    spool = tempfile.SpooledTemporaryFile(UPLOAD_SPOOL_BYTES)
+    if request.content_type == 'multipart/form-data':
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name == 'file':
+                while chunk := await part.read_chunk(core.BATCH_WRITE_BYTES):
+                    spool.write(chunk)
+                break
+    else:
+        async for chunk in request.content.iter_chunked(core.BATCH_WRITE_BYTES):
+            spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+async def proxy_playlist(request):
+    core.metrics['total_requests'] += 1
+    loop = asyncio.get_running_loop()
+    if request.method == 'POST':
+        lines = await spool_body(request)
+    else:
+        url = request.query.get('url', '').strip()
+        if not url:
+            return web.Response(text="No URL", status=400)
+        h = core.parse_headers(request.query, {'User-Agent': 'Mozilla/5.0'})
+        try:
+            lines = await loop.run_in_executor(None, core.open_m3u, url, h)
+        except (core.requests.RequestException, ValueError) as e:
+            return web.Response(text=f"Error: {e}", status=502)
+
+    job = core.BatchJob('m3u')
+    base = core.playlist_base(request.query.get('base'), f"{request.scheme}://{request.host}/")
+    # Dönüştürücü senkron (requests + havuz) - parçalar thread'de üretilir
+    chunks = core.convert_m3u(lines, base, job, request.query.get('resolve') == '1')
+    resp = web.StreamResponse(headers={'X-Batch-Job': job.id})
+    resp.content_type = 'audio/x-mpegurl'
+    try:
+        await resp.prepare(request)
+        while (chunk := await loop.run_in_executor(None, next, chunks, None)) is not None:
+            await resp.write(chunk.encode())
+        await resp.write_eof()
+    except ConnectionError:
+        pass  # istemci koptu
+    finally:
+        try:
+            chunks.close()
+        except ValueError:
+            pass  # iptal anında thread'de çalışıyor - bitince çöp toplayıcı kapatır
+    return resp
+
+
+async def resolve_batch_api(request):
+    try:
+        payload = await request.json()
+    except ValueError:
+        payload = None
+    try:
+        items = core.batch_items(payload)
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+    core.metrics['total_requests'] += 1
+    job = core.BatchJob('resolve', len(items))
+    if request.query.get('wait') == '0':
+        core.spawn(core.resolve_batch, items, job)
+        return web.json_response(job.progress(), status=202)
+    await asyncio.get_running_loop().run_in_executor(None, core.resolve_batch, items, job)
+    return web.json_response(dict(job.progress(), results=job.results))
+
+
+async def batch_progress(request):
+    payload = core.batch_job_payload(request.match_info.get('job_id'))
+    if payload is None:
+        return web.json_response({"error": "unknown job"}, status=404)
+    return web.json_response(payload)
+
+
+async def proxy_key(request):
+    url = request.query.get('url', '').strip()
+    if not url:
+        return web.Response(text="No URL", status=400)
+
+    h = core.parse_headers(request.query)
+    try:
+        cache_key = core.resolve_cache_key(url, h)
+        with tracing.span('key') as span:
+            await shared_fill(core._key_cache, cache_key)
+            found = core.cached_key(cache_key)
+            if found is None:
+                found, shared = await _key_flight.do(cache_key, _fetch_key, cache_key, url, h)
+                core.metrics['key_coalesced' if shared else 'key_cache_misses'] += 1
+                span.set(cache='coalesced' if shared else 'miss')
+            else:
+                span.set(cache='hit')
+        status, headers, pieces = core.key_response(*found, request.headers.get('Range'))
+        if request.method == 'HEAD':
+            return web.Response(status=status, headers=headers)
+        return web.Response(body=b''.join(pieces), status=status, headers=headers)
+    except Exception as e:
+        return _error(e)
+
+
+async def _fetch_key(cache_key, url, headers):
+    started = time.time()
+    resp = await open_upstream(url, headers, read=5)
+    try:
+        data = await resp.read()
+    finally:
+        resp.release()
+    core.observe_upstream_total(url, started, len(data))
+    return core.store_key(cache_key, resp.status, data, resp.headers.get('Cache-Control'))
+
+
+async def index(request):
+    return web.Response(text=core.HTML_TEMPLATE, content_type='text/html')
+
+
+async def stats(request):
+    # launcher.py altında diğer worker'ların istatistikleri daemon'dan toplanır - olay döngüsü dışında
+    payload = await asyncio.get_running_loop().run_in_executor(None, core.cluster_stats)
+    payload["server_mode"] = "asyncio"
+    return web.json_response(payload)
+
+
+async def health(request):
+    payload, status = core.health_status()
+    return web.json_response(payload, status=status)
+
+
+async def clear_cache(request):
+    core.clear_caches()
+    return web.json_response({"status": "cache cleared"})
+
+
+@web.middleware
+async def request_timer(request, handler):
+    request['streamflow.start'] = time.time()
+    if request.path.startswith(core.TRACE_SKIP_PATHS):
+        return await handler(request)
+    trace = core.tracer.begin(request.method, request.path_qs)
+    if trace is None:
+        return await handler(request)
+    resource = request.match_info.route.resource
+    trace.route = resource.canonical if resource is not None else 'other'
+    # Akış yanıtlarında handler tüm gövdeyi yazdıktan sonra döner - iz burada biter
+    # (web.Response başlıkları handler'dan sonra hazırlanır: headers_ms = ms)
+    status, length = 500, None
+    try:
+        response = await handler(request)
+        status, length = response.status, response.content_length
+        if trace.headers_at is None:
+            trace.headers_at = time.perf_counter()
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    except asyncio.CancelledError:
+        status = 499  # istemci koptu
+        raise
+    finally:
+        core.tracer.finish(trace, status, length)
+
+
+@web.middleware
+async def header_token_errors(request, handler):
+    """app.invalid_header_token'ın karşılığı: geçersiz hs token'ı -> 400"""
+    try:
+        return await handler(request)
+    except hls_rewriter.InvalidHeaderToken as e:
+        logger.warning(f"Rejected header set token: {e}")
+        return web.Response(text=f"Invalid header token: {e}", status=400)
+
+
+async def _observe_request(request, response):
+    """Yanıt başlıkları gönderilirken süreyi kaydet (Flask after_request ile aynı ölçü)"""
+    start = request.get('streamflow.start')
+    if start is not None:
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else 'other'
+        core.REQUEST_SECONDS.observe((route, response.status), time.time() - start)
+        trace = tracing.current()
+        if trace is not None:
+            trace.headers_at = time.perf_counter()
+
+
+async def prometheus_metrics(request):
+    return web.Response(body=core.registry.render().encode(),
+                        headers={'Content-Type': core.telemetry.CONTENT_TYPE})
+
+
+async def debug_traces(request):
+    denied = core.debug_denied(request.query, request.headers)
+    if denied is not None:
+        return web.json_response({"error": denied[1]}, status=denied[0])
+    try:
+        return web.json_response(core.traces_payload(request.query))
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+
+
+async def debug_profile(request):
+    denied = core.debug_denied(request.query, request.headers)
+    if denied is not None:
+        return web.json_response({"error": denied[1]}, status=denied[0])
+    try:
+        params = core.profile_params(request.query)
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+    wait = core.profile_retry_after()
+    if wait:
+        return web.json_response({"error": "profile rate limited"}, status=429,
+                                 headers={'Retry-After': str(int(wait) + 1)})
+    result = await asyncio.get_running_loop().run_in_executor(None, core.run_profile, *params)
+    if result is None:
+        return web.json_response({"error": "profile already running"}, status=409)
+    text, samples = result
+    return web.Response(text=text, content_type='text/plain', headers={'X-Profile-Samples': str(samples)})
+
+
+async def _on_startup(application):
+    global _http, _loop
+    _loop = asyncio.get_running_loop()
+    _http = ClientSession(
+        connector=TCPConnector(limit=AIO_CONNECTION_LIMIT, use_dns_cache=core.DNS_CACHE_TTL > 0,
+                               ttl_dns_cache=core.DNS_CACHE_TTL or None),
+        auto_decompress=True,
+        trace_configs=[upstream_trace_config()]
+    )
+    core.prewarm_connections = schedule_prewarm
+    core.spawn_prefetch = spawn_prefetch
+    core.on_event_loop = on_event_loop
+    core.shared_write = shared_write
+
+
+async def _on_cleanup(application):
+    await _http.close()
+
+
+def make_app():
+    application = web.Application(middlewares=[request_timer, header_token_errors])
+    application.on_response_prepare.append(_observe_request)
+    application.router.add_get('/proxy/m3u', proxy_m3u)
+    application.router.add_get('/proxy/resolve', proxy_resolve)
+    application.router.add_get('/proxy/ts', proxy_ts)
+    application.router.add_get('/proxy/key', proxy_key)
+    application.router.add_get('/proxy/live', proxy_live)
+    application.router.add_get('/proxy/playlist', proxy_playlist)
+    application.router.add_post('/proxy/playlist', proxy_playlist)
+    application.router.add_post('/api/resolve/batch', resolve_batch_api)
+    application.router.add_get('/api/batch', batch_progress)
+    application.router.add_get('/api/batch/{job_id}', batch_progress)
+    application.router.add_get('/', index)
+    application.router.add_get('/api/stats', stats)
+    application.router.add_get('/health', health)
+    application.router.add_get('/api/cache/clear', clear_cache)
+    application.router.add_get('/metrics', prometheus_metrics)
+    application.router.add_get('/api/debug/traces', debug_traces)
+    application.router.add_get('/api/debug/profile', debug_profile)
+    application.on_startup.append(_on_startup)
+    application.on_cleanup.append(_on_cleanup)
+    return application
+
+
+def main(port=None, sock=None):
+    """sock: launcher.py'den devralınan dinleme soketi (SIGTERM'de açık istekler GRACEFUL_TIMEOUT kadar tamamlanır)"""
+    port = port or int(os.environ.get('PORT', '7860'))
+    logger.info("StreamFlow Turbo v3.5 starting (asyncio)...")
+    if core.shared is not None:
+        threading.Thread(target=core.publish_stats_forever, daemon=True).start()
+    core.start_snapshots()
+    if sock is not None:
+        web.run_app(make_app(), sock=sock, shutdown_timeout=core.GRACEFUL_TIMEOUT, access_log=None, print=None)
+    else:
+        web.run_app(make_app(), host="0.0.0.0", port=port, shutdown_timeout=core.GRACEFUL_TIMEOUT,
+                    access_log=None, print=None)
+    core.stop_snapshots()
+    if core.shared is not None:
+        core.shared.publish(None)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,50 @@
-from gevent import monkey
-monkey.patch_all()
+import os
+
+# Sunucu modu: gevent (varsayılan, Flask) veya asyncio (aio_server.py)
+SERVER_MODE = os.environ.get('SERVER_MODE', 'gevent')
+if SERVER_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
 
-from flask import Flask, request, Response, render_template_string, jsonify
+from flask import Flask, request, Response, render_template_string, jsonify, stream_with_context
 import requests
-from urllib.parse import urlparse, urljoin, quote, unquote
+from urllib.parse import urlparse, quote, unquote, parse_qs
 import re
-import os
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+from urllib3.util.wait import wait_for_read
 import time
 import logging
 from functools import lru_cache
+from contextlib import contextmanager
 import hashlib
+import hmac
+import itertools
+import errno
+import gzip
+import signal
+import socket
+import ssl
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import gevent
+import hls_rewriter
+import segment_store
+import shared_cache
+import telemetry
+import admission
+import cache_snapshot
+import tracing
+
+try:
+    import brotli  # opsiyonel: playlist'ler için br kodlaması
+except ImportError:
+    brotli = None
 
 # Minimal logging
 logging.basicConfig(level=logging.WARNING)
@@ -25,17 +58,313 @@ metrics = {
     'total_requests': 0,
     'active_streams': 0,
     'start_time': time.time(),
-    'cache_hits': 0
+    'cache_hits': 0,
+    'resolve_misses': 0,
+    'resolve_coalesced': 0,
+    'resolve_stale_served': 0,
+    'resolve_refreshes': 0,
+    'playlist_cache_hits': 0,
+    'playlist_cache_misses': 0,
+    'playlist_coalesced': 0,
+    'segment_cache_hits': 0,
+    'segment_cache_misses': 0,
+    'segment_coalesced': 0,
+    'segment_bytes_saved': 0,
+    'relay_bytes': 0,
+    'relay_streams': 0,
+    'prefetch_started': 0,
+    'prefetch_skipped': 0,
+    'prefetch_hits': 0,
+    'prefetch_bytes': 0,
+    'key_cache_hits': 0,
+    'key_cache_misses': 0,
+    'key_coalesced': 0,
+    'key_errors_cached': 0,
+    'llhls_blocked': 0,
+    'llhls_immediate': 0,
+    'llhls_upstream': 0,
+    'llhls_timeouts': 0,
+    'llhls_preloads': 0,
+    'slow_clients': 0,
+    'live_segments': 0,
+    'live_bytes': 0,
+    'live_skips': 0,
+    'live_errors': 0,
+    'batch_entries': 0,
+    'batch_failed': 0,
+    'playlist_not_modified': 0,
+    'playlist_compressed': 0,
+    'playlist_compressions': 0,
+    'playlist_bytes_saved': 0
 }
 
-# PERFORMANS İYİLEŞTİRMESİ: Gelişmiş session havuzu
+# PERFORMANS İYİLEŞTİRMESİ: Prometheus metrikleri (/metrics) - kayıt maliyeti dict araması + bisect
+registry = telemetry.Registry()
+REQUEST_SECONDS = registry.histogram(
+    'streamflow_http_request_duration_seconds',
+    'Yanıt başlıkları gönderilene kadar geçen süre (route, status)', ('route', 'status'))
+UPSTREAM_TTFB = registry.histogram(
+    'streamflow_upstream_ttfb_seconds', 'Upstream yanıt başlıklarına kadar geçen süre', ('host',))
+UPSTREAM_TOTAL = registry.histogram(
+    'streamflow_upstream_total_seconds', 'Upstream isteğinin gövde dahil toplam süresi', ('host',))
+RESOLVE_STAGE = registry.histogram(
+    'streamflow_resolve_stage_seconds', 'resolve_fast aşama süreleri (page, iframe, auth, server_lookup)', ('stage',))
+RELAY_BYTES = registry.counter(
+    'streamflow_relay_bytes_total', 'İstemcilere aktarılan segment byte sayısı', ('source',))
+RELAY_SECONDS = registry.histogram(
+    'streamflow_relay_stream_seconds', 'Segment akışı süresi', ('source',))
+
+# PERFORMANS İYİLEŞTİRMESİ: İstek izleri (span'ler) - son TRACE_BUFFER_SIZE iz bellekte, /api/debug/traces
+TRACE_BUFFER_SIZE = int(os.environ.get('TRACE_BUFFER_SIZE', '500'))  # 0 = izleme kapalı
+TRACE_SLOW_MS = float(os.environ.get('TRACE_SLOW_MS', '1000'))  # ?slow=1 eşiği
+TRACE_SKIP_PATHS = ('/health', '/metrics', '/api/debug/')
+PROFILE_MAX_SECONDS = float(os.environ.get('PROFILE_MAX_SECONDS', '60'))
+PROFILE_MIN_INTERVAL = float(os.environ.get('PROFILE_MIN_INTERVAL', '60'))  # bir profilin bitişinden sonrakine
+DEBUG_TOKEN = os.environ.get('DEBUG_TOKEN', '')  # boş = /api/debug/* kapalı (404); ?token= ya da X-Debug-Token
+tracer = tracing.Recorder(TRACE_BUFFER_SIZE, TRACE_SLOW_MS)
+
+@contextmanager
+def timed(family, labels):
+    """Blok süresini histograma yaz"""
+    start = time.time()
+    try:
+        yield
+    finally:
+        family.observe(labels, time.time() - start)
+
+@contextmanager
+def active_stream():
+    """Eşzamanlı akış sayacı - her çıkış yolunda azaltılır"""
+    metrics['active_streams'] += 1
+    try:
+        yield
+    finally:
+        metrics['active_streams'] -= 1
+
+def observe_upstream_total(url, started, nbytes=None):
+    """Gövde tamamen okundu: toplam süre histogramı + aktif upstream span'inin transfer süresi"""
+    UPSTREAM_TOTAL.observe((urlparse(url).hostname,), time.time() - started)
+    tracing.upstream_done(nbytes)
+
+def spawn(fn, *args):
+    """Arka plan işi başlat - gevent modunda greenlet, asyncio modunda daemon thread"""
+    if SERVER_MODE == 'gevent':
+        return gevent.spawn(fn, *args)
+    t = threading.Thread(target=fn, args=args, daemon=True)
+    t.start()
+    return t
+
+def parse_host_map(value):
+    """"host1=3,host2=0" -> {'host1': 3, 'host2': 0}"""
+    return {
+        host.strip(): int(n)
+        for host, _, n in (item.partition('=') for item in value.split(','))
+        if host.strip() and n.strip().isdigit()
+    }
+
+# PERFORMANS İYİLEŞTİRMESİ: Upstream host başına bağlantı havuzu + circuit breaker
+UPSTREAM_POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', '32'))  # host başına
+UPSTREAM_POOL_SIZES = parse_host_map(os.environ.get('UPSTREAM_POOL_SIZES', ''))  # "cdn.example.com=64"
+UPSTREAM_MAX_HOSTS = int(os.environ.get('UPSTREAM_MAX_HOSTS', '200'))
+BREAKER_FAILURES = int(os.environ.get('BREAKER_FAILURES', '5'))  # art arda hata -> devre açılır
+BREAKER_COOLDOWN = float(os.environ.get('BREAKER_COOLDOWN', '10'))  # saniye
+HEALTH_ALPHA = 0.2  # EWMA ağırlığı
+HEALTH_LATENCY_REF = 1.0  # saniye - skor hesabında referans gecikme
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Host devre dışı - upstream'e gitmeden hızlı hata"""
+
+class HostHealth:
+    """Host başına gecikme/hata EWMA'sı ve circuit breaker durumu"""
+    __slots__ = ('host', 'latency', 'error_rate', 'requests', 'failures',
+                 'consecutive', 'rejected', 'state', 'opened_at', 'probing')
+
+    def __init__(self, host):
+        self.host = host
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive = 0
+        self.rejected = 0
+        self.state = 'closed'  # closed | open | half-open
+        self.opened_at = 0.0
+        self.probing = False
+
+    @property
+    def score(self):
+        """0-100 sağlık skoru (hata oranı ve gecikmeden)"""
+        if self.state == 'open':
+            return 0
+        return round(100 * (1 - self.error_rate) / (1 + self.latency / HEALTH_LATENCY_REF))
+
+    def allow(self):
+        if self.state == 'closed':
+            return True
+        if self.state == 'open' and time.time() - self.opened_at >= BREAKER_COOLDOWN:
+            self.state = 'half-open'
+        if self.state == 'half-open' and not self.probing:
+            self.probing = True  # tek deneme isteği
+            return True
+        self.rejected += 1
+        return False
+
+    def record(self, elapsed, ok):
+        self.requests += 1
+        if self.requests == 1:
+            self.latency = elapsed
+        else:
+            self.latency += HEALTH_ALPHA * (elapsed - self.latency)
+        self.error_rate += HEALTH_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+        self.probing = False
+        if ok:
+            self.consecutive = 0
+            self.state = 'closed'
+            return
+        self.failures += 1
+        self.consecutive += 1
+        if self.state == 'half-open' or self.consecutive >= BREAKER_FAILURES:
+            if self.state != 'open':
+                logger.warning(f"Circuit open: {self.host}")
+            self.state = 'open'
+            self.opened_at = time.time()
+
+    def to_dict(self):
+        return {
+            "state": self.state,
+            "score": self.score,
+            "latency_ms": round(self.latency * 1000, 1),
+            "error_rate": round(self.error_rate, 3),
+            "requests": self.requests,
+            "failures": self.failures,
+            "rejected": self.rejected
+        }
+
+_host_health = OrderedDict()  # host -> HostHealth (LRU sınırlı)
+
+def host_health(host):
+    health = _host_health.get(host)
+    if health is None:
+        health = _host_health[host] = HostHealth(host)
+        while len(_host_health) > UPSTREAM_MAX_HOSTS:
+            _host_health.popitem(last=False)
+    else:
+        _host_health.move_to_end(host)
+    return health
+
+class TracedConnection:
+    """Yeni bağlantıda DNS, TCP ve TLS sürelerini aktif upstream span'ine yazar.
+    Çözümleme burada yapılır (resolve_host: DNS önbelleği), adresler sırayla denenir (urllib3 create_connection gibi)"""
+
+    def _new_conn(self):
+        host = self._dns_host
+        start = time.perf_counter()
+        try:
+            addresses = resolve_host(host, self.port)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        resolved = time.perf_counter()
+        tracing.upstream_timing('dns', resolved - start)
+        try:
+            for i, address in enumerate(addresses):
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except (ConnectTimeoutError, NewConnectionError, OSError):
+                    # zaman aşımı, bağlantı reddi, ulaşılamayan ağ - sıradaki adres denenir
+                    if i == len(addresses) - 1:
+                        forget_host(host, self.port)
+                        raise
+        finally:
+            self._dns_host = host
+            self._opened = time.perf_counter() - start
+            tracing.upstream_timing('connect', time.perf_counter() - resolved)
+
+class TracedHTTPConnection(TracedConnection, HTTPConnection):
+    pass
+
+class TracedHTTPSConnection(TracedConnection, HTTPSConnection):
+    def connect(self):
+        self._opened = 0
+        start = time.perf_counter()
+        super().connect()
+        if self._opened:
+            tracing.upstream_timing('tls', time.perf_counter() - start - self._opened)
+
+class TracedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TracedHTTPConnection
+
+class TracedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TracedHTTPSConnection
+
+class HostPoolAdapter(HTTPAdapter):
+    """Host başına boyutlandırılmış havuz + circuit breaker + sağlık ölçümü"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TracedHTTPConnectionPool, 'https': TracedHTTPSConnectionPool}
+
+    def get_connection(self, url, proxies=None):
+        if proxies:
+            return super().get_connection(url, proxies)
+        host = urlparse(url).hostname
+        size = UPSTREAM_POOL_SIZES.get(host, UPSTREAM_POOL_SIZE)
+        return self.poolmanager.connection_from_url(url, pool_kwargs={'maxsize': size})
+
+    def send(self, request, **kwargs):
+        health = host_health(urlparse(request.url).hostname)
+        if not health.allow():
+            raise CircuitOpenError(f"Circuit open for {health.host}", request=request)
+        start = time.time()
+        with tracing.upstream(request.method, health.host) as span:
+            try:
+                resp = super().send(request, **kwargs)
+            except Exception:
+                health.record(time.time() - start, False)
+                raise
+            # Adapter başlıklar gelince döner: geçen süre TTFB'dir (gövde henüz okunmadı)
+            elapsed = time.time() - start
+            span.set(status=resp.status_code)
+        health.record(elapsed, resp.status_code < 500 and resp.status_code != 429)
+        UPSTREAM_TTFB.observe((health.host,), elapsed)
+        return resp
+
+    def pool_stats(self):
+        """Host başına havuz durumu"""
+        stats = {}
+        pools = self.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            # Kuyruk boş slotlar için None tutar - sadece gerçek bağlantıları say
+            idle = sum(1 for conn in pool.pool.queue if conn is not None) if pool.pool is not None else 0
+            stats[key.key_host] = {
+                "maxsize": key.key_maxsize,
+                "idle": idle,
+                "opened": pool.num_connections,
+                "requests": pool.num_requests
+            }
+        return stats
+
+class UpstreamSession(requests.Session):
+    """Gövdesi hemen okunan (stream=False) isteklerde toplam süreyi de ölçen session"""
+
+    def send(self, request, **kwargs):
+        start = time.time()
+        resp = super().send(request, **kwargs)
+        if not kwargs.get('stream'):
+            observe_upstream_total(request.url, start, len(resp.content))
+        return resp
+
 _session_pool = None
+_session_adapter = None
 
 def get_session():
     """Optimize edilmiş session - daha agresif ayarlar"""
-    global _session_pool
+    global _session_pool, _session_adapter
     if _session_pool is None:
-        _session_pool = requests.Session()
+        _session_pool = UpstreamSession()
         
         # Retry stratejisi - daha hızlı
         retry = Retry(
@@ -45,18 +374,28 @@ def get_session():
             raise_on_status=False
         )
         
-        adapter = HTTPAdapter(
+        _session_adapter = HostPoolAdapter(
             max_retries=retry,
-            pool_connections=50,  # 20'den 50'ye artırıldı
-            pool_maxsize=100,  # 50'den 100'e artırıldı
+            pool_connections=UPSTREAM_MAX_HOSTS,  # host havuzu sayısı
+            pool_maxsize=UPSTREAM_POOL_SIZE,  # host başına (UPSTREAM_POOL_SIZES ile ezilebilir)
             pool_block=False
         )
         
-        _session_pool.mount('http://', adapter)
-        _session_pool.mount('https://', adapter)
+        _session_pool.mount('http://', _session_adapter)
+        _session_pool.mount('https://', _session_adapter)
     
     return _session_pool
 
+def upstream_stats():
+    """Host başına havuz + breaker durumu (/api/stats için)"""
+    pools = _session_adapter.pool_stats() if _session_adapter is not None else {}
+    hosts = {}
+    for host, health in list(_host_health.items()):
+        hosts[host] = health.to_dict()
+        if host in pools:
+            hosts[host]["pool"] = pools[host]
+    return hosts
+
 # Minimal HTML Template
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
@@ -382,36 +721,438 @@ def get_url_hash(url):
     """URL için hash oluştur"""
     return hashlib.md5(url.encode()).hexdigest()
 
-# PERFORMANS İYİLEŞTİRMESİ: Resolve önbelleği (5 dakika)
-_resolve_cache = {}
+# PERFORMANS İYİLEŞTİRMESİ: Anahtar başına tek çalışma (single-flight)
+class SingleFlight:
+    """Aynı anahtar için tek çalışma - diğer çağıranlar sonucunu bekler"""
+
+    class _Call:
+        __slots__ = ('event', 'result', 'error')
+
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args):
+        """fn(*args) sonucunu döndürür: (result, shared). shared=True ise başka çağrının sonucu"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+# PERFORMANS İYİLEŞTİRMESİ: Sabit kapasiteli TTL + LRU önbellek
+class TTLCache:
+    """Sabit kapasiteli TTL + LRU önbellek; süresi dolan kayıtlar stale_ttl boyunca tutulur"""
+
+    class Entry:
+        __slots__ = ('value', 'stored', 'ttl', 'hits', 'refreshing')
+
+        def __init__(self, value, stored, ttl):
+            self.value = value
+            self.stored = stored
+            self.ttl = ttl
+            self.hits = 0
+            self.refreshing = False
+
+    def __init__(self, maxsize, ttl, stale_ttl=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.evictions = 0
+        self.changes = 0  # snapshot yazıcısı değişiklik yoksa yazmayı atlar
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get_entry(self, key):
+        """Kaydı döndür (stale olabilir); stale penceresi de geçtiyse sil"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry.stored >= entry.ttl + self.stale_ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def get(self, key):
+        """Sadece taze değeri döndür"""
+        entry = self.get_entry(key)
+        if entry is None or time.time() - entry.stored >= entry.ttl:
+            return None
+        return entry.value
+
+    def set(self, key, value, ttl=None):
+        """Kaydet; ttl verilmezse varsayılan TTL kullanılır"""
+        self._insert(key, self.Entry(value, time.time(), self.ttl if ttl is None else ttl))
+
+    def _insert(self, key, entry):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = entry
+            self.changes += 1
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            self.changes += 1
+        return default if entry is None else entry.value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.changes += 1
+
+    def snapshot(self):
+        """LRU sırasıyla [(key, value, stored, ttl, keep_until, hits)] (cache_snapshot biçimi)"""
+        with self._lock:
+            return [(key, e.value, e.stored, e.ttl, e.stored + e.ttl + self.stale_ttl, e.hits)
+                    for key, e in self._data.items()]
+
+    def load(self, entries):
+        """snapshot() kayıtlarını toplu ekle (tek kilit, süresi dolanlar atlanır); eklenen sayı"""
+        now = time.time()
+        added = 0
+        with self._lock:
+            for key, value, stored, ttl, _, hits in entries[-self.maxsize:]:
+                if now - stored >= ttl + self.stale_ttl:
+                    continue
+                entry = self.Entry(value, stored, ttl)
+                entry.hits = hits
+                self._data.pop(key, None)
+                self._data[key] = entry
+                added += 1
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return added
+
+# PERFORMANS İYİLEŞTİRMESİ: Çok süreçli modda (launcher.py) önbellekler worker'lar arasında paylaşılır
+SHARED_CACHE_SOCKET = os.environ.get('SHARED_CACHE_SOCKET', '')  # launcher.py tarafından verilir
+WORKER_ID = os.environ.get('WORKER_ID', '')
+STATS_PUBLISH_INTERVAL = 1  # saniye
+SHARED_CACHE_TIMEOUT = float(os.environ.get('SHARED_CACHE_TIMEOUT_MS', '100')) / 1000  # daemon yanıtı, sonra miss
+SHARED_CACHE_CONNECTIONS = int(os.environ.get('SHARED_CACHE_CONNECTIONS', '8'))  # worker başına
+shared = shared_cache.CacheClient(
+    SHARED_CACHE_SOCKET, f"{WORKER_ID}/{os.getpid()}", SHARED_CACHE_TIMEOUT, SHARED_CACHE_CONNECTIONS
+) if SHARED_CACHE_SOCKET else None
+
+def on_event_loop():
+    """asyncio modunda olay döngüsü thread'inde mi (aio_server değiştirir) - daemon orada beklenmez"""
+    return False
+
+def shared_write(fn, *args):
+    """Yanıt beklenmeyen daemon çağrısı (asyncio modu olay döngüsü dışındaki bir thread'e taşır)"""
+    fn(*args)
+
+class SharedTTLCache(TTLCache):
+    """İki seviyeli TTLCache: yerel kayıtlar + worker'lar arası paylaşılan daemon (shared_cache)"""
+
+    def __init__(self, client, namespace, maxsize, ttl, stale_ttl=0):
+        super().__init__(maxsize, ttl, stale_ttl)
+        self.client = client
+        self.namespace = namespace
+
+    def fresh(self, key):
+        """Yerelde taze kayıt var mı (daemon'a sorulmaz)"""
+        entry = super().get_entry(key)
+        return entry is not None and time.time() - entry.stored < entry.ttl
+
+    def get_entry(self, key):
+        """Yerelde taze kayıt yoksa daemon'a sor; daha yeni kayıt yerele alınır.
+        Olay döngüsünde sadece yerel kayıt: aio_server kaydı daemon'dan ayrı thread'de önceden çeker"""
+        entry = super().get_entry(key)
+        if entry is not None and time.time() - entry.stored < entry.ttl:
+            return entry
+        if on_event_loop():
+            return entry
+        found = self.client.get(self.namespace, key)
+        if found is None or (entry is not None and found[1] <= entry.stored):
+            return entry
+        entry = self.Entry(*found)
+        self._insert(key, entry)
+        return entry
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        entry = self.Entry(value, time.time(), ttl)
+        self._insert(key, entry)
+        shared_write(self.client.set, self.namespace, key, value, entry.stored, ttl, ttl + self.stale_ttl)
+
+    def pop(self, key, default=None):
+        shared_write(self.client.delete, self.namespace, key)
+        return super().pop(key, default)
+
+    def clear(self):
+        super().clear()
+        shared_write(self.client.clear, self.namespace)
+
+caches = {}  # namespace -> make_cache() önbelleği (snapshot'lar için)
+
+def make_cache(namespace, maxsize, ttl, stale_ttl=0):
+    """Tek süreçte TTLCache, launcher.py altında paylaşılan SharedTTLCache"""
+    if shared is None:
+        cache = TTLCache(maxsize, ttl, stale_ttl)
+    else:
+        cache = SharedTTLCache(shared, namespace, maxsize, ttl, stale_ttl)
+    caches[namespace] = cache
+    return cache
+
+# PERFORMANS İYİLEŞTİRMESİ: Resolve önbelleği (5 dakika, LRU, refresh-ahead)
 _cache_ttl = 300  # 5 dakika
+RESOLVE_CACHE_SIZE = int(os.environ.get('RESOLVE_CACHE_SIZE', '1000'))
+RESOLVE_STALE_TTL = int(os.environ.get('RESOLVE_STALE_TTL', '120'))  # stale servis penceresi
+RESOLVE_REFRESH_AHEAD = 0.8  # TTL'nin %80'inden sonra popüler kayıtları arka planda yenile
+RESOLVE_REFRESH_MIN_HITS = 2
+_resolve_cache = make_cache('resolve', RESOLVE_CACHE_SIZE, _cache_ttl, RESOLVE_STALE_TTL)
+_resolve_flight = SingleFlight()
+
+def resolve_cache_key(url, headers=None):
+    """URL + çözümlemeyi etkileyen header'lar için önbellek anahtarı"""
+    if not headers:
+        return get_url_hash(url)
+    hs = "\n".join(f"{k.lower()}:{v}" for k, v in sorted(headers.items()))
+    return get_url_hash(f"{url}\n{hs}")
 
 def get_cached_resolve(url, headers=None):
     """Önbellekli URL çözümleme"""
-    cache_key = get_url_hash(url)
-    now = time.time()
+    cache_key = resolve_cache_key(url, headers)
     
-    # Cache kontrolü
-    if cache_key in _resolve_cache:
-        cached_data, timestamp = _resolve_cache[cache_key]
-        if now - timestamp < _cache_ttl:
+    with tracing.span('resolve') as span:
+        # Cache kontrolü
+        entry = _resolve_cache.get_entry(cache_key)
+        if entry is not None:
+            entry.hits += 1
+            age = time.time() - entry.stored
             metrics['cache_hits'] += 1
-            return cached_data
-    
-    # Yeni çözümleme
+            span.set(cache='hit')
+            if age >= entry.ttl:
+                # Stale-while-revalidate: eskiyi ver, arka planda yenile
+                metrics['resolve_stale_served'] += 1
+                span.set(cache='stale')
+                _refresh_resolve(cache_key, entry, url, headers)
+            elif age >= entry.ttl * RESOLVE_REFRESH_AHEAD and entry.hits >= RESOLVE_REFRESH_MIN_HITS:
+                _refresh_resolve(cache_key, entry, url, headers)
+            return entry.value
+
+        # Yeni çözümleme - aynı anahtar için sadece bir resolve_fast çalışır
+        result, shared = _resolve_flight.do(cache_key, _resolve_and_store, cache_key, url, headers)
+        if shared:
+            metrics['resolve_coalesced'] += 1
+        else:
+            metrics['resolve_misses'] += 1
+        span.set(cache='coalesced' if shared else 'miss')
+        return result
+
+def _refresh_resolve(cache_key, entry, url, headers):
+    """Kaydı arka planda yenile (kayıt başına tek yenileme)"""
+    if entry.refreshing:
+        return
+    entry.refreshing = True
+    metrics['resolve_refreshes'] += 1
+    spawn(_resolve_flight.do, cache_key, _resolve_and_store, cache_key, url,
+                 dict(headers) if headers else None)
+
+def _resolve_and_store(cache_key, url, headers):
+    """resolve_fast çalıştır ve sonucu önbelleğe yaz"""
+    if _resolve_sources is not None:
+        # Snapshot'tan açılınca yenileyebilmek için girdi (resolve_fast headers'ı değiştirir)
+        _resolve_sources.set(cache_key, (url, dict(headers) if headers else None))
     result = resolve_fast(url, headers)
-    _resolve_cache[cache_key] = (result, now)
-    
-    # Cache temizleme (100'den fazla kayıt varsa)
-    if len(_resolve_cache) > 100:
-        old_keys = [k for k, (_, ts) in _resolve_cache.items() if now - ts > _cache_ttl]
-        for k in old_keys:
-            del _resolve_cache[k]
-    
+    _resolve_cache.set(cache_key, result)
+    if result["resolved_url"] != url:
+        prewarm(result["resolved_url"])  # başarısız çözümleme sayfa URL'sini döndürür - ısıtılacak yayın yok
     return result
 
+# PERFORMANS İYİLEŞTİRMESİ: Yeni çözümlenen yayın host'una önceden bağlantı + süreç içi DNS önbelleği
+# İzleyicinin ilk playlist/segment isteği DNS + TCP + TLS kurulumunu beklemez; havuzda sıcak bağlantı bulur
+PREWARM_CONNECTIONS = int(os.environ.get('PREWARM_CONNECTIONS', '2'))  # host başına, 0 = kapalı
+PREWARM_INTERVAL = float(os.environ.get('PREWARM_INTERVAL', '30'))  # aynı host en fazla bu sıklıkla ısıtılır
+PREWARM_CONNECT_TIMEOUT = 3  # saniye
+PREWARM_TICKET_WAIT = 1  # saniye - TLS 1.3 session ticket'ı için azami bekleme
+# getaddrinfo TTL döndürmez - kayıtlar sabit süre tutulur, bağlanılamayan adres hemen unutulur
+DNS_CACHE_TTL = float(os.environ.get('DNS_CACHE_TTL', '300'))  # saniye, 0 = kapalı
+_dns_cache = TTLCache(UPSTREAM_MAX_HOSTS, DNS_CACHE_TTL)
+_dns_flight = SingleFlight()
+_dns_counts = {'hits': 0, 'misses': 0, 'coalesced': 0, 'forgotten': 0}
+_prewarmed = TTLCache(UPSTREAM_MAX_HOSTS, PREWARM_INTERVAL)  # (scheme, netloc) -> son ısıtma
+_prewarm_counts = {'hosts': 0, 'opened': 0, 'failed': 0}
+
+def resolve_host(host, port):
+    """Host'un bağlanılacak adresleri (sıralı, tekrarsız) - eşzamanlı sorgular tek getaddrinfo'da birleşir"""
+    if not DNS_CACHE_TTL:
+        return _getaddrinfo(host, port)
+    key = (host, port)
+    addresses = _dns_cache.get(key)
+    if addresses is not None:
+        _dns_counts['hits'] += 1
+        return addresses
+    addresses, shared = _dns_flight.do(key, _lookup_host, key)
+    _dns_counts['coalesced' if shared else 'misses'] += 1
+    return addresses
+
+def _lookup_host(key):
+    addresses = _getaddrinfo(*key)
+    _dns_cache.set(key, addresses)
+    return addresses
+
+def _getaddrinfo(host, port):
+    infos = socket.getaddrinfo(host, port, allowed_gai_family(), socket.SOCK_STREAM)
+    return list(dict.fromkeys(info[4][0] for info in infos))
+
+def forget_host(host, port):
+    """Hiçbir adresine bağlanılamadı - bir sonraki bağlantı yeniden sorgular"""
+    if _dns_cache.pop((host, port)) is not None:
+        _dns_counts['forgotten'] += 1
+
+def prewarm(url):
+    """URL'nin host'una PREWARM_CONNECTIONS bağlantıyı arka planda aç (host başına PREWARM_INTERVAL'de bir)"""
+    if not PREWARM_CONNECTIONS or not url:
+        return
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        return
+    key = (parsed.scheme, parsed.netloc)
+    if _prewarmed.get(key) is not None:
+        return
+    _prewarmed.set(key, True)
+    _prewarm_counts['hosts'] += 1
+    prewarm_connections(url, PREWARM_CONNECTIONS)
+
+def _prewarm_pool(url, count):
+    """requests havuzunda boşta count bağlantı olacak kadar bağlantı aç (TCP + TLS el sıkışması dahil)"""
+    if host_health(urlparse(url).hostname).state != 'closed':
+        return  # allow() half-open deneme hakkını tüketirdi
+    s = get_session()
+    pool = _session_adapter.get_connection(url)
+    # requests sertifika ayarlarını havuza istek anında yazar - ısıtılan bağlantılar da aynı doğrulamayı yapsın
+    verify = s.merge_environment_settings(url, {}, None, s.verify, None)['verify']
+    _session_adapter.cert_verify(pool, url, verify, None)
+    idle = sum(1 for conn in pool.pool.queue if conn is not None) if pool.pool is not None else 0
+    if count > idle:
+        for _ in bounded_map(_open_pooled, [pool] * (count - idle), count - idle):
+            pass
+
+def _open_pooled(pool):
+    # urllib3'ün public API'si bağlantıyı ancak bir istekle açar (urlopen) - boşta bağlantı eklemek için
+    # havuzun _get_conn/_put_conn'u kullanılır. requirements.txt'deki urllib3==2.1.0'a bağlıdır;
+    # sürüm yükseltilirken bu iki metodun imzası ve davranışı (boş yer = None -> yeni bağlantı) kontrol edilmeli
+    conn = pool._get_conn()  # havuzdan bir yer al (boşsa yeni, bağlanmamış bağlantı)
+    try:
+        if not conn.is_connected:
+            conn.timeout = PREWARM_CONNECT_TIMEOUT
+            conn.connect()
+            _drain_tickets(conn.sock)
+            _prewarm_counts['opened'] += 1
+    except Exception as e:
+        conn.close()
+        conn = None
+        _prewarm_counts['failed'] += 1
+        logger.debug(f"Prewarm to {pool.host} failed: {e}")
+    pool._put_conn(conn)  # istekler timeout'larını bağlantı alınınca yeniden ayarlar
+
+def _drain_tickets(sock):
+    """TLS 1.3 session ticket'ları el sıkışmadan sonra gelir ve okunmadan bekler; urllib3 okunabilir
+    boştaki soketi kopmuş sayıp atar. Ticket kaydı işlenir, uygulama verisi/EOF gelirse hata."""
+    if getattr(sock, 'version', None) is None or sock.version() != 'TLSv1.3':
+        return
+    timeout = sock.gettimeout()
+    wait = PREWARM_TICKET_WAIT
+    sock.settimeout(0)
+    try:
+        while wait_for_read(sock, timeout=wait):
+            try:
+                if not sock.recv(1):
+                    raise ConnectionError("closed by upstream")
+                raise ConnectionError("unexpected data from upstream")
+            except ssl.SSLWantReadError:
+                pass  # sadece ticket vardı
+            wait = 0.05  # ikinci ticket genelde hemen arkasından gelir
+    finally:
+        sock.settimeout(timeout)
+
+def prewarm_connections(url, count):
+    """Sunucu modu ısıtıcısı (asyncio modu kendi istemci havuzu için bunu değiştirir)"""
+    spawn(_prewarm_pool, url, count)
+
+def dns_stats():
+    return dict(_dns_counts, ttl=DNS_CACHE_TTL, entries=len(_dns_cache))
+
+def prewarm_stats():
+    return dict(_prewarm_counts, per_host=PREWARM_CONNECTIONS, enabled=PREWARM_CONNECTIONS > 0)
+
+# PERFORMANS İYİLEŞTİRMESİ: Katmanlı kısmi çözümleme önbelleği
+# Tam çözümleme (sayfa -> iframe -> auth -> server_lookup) yerine sabit kısımlar ayrı ayrı tutulur:
+# sayfanın iframe adresi, site başına script endpoint'leri, kanal başına server_key ve auth durumu
+RESOLVE_SITE_TTL = int(os.environ.get('RESOLVE_SITE_TTL', '3600'))  # iframe adresi + site endpoint'leri
+RESOLVE_SERVER_KEY_TTL = int(os.environ.get('RESOLVE_SERVER_KEY_TTL', '1800'))
+RESOLVE_AUTH_TTL = int(os.environ.get('RESOLVE_AUTH_TTL', '600'))  # auth çağrısının geçerli sayıldığı süre
+SITE_PATTERNS = ('auth_host', 'server_lookup', 'host')  # site başına sabit
+CHANNEL_PATTERNS = ('channel_key', 'auth_ts', 'auth_rnd', 'auth_sig')  # her iframe'de değişir
+resolve_layers = {
+    'embed': make_cache('embed', RESOLVE_CACHE_SIZE, RESOLVE_SITE_TTL),  # sayfa URL -> iframe URL
+    'site': make_cache('site', UPSTREAM_MAX_HOSTS, RESOLVE_SITE_TTL),  # iframe host -> SITE_PATTERNS değerleri
+    'server_key': make_cache('server_key', RESOLVE_CACHE_SIZE, RESOLVE_SERVER_KEY_TTL),  # (host, channelKey)
+    'auth': make_cache('auth', RESOLVE_CACHE_SIZE, RESOLVE_AUTH_TTL)  # (host, channelKey) -> authTs
+}
+resolve_layer_counts = {name: [0, 0] for name in resolve_layers}  # katman -> [hit, miss]
+
+def layer_get(name, key):
+    """Katmandan taze değer oku (None = miss) ve sayaçları güncelle"""
+    value = resolve_layers[name].get(key)
+    resolve_layer_counts[name][value is None] += 1
+    return value
+
+def forget_layers(url, netloc):
+    """Sayfa/iframe düzeni değişti: önbellekteki iframe adresi ve site sabitleri artık güvenilmez"""
+    resolve_layers['embed'].pop(url, None)
+    resolve_layers['site'].pop(netloc, None)
+
+def auth_ttl(ts):
+    """Auth kaydının ömrü: authTs imza zamanıysa imzanın kalan geçerlilik süresi, değilse RESOLVE_AUTH_TTL"""
+    try:
+        signed = float(ts)
+    except ValueError:
+        return RESOLVE_AUTH_TTL
+    if signed > 1e11:
+        signed /= 1000  # milisaniye
+    age = time.time() - signed
+    if abs(age) > 86400:
+        return RESOLVE_AUTH_TTL  # zaman damgası değil
+    return min(RESOLVE_AUTH_TTL, RESOLVE_AUTH_TTL - age)
+
 def resolve_fast(url, headers=None):
-    """Hızlı URL çözümleme"""
+    """Hızlı URL çözümleme (katmanlı önbellek: en iyi durumda sadece iframe isteği)"""
     if not url:
         return {"resolved_url": None, "headers": {}}
 
@@ -420,51 +1161,73 @@ def resolve_fast(url, headers=None):
     s = get_session()
     
     try:
-        resp = s.get(url, headers=h, allow_redirects=True, timeout=(2, 5))
-        content = resp.text
-        final = resp.url
+        url2 = None if is_vavoo else layer_get('embed', url)
+        if url2 is None:
+            with timed(RESOLVE_STAGE, ('page',)):
+                resp = s.get(url, headers=h, allow_redirects=True, timeout=(2, 5))
+            content = resp.text
+            final = resp.url
 
-        if is_vavoo or content[:10].strip().startswith('#EXTM3U'):
-            return {"resolved_url": final, "headers": h}
+            if is_vavoo or content[:10].strip().startswith('#EXTM3U'):
+                return {"resolved_url": final, "headers": h}
 
-        # Iframe yakala
-        iframe = PATTERNS['iframe'].search(content)
-        if not iframe:
-            return {"resolved_url": final if content[:10].strip().startswith('#EXTM3U') else url, "headers": h}
+            # Iframe yakala
+            iframe = PATTERNS['iframe'].search(content)
+            if not iframe:
+                return {"resolved_url": url, "headers": h}
+            url2 = iframe.group(1)
+            resolve_layers['embed'].set(url, url2)
 
-        url2 = iframe.group(1)
         parsed = urlparse(url2)
         h.update({
             'Referer': f"{parsed.scheme}://{parsed.netloc}/",
             'Origin': f"{parsed.scheme}://{parsed.netloc}"
         })
         
-        resp2 = s.get(url2, headers=h, timeout=(2, 5))
+        with timed(RESOLVE_STAGE, ('iframe',)):
+            resp2 = s.get(url2, headers=h, timeout=(2, 5))
         txt = resp2.text
 
-        # Pattern matching
-        m = {k: p.search(txt) for k, p in PATTERNS.items()}
-        
-        if not all(m.get(k) for k in ['channel_key', 'auth_ts', 'auth_rnd', 'auth_sig', 'auth_host', 'server_lookup', 'host']):
-            return {"resolved_url": final if content[:10].strip().startswith('#EXTM3U') else url, "headers": h}
+        # Pattern matching - site sabitleri önbellekteyse sadece kanal pattern'ları çalışır
+        m = {k: PATTERNS[k].search(txt) for k in CHANNEL_PATTERNS}
+        if not all(m.values()):
+            forget_layers(url, parsed.netloc)
+            return {"resolved_url": url, "headers": h}
+        site = layer_get('site', parsed.netloc)
+        if site is None:
+            found = {k: PATTERNS[k].search(txt) for k in SITE_PATTERNS}
+            if not all(found.values()):
+                forget_layers(url, parsed.netloc)
+                return {"resolved_url": url, "headers": h}
+            site = {k: v.group(1) for k, v in found.items()}
+            resolve_layers['site'].set(parsed.netloc, site)
 
         ck = m['channel_key'].group(1)
         ts = m['auth_ts'].group(1)
         rnd = m['auth_rnd'].group(1)
         sig = quote(m['auth_sig'].group(1))
-        ah = m['auth_host'].group(1)
-        sl = m['server_lookup'].group(1)
-        host = m['host'].group(1)
+        ah = site['auth_host']
+        sl = site['server_lookup']
+        host = site['host']
+        channel = (parsed.netloc, ck)
 
-        # Auth
-        s.get(f'{ah}{ck}&ts={ts}&rnd={rnd}&sig={sig}', headers=h, timeout=(2, 4))
+        # Auth - sadece önceki imzanın süresi dolduysa
+        if layer_get('auth', channel) is None:
+            with timed(RESOLVE_STAGE, ('auth',)):
+                s.get(f'{ah}{ck}&ts={ts}&rnd={rnd}&sig={sig}', headers=h, timeout=(2, 4))
+            ttl = auth_ttl(ts)
+            if ttl > 0:
+                resolve_layers['auth'].set(channel, ts, ttl)
 
         # Server lookup
-        srv = s.get(f"https://{parsed.netloc}{sl}{ck}", headers=h, timeout=(2, 4))
-        sk = srv.json().get('server_key')
-        
-        if not sk:
-            return {"resolved_url": url, "headers": h}
+        sk = layer_get('server_key', channel)
+        if sk is None:
+            with timed(RESOLVE_STAGE, ('server_lookup',)):
+                srv = s.get(f"https://{parsed.netloc}{sl}{ck}", headers=h, timeout=(2, 4))
+            sk = srv.json().get('server_key')
+            if not sk:
+                return {"resolved_url": url, "headers": h}
+            resolve_layers['server_key'].set(channel, sk)
 
         stream = f'https://{sk}{host}{sk}/{ck}/mono.m3u8'
         
@@ -475,8 +1238,1076 @@ def resolve_fast(url, headers=None):
 
     except Exception as e:
         logger.warning(f"Resolve error: {e}")
+        tracing.error(e, 'resolve')
         return {"resolved_url": url, "headers": h}
 
+# PERFORMANS İYİLEŞTİRMESİ: Paylaşılan TS segment önbelleği + istek birleştirme
+SEGMENT_CACHE_MAX_BYTES = int(os.environ.get('SEGMENT_CACHE_MB', '256')) * 1024 * 1024
+SEGMENT_CACHE_TTL = int(os.environ.get('SEGMENT_CACHE_TTL', '120'))  # saniye
+SEGMENT_MAX_ENTRY_BYTES = int(os.environ.get('SEGMENT_MAX_ENTRY_MB', '16')) * 1024 * 1024
+SEGMENT_CHUNK_SIZE = int(os.environ.get('RELAY_CHUNK_KB', '128')) * 1024  # okuma/yazma parça boyutu
+# Content-Length'siz gövde SEGMENT_MAX_ENTRY_BYTES'ı aşınca sadece okuyucuların yetişmesi için son N chunk tutulur
+SEGMENT_PASSTHROUGH_CHUNKS = 16
+
+# PERFORMANS İYİLEŞTİRMESİ: Yeniden kullanılan relay buffer'ları (chunk başına bytes ayırma yok)
+RELAY_POOL_MAX_BYTES = int(os.environ.get('RELAY_POOL_MB', '64')) * 1024 * 1024
+RELAY_PREALLOC = int(os.environ.get('RELAY_PREALLOC', '8'))  # başlangıçta ayrılan 2MB'lık buffer sayısı
+RELAY_RECENT_STREAMS = 20
+
+class BufferPool:
+    """Boşta bekleyen bytearray'ler için byte sınırlı havuz (kapasite SEGMENT_CHUNK_SIZE katları)"""
+
+    def __init__(self, max_bytes, granularity):
+        self.max_bytes = max_bytes
+        self.granularity = granularity
+        self.bytes = 0
+        self.reused = 0
+        self.allocated = 0
+        self._free = {}  # kapasite -> [bytearray]
+        self._lock = threading.Lock()
+
+    def acquire(self, size):
+        """En az size kapasiteli buffer (en fazla %25 büyüğü yeniden kullanılır)"""
+        cap = -(-size // self.granularity) * self.granularity
+        with self._lock:
+            for c in range(cap, cap + cap // 4 + 1, self.granularity):
+                free = self._free.get(c)
+                if free:
+                    self.bytes -= c
+                    self.reused += 1
+                    return free.pop()
+            self.allocated += 1
+        return bytearray(cap)
+
+    def release(self, buf):
+        cap = len(buf)
+        with self._lock:
+            if self.bytes + cap > self.max_bytes:
+                return
+            self._free.setdefault(cap, []).append(buf)
+            self.bytes += cap
+
+    def preallocate(self, count, size):
+        for _ in range(count):
+            self.release(bytearray(-(-size // self.granularity) * self.granularity))
+
+relay_pool = BufferPool(RELAY_POOL_MAX_BYTES, SEGMENT_CHUNK_SIZE)
+relay_pool.preallocate(RELAY_PREALLOC, 2 * 1024 * 1024)
+_ref_lock = threading.Lock()
+
+class SegmentData:
+    """Havuz buffer'ındaki segment gövdesi - referans sayımlı, son referansta havuza döner"""
+    __slots__ = ('buf', 'length', 'refs')
+
+    def __init__(self, buf, length=0):
+        self.buf = buf
+        self.length = length
+        self.refs = 1  # oluşturanın referansı
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def nbytes(self):
+        return len(self.buf)
+
+    def view(self, start=0, end=None):
+        return memoryview(self.buf)[start:self.length if end is None else end]
+
+    def acquire(self):
+        with _ref_lock:
+            self.refs += 1
+        return self
+
+    def release(self):
+        with _ref_lock:
+            self.refs -= 1
+            last = self.refs == 0
+        if last:
+            relay_pool.release(self.buf)
+            self.buf = None
+
+    @classmethod
+    def from_chunks(cls, chunks, size):
+        data = cls(relay_pool.acquire(size), size)
+        pos = 0
+        for chunk in chunks:
+            data.buf[pos:pos + len(chunk)] = chunk
+            pos += len(chunk)
+        return data
+
+class SegmentCache:
+    """Byte bütçeli LRU segment önbelleği (anahtar: segment URL, değer: SegmentData)"""
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self._entries = OrderedDict()  # url -> (data, content_type, expires)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            if entry[2] < time.time():
+                self._drop(url)
+                return None
+            self._entries.move_to_end(url)
+            return entry
+
+    def acquire(self, url):
+        """get() gibi, ancak gövdeye referans alır - okuma bitince data.release() çağrılmalı"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            if entry[2] < time.time():
+                self._drop(url)
+                return None
+            self._entries.move_to_end(url)
+            entry[0].acquire()
+            return entry
+
+    def put(self, url, data, content_type, ttl=None):
+        """SegmentData'yı önbelleğe koy (önbellek kendi referansını alır)"""
+        size = data.nbytes
+        if data.length == 0 or size > min(self.max_bytes, SEGMENT_MAX_ENTRY_BYTES):
+            return False
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if url in self._entries:
+                self._drop(url)
+            # En eski kayıtları bütçe yetene kadar at
+            while self._entries and self.bytes + size > self.max_bytes:
+                _, (old, _, _) = self._entries.popitem(last=False)
+                self.bytes -= old.nbytes
+                old.release()
+            self._entries[url] = (data.acquire(), content_type, expires)
+            self.bytes += size
+        return True
+
+    def clear(self):
+        with self._lock:
+            for data, _, _ in self._entries.values():
+                data.release()
+            self._entries.clear()
+            self.bytes = 0
+
+    def _drop(self, url):
+        data, _, _ = self._entries.pop(url)
+        self.bytes -= data.nbytes
+        data.release()
+
+segment_cache = SegmentCache(SEGMENT_CACHE_MAX_BYTES, SEGMENT_CACHE_TTL)
+
+BYTERANGE_RE = re.compile(r'^(\d+)-(\d+)$')
+
+def segment_key(url, byterange=None):
+    """Önbellek/in-flight anahtarı: alt aralık (br=) varsa <url>#bytes=<aralık>"""
+    return f"{url}{hls_rewriter.BYTERANGE_KEY}{byterange}" if byterange else url
+
+def split_segment_key(key):
+    """Anahtar -> (upstream URL'si, (başlangıç, bitiş hariç) ya da None)"""
+    url, sep, byterange = key.partition(hls_rewriter.BYTERANGE_KEY)
+    if not sep:
+        return key, None
+    start, end = byterange.split('-')
+    return url, (int(start), int(end) + 1)
+
+# PERFORMANS İYİLEŞTİRMESİ: Disk tabanlı segment deposu - DVR/VOD geri sarma (opsiyonel)
+DISK_STORE_DIR = os.environ.get('DISK_STORE_DIR', '')  # boş = kapalı
+DISK_STORE_MAX_BYTES = int(os.environ.get('DISK_STORE_MB', '10240')) * 1024 * 1024
+DISK_STORE_LIVE_TTL = int(os.environ.get('DISK_STORE_LIVE_TTL', '3600'))  # canlı segmentler
+DISK_STORE_VOD_TTL = int(os.environ.get('DISK_STORE_VOD_TTL', '86400'))  # #EXT-X-ENDLIST segmentleri
+# Çok süreçli modda dizin ve bütçe worker'lar arasında paylaşılır: her worker bütçenin 1/N'ini yönetir
+DISK_STORE_SHARD = (int(WORKER_ID or 0), int(os.environ.get('WORKER_COUNT', '1'))) if shared is not None else None
+disk_store = segment_store.DiskSegmentStore(
+    DISK_STORE_DIR, DISK_STORE_MAX_BYTES, DISK_STORE_LIVE_TTL, DISK_STORE_VOD_TTL, adopt=shared is not None,
+    shard=DISK_STORE_SHARD
+) if DISK_STORE_DIR else None
+
+def store_on_disk(url, data):
+    """Segmenti arka planda diske yaz (yazma bitene kadar buffer referansı tutulur)"""
+    data.acquire()
+    if SERVER_MODE == 'gevent':
+        # Dosya yazımı bloklayıcı - greenlet'te hub'ı durdururdu, hub'ın thread havuzunda yazılır
+        gevent.get_hub().threadpool.spawn(_write_disk, url, data)
+    else:
+        spawn(_write_disk, url, data)
+
+def _write_disk(url, data):
+    try:
+        disk_store.put(url, data.view())
+    finally:
+        data.release()
+
+_relay_streams = deque(maxlen=RELAY_RECENT_STREAMS)
+
+SAVED_SOURCES = ('cache', 'disk', 'coalesced')  # upstream'den tekrar indirilmeyen akışlar
+
+def record_stream(url, sent, elapsed, source):
+    """Tamamlanan relay akışının byte/throughput kaydı"""
+    metrics['relay_bytes'] += sent
+    metrics['relay_streams'] += 1
+    RELAY_BYTES.inc((source,), sent)
+    RELAY_SECONDS.observe((source,), elapsed)
+    tracing.sent(sent, source=source)
+    if source in SAVED_SOURCES:
+        metrics['segment_bytes_saved'] += sent
+    _relay_streams.append({
+        "host": urlparse(url).hostname,
+        "source": source,
+        "bytes": sent,
+        "seconds": round(elapsed, 3),
+        "mbps": round(sent * 8 / elapsed / 1e6, 1) if elapsed > 0 else 0
+    })
+
+# PERFORMANS İYİLEŞTİRMESİ: Upstream akış sınırları (global + host başına) ve kısa adil kuyruk
+# Sınır dolunca istek en çok ADMISSION_QUEUE_TIMEOUT bekler, sonra hızlı 503 + Retry-After
+UPSTREAM_MAX_STREAMS = int(os.environ.get('UPSTREAM_MAX_STREAMS', '0'))  # worker başına toplam, 0 = sınırsız
+UPSTREAM_HOST_STREAMS = int(os.environ.get('UPSTREAM_HOST_STREAMS', '64'))  # host başına, 0 = sınırsız
+UPSTREAM_HOST_STREAM_LIMITS = parse_host_map(os.environ.get('UPSTREAM_HOST_STREAM_LIMITS', ''))  # "cdn.example.com=8"
+ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', '64'))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '2'))  # saniye
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', '2'))  # saniye
+admission_control = admission.AdmissionControl(
+    UPSTREAM_MAX_STREAMS, UPSTREAM_HOST_STREAMS, UPSTREAM_HOST_STREAM_LIMITS,
+    ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT)
+
+def admit(url, timeout=None):
+    """URL'nin host'u için upstream slotu al (alınamazsa admission.Overloaded).
+    release_slot'a verilecek host'u, sınır yoksa None döndürür"""
+    if not admission_control.enabled:
+        return None
+    host = urlparse(url).hostname
+    with tracing.span('admission', host=host):
+        admission_control.acquire(host, timeout)
+    return host
+
+def release_slot(host):
+    if host is not None:
+        admission_control.release(host)
+
+def overloaded_response(error):
+    return Response(f"Upstream busy: {error}", status=503, headers={'Retry-After': str(ADMISSION_RETRY_AFTER)})
+
+# PERFORMANS İYİLEŞTİRMESİ: Yavaş istemci tespiti - sadece yazmada bloklanılan süre sayılır
+# (upstream'i beklemek istemcinin suçu değil); eşiğin altında okuyan istemci koparılır
+SLOW_CLIENT_MIN_BPS = int(os.environ.get('SLOW_CLIENT_MIN_KBPS', '16')) * 1024  # 0 = kapalı
+SLOW_CLIENT_GRACE = float(os.environ.get('SLOW_CLIENT_GRACE', '5'))  # yazmada toplam bekleme (sn)
+CLIENT_WRITE_TIMEOUT = float(os.environ.get('CLIENT_WRITE_TIMEOUT', '30'))  # tek yazma bu kadar sürerse kopar
+
+class SlowClientError(ConnectionResetError):
+    """Sunucu tarafı bağlantı kapatma - pywsgi bunu kopmuş istemci gibi sessizce işler"""
+
+    def __init__(self):
+        super().__init__(errno.ECONNRESET, "client reads too slowly")
+
+class ClientPace:
+    """İstemcinin okuma hızı: yazılan byte / yazmada bloklanılan süre"""
+    __slots__ = ('sent', 'blocked')
+
+    def __init__(self):
+        self.sent = 0
+        self.blocked = 0.0
+
+    def wrote(self, size, elapsed):
+        """Yazma kaydı; istemci eşiğin altında okuyorsa True"""
+        self.sent += size
+        self.blocked += elapsed
+        if SLOW_CLIENT_MIN_BPS and self.blocked > SLOW_CLIENT_GRACE and self.sent < SLOW_CLIENT_MIN_BPS * self.blocked:
+            metrics['slow_clients'] += 1
+            return True
+        return False
+
+class SegmentBody:
+    """Segment gövdesi: Content-Length biliniyorsa tek havuz buffer'ı, değilse chunk listesi.
+
+    Chunk listesi SEGMENT_MAX_ENTRY_BYTES'ı aşarsa (sürekli TS, büyük chunked gövde) indirme
+    önbelleksiz aktarıma geçer: yeni okuyucu katılmaz, okunmuş chunk'lar bırakılır.
+    İndirme biter ve son okuyucu ayrılınca indirmenin buffer referansı bırakılır.
+    """
+
+    def _init_body(self):
+        self.data = None  # SegmentData
+        self.chunks = []
+        self.first = 0  # chunks'tan atılmış chunk sayısı (önbelleksiz aktarım)
+        self.passthrough = False
+        self.size = 0
+        self.length = None  # Content-Length
+        self.status = None
+        self.content_type = 'video/mp2t'
+        self.error = None
+        self.done = False
+        self.readers = 0
+        self.window = None  # [atlanacak, kalan] - Range'i yok sayan upstream için
+        self.background = False  # ön-yükleme: slot yoksa kuyrukta beklemeden vazgeçilir
+
+    def _start(self, status, headers, byterange=None):
+        if byterange is not None:
+            # Alt aralık (EXT-X-BYTERANGE): 206 tam gövdedir; 200 dönen upstream'in gövdesi kırpılır
+            if status == 206:
+                status = 200
+            elif status == 200:
+                self.window = [byterange[0], byterange[1] - byterange[0]]
+        self.status = status
+        length = headers.get('Content-Length', '')
+        if status == 200 and self.window is None and length.isdigit() and not headers.get('Content-Encoding'):
+            length = int(length)
+            if 0 < length <= SEGMENT_MAX_ENTRY_BYTES:
+                self.length = length
+                self.data = SegmentData(relay_pool.acquire(length))
+
+    def _upstream(self):
+        """Segment anahtarından upstream URL'si, header'lar ve alt aralık"""
+        url, byterange = split_segment_key(self.url)
+        if byterange is None:
+            return url, self.headers, None
+        return url, dict(self.headers, Range=f"bytes={byterange[0]}-{byterange[1] - 1}"), byterange
+
+    def _append(self, chunk):
+        """Gelen chunk'ı buffer'a kopyala ya da listeye ekle"""
+        if self.window is not None:
+            skip, left = self.window
+            if skip >= len(chunk):
+                self.window[0] = skip - len(chunk)
+                return
+            chunk = chunk[skip:skip + left]
+            self.window = [0, left - len(chunk)]
+            if not chunk:
+                return
+        if self.data is not None:
+            end = self.size + len(chunk)
+            if end > self.length:
+                raise ValueError("upstream sent more than Content-Length")
+            self.data.buf[self.size:end] = chunk
+            self.data.length = self.size = end
+        else:
+            self.chunks.append(chunk)
+            self.size += len(chunk)
+            if self.size > SEGMENT_MAX_ENTRY_BYTES:
+                self._passthrough()
+
+    def _passthrough(self):
+        """Önbelleğe girmeyecek gövde: sadece son SEGMENT_PASSTHROUGH_CHUNKS chunk tutulur"""
+        if not self.passthrough:
+            self.passthrough = True
+            logger.debug(f"Segment {self.url} exceeds {SEGMENT_MAX_ENTRY_BYTES} bytes, relaying uncached")
+        drop = len(self.chunks) - SEGMENT_PASSTHROUGH_CHUNKS
+        if drop > 0:
+            del self.chunks[:drop]
+            self.first += drop
+
+    def _piece(self, cursor):
+        """cursor'dan sonraki parça: (parça, yeni cursor) ya da None"""
+        if self.data is not None:
+            if cursor >= self.size:
+                return None
+            end = min(self.size, cursor + SEGMENT_CHUNK_SIZE)
+            return self.data.view(cursor, end), end
+        index = cursor - self.first
+        if index < 0:
+            # Okuyucu önbelleksiz aktarımda tutulan pencerenin gerisinde kaldı
+            metrics['slow_clients'] += 1
+            raise SlowClientError()
+        if index >= len(self.chunks):
+            return None
+        return self.chunks[index], cursor + 1
+
+    def _store(self):
+        """Tamamlanan gövdeyi önbelleğe koy"""
+        if self.error is not None or self.status != 200:
+            return
+        if self.data is not None:
+            if self.size == self.length:
+                segment_cache.put(self.url, self.data, self.content_type)
+                if disk_store is not None:
+                    store_on_disk(self.url, self.data)
+        elif self.size and self.size <= SEGMENT_MAX_ENTRY_BYTES:
+            data = SegmentData.from_chunks(self.chunks, self.size)
+            segment_cache.put(self.url, data, self.content_type)
+            if disk_store is not None:
+                store_on_disk(self.url, data)
+            data.release()
+
+    def _release_body(self):
+        """Bitti ve okuyucu kalmadıysa indirmenin buffer referansını bırak"""
+        if self.done and self.readers == 0:
+            self.chunks = []
+            if self.data is not None:
+                data, self.data = self.data, None
+                data.release()
+
+def _raw_readinto(raw, view):
+    """urllib3 yanıtından doğrudan buffer'a oku (http.client readinto - ara bytes nesnesi yok)"""
+    fp = getattr(raw, '_fp', None)
+    if fp is not None and hasattr(fp, 'readinto'):
+        return fp.readinto(view)
+    data = raw.read(len(view))
+    view[:len(data)] = data
+    return len(data)
+
+class SegmentFetch(SegmentBody):
+    """Tek upstream indirmesi - eşzamanlı istemciler aynı indirmeden okur"""
+
+    def __init__(self, url, headers):
+        self.url = url
+        self.headers = headers
+        self._init_body()
+        self._cond = threading.Condition()
+
+    def run(self):
+        s = get_session()
+        slot = None
+        try:
+            url, headers, byterange = self._upstream()
+            slot = admit(url, 0 if self.background else None)
+            started = time.time()
+            resp = s.get(url, headers=headers, stream=True, timeout=(2, 20))
+            try:
+                with self._cond:
+                    self._start(resp.status_code, resp.headers, byterange)
+                    self._cond.notify_all()
+                if self.data is not None:
+                    # Önceden ayrılmış buffer'a doğrudan oku
+                    view = memoryview(self.data.buf)
+                    while self.size < self.length:
+                        n = _raw_readinto(resp.raw, view[self.size:min(self.size + SEGMENT_CHUNK_SIZE, self.length)])
+                        if not n:
+                            break
+                        with self._cond:
+                            self.data.length = self.size = self.size + n
+                            self._cond.notify_all()
+                    if self.size == self.length:
+                        resp.raw.release_conn()  # keep-alive: bağlantı havuza döner
+                        observe_upstream_total(url, started, self.size)
+                else:
+                    for chunk in resp.iter_content(chunk_size=SEGMENT_CHUNK_SIZE):
+                        if chunk:
+                            with self._cond:
+                                self._append(chunk)
+                                self._cond.notify_all()
+                        if self.window is not None and not self.window[1]:
+                            break
+                    observe_upstream_total(url, started, self.size)
+            finally:
+                resp.close()
+        except Exception as e:
+            self.error = e
+            logger.warning(f"Segment fetch error: {e}")
+            tracing.error(e, 'segment')
+        finally:
+            release_slot(slot)
+            # Önce önbelleğe yaz, sonra in-flight kaydını sil (arada boşluk kalmasın)
+            self._store()
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+            with _inflight_lock:
+                if _inflight_segments.get(self.url) is self:
+                    del _inflight_segments[self.url]
+                self._release_body()
+
+    def wait_headers(self, timeout=22):
+        """Upstream yanıt başlıkları gelene kadar bekle"""
+        with self._cond:
+            if self.status is None and not self.done:
+                self._cond.wait_for(lambda: self.status is not None or self.done, timeout)
+        return self.status is not None
+
+    def iter_chunks(self, timeout=20):
+        """Baştan itibaren tüm parçaları ver (memoryview ya da bytes), gerekirse yenilerini bekle.
+        Okuyucu get_segment_fetch ile kaydolmuş olmalı; bitince detach çağrılır."""
+        cursor = seen = 0
+        try:
+            while True:
+                with self._cond:
+                    if self.size <= seen and not self.done:
+                        self._cond.wait_for(lambda: self.size > seen or self.done, timeout)
+                    nxt = self._piece(cursor)
+                if nxt is None:
+                    return
+                piece, cursor = nxt
+                seen += len(piece)
+                yield piece
+        finally:
+            self.detach()
+
+    def detach(self):
+        with _inflight_lock:
+            self.readers -= 1
+            self._release_body()
+
+_inflight_segments = {}
+_inflight_lock = threading.Lock()
+
+def get_segment_fetch(url, headers):
+    """URL için devam eden indirmeyi döndür, yoksa başlat. (fetch, leader) döner.
+    Çağıran okuyucu olarak kaydolur: iter_chunks'ı tüketmeli ya da detach çağırmalı."""
+    with _inflight_lock:
+        fetch = _inflight_segments.get(url)
+        if fetch is not None and not fetch.passthrough:
+            fetch.readers += 1
+            return fetch, False
+        fetch = SegmentFetch(url, headers)
+        fetch.readers = 1
+        _inflight_segments[url] = fetch
+    spawn(tracing.bind(fetch.run))  # lider isteğin izine yazar
+    return fetch, True
+
+
+# PERFORMANS İYİLEŞTİRMESİ: Canlı playlist önbelleği (ömür = EXT-X-TARGETDURATION / 2)
+PLAYLIST_CACHE_SIZE = int(os.environ.get('PLAYLIST_CACHE_SIZE', '500'))
+PLAYLIST_DEFAULT_TTL = 1.0  # TARGETDURATION yoksa (master playlist vb.)
+# #EXT-X-ENDLIST playlist'leri değişmez ama segment URL'lerindeki imzalar/token'lar süreyle geçersizleşir
+PLAYLIST_VOD_TTL = float(os.environ.get('PLAYLIST_VOD_TTL', '600'))
+TARGET_DURATION_RE = re.compile(r'#EXT-X-TARGETDURATION:\s*(\d+(?:\.\d+)?)')
+_playlist_cache = make_cache('playlist', PLAYLIST_CACHE_SIZE, PLAYLIST_DEFAULT_TTL)
+_playlist_flight = SingleFlight()
+
+def playlist_ttl(content):
+    """Playlist'in kendi TARGETDURATION değerinden önbellek ömrü"""
+    if '#EXT-X-ENDLIST' in content:
+        return PLAYLIST_VOD_TTL
+    m = TARGET_DURATION_RE.search(content)
+    if not m:
+        return PLAYLIST_DEFAULT_TTL
+    return max(float(m.group(1)) / 2, 0.5)
+
+def get_cached_playlist(resolved_url, headers):
+    """Yeniden yazılmış playlist - (URL, header seti) başına önbellekli, tek upstream yenilemesi"""
+    cache_key = resolve_cache_key(resolved_url, headers)
+    if PREFETCH_ENABLED:
+        _playlist_polls.set(cache_key, True)
+    with tracing.span('playlist') as span:
+        body = _playlist_cache.get(cache_key)
+        if body is not None:
+            metrics['playlist_cache_hits'] += 1
+            span.set(cache='hit')
+            return body
+
+        body, shared = _playlist_flight.do(cache_key, _fetch_playlist, cache_key, resolved_url, headers)
+        if shared:
+            metrics['playlist_coalesced'] += 1
+        else:
+            metrics['playlist_cache_misses'] += 1
+        span.set(cache='coalesced' if shared else 'miss')
+        return body
+
+def _fetch_playlist(cache_key, resolved_url, headers):
+    """Upstream'den playlist al, yeniden yaz ve önbelleğe koy"""
+    body = _playlist_cache.get(cache_key)
+    if body is not None:
+        return body
+    return _load_playlist(cache_key, resolved_url, headers)
+
+def _load_playlist(cache_key, resolved_url, headers):
+    s = get_session()
+    resp = s.get(resolved_url, headers=headers, timeout=(2, 8))
+    body, hint = store_playlist(cache_key, resp.text, resp.url, resp.status_code, headers)
+    if hint is not None:
+        preload_part(hint, headers)
+    return body
+
+def store_playlist(cache_key, content, final, status, headers):
+    """Upstream playlist'ini yeniden yaz; 200 ise önbelleğe al ve segmentleri/canlı ucu takip et.
+    (body, yeni preload hint URL'si ya da None) döner"""
+    segments = [] if PREFETCH_ENABLED or disk_store is not None else None
+    with tracing.span('rewrite', bytes=len(content)):
+        body = hls_rewriter.rewrite(content, final, headers, segments)
+    hint = None
+    if status == 200:
+        _playlist_cache.set(cache_key, body, playlist_ttl(content))
+        track_playlist_segments(cache_key, content, segments, headers)
+        hint = track_live_edge(cache_key, content, final, body)
+    return body, hint
+
+def track_playlist_segments(cache_key, content, segments, headers):
+    """Canlı playlist -> prefetch, ENDLIST playlist -> segmentler diskte uzun ömürlü"""
+    if not segments:
+        return
+    if '#EXT-X-ENDLIST' in content:
+        if disk_store is not None:
+            disk_store.mark_vod(segments)
+    elif PREFETCH_ENABLED:
+        schedule_prefetch(cache_key, segments, headers)
+
+# PERFORMANS İYİLEŞTİRMESİ: Playlist yanıtlarında ETag/304 ve sürüm başına bir kez sıkıştırılan gövde
+# Yeniden yazılmış playlist'in her sürümü için ETag bir kez hesaplanır; gzip/br gövdeleri ilk isteyen
+# istemcide üretilir ve aynı sürümü alan tüm istemcilere tekrar kullanılır
+PLAYLIST_COMPRESS_MIN = 1024  # daha küçük gövde sıkıştırılmaz (başlık maliyeti kazancı geçer)
+PLAYLIST_GZIP_LEVEL = int(os.environ.get('PLAYLIST_GZIP_LEVEL', '6'))
+PLAYLIST_BROTLI_QUALITY = int(os.environ.get('PLAYLIST_BROTLI_QUALITY', '5'))
+PLAYLIST_VERSION_TTL = 60  # sürüm kaydı - canlı playlist'te zaten birkaç saniyede yenilenir
+PLAYLIST_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)  # tercih sırası
+# no-cache: tarayıcı her seferinde If-None-Match ile doğrular (canlı playlist eskisi verilmez)
+PLAYLIST_HEADERS = {'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+_playlist_versions = TTLCache(PLAYLIST_CACHE_SIZE * 2, PLAYLIST_VERSION_TTL)  # worker'a özel (bytes)
+
+class PlaylistVersion:
+    """Playlist metninin bir sürümü: güçlü ETag ve tembel üretilen sıkıştırılmış gövdeler"""
+    __slots__ = ('text', 'data', 'etag', 'encoded')
+
+    def __init__(self, text):
+        self.text = text
+        self.data = text.encode()
+        self.etag = hashlib.blake2b(self.data, digest_size=12).hexdigest()
+        self.encoded = {}
+
+    def tag(self, encoding):
+        """Temsil başına güçlü ETag (içerik kodlaması farklı gövde = farklı ETag)"""
+        return f'"{self.etag}-{encoding}"' if encoding else f'"{self.etag}"'
+
+    def body(self, encoding):
+        if encoding is None:
+            return self.data
+        data = self.encoded.get(encoding)
+        if data is None:
+            if encoding == 'br':
+                data = brotli.compress(self.data, quality=PLAYLIST_BROTLI_QUALITY)
+            else:
+                data = gzip.compress(self.data, PLAYLIST_GZIP_LEVEL, mtime=0)
+            self.encoded[encoding] = data
+            metrics['playlist_compressions'] += 1
+        return data
+
+    def matches(self, if_none_match):
+        """If-None-Match bu sürümün herhangi bir temsiliyle eşleşiyor mu (zayıf karşılaştırma)"""
+        if if_none_match.strip() == '*':
+            return True
+        for tag in if_none_match.split(','):
+            tag = tag.strip().removeprefix('W/').strip('"')
+            if tag.split('-', 1)[0] == self.etag:
+                return True
+        return False
+
+def playlist_version(key, text):
+    """key için text'in sürümü - aynı metin (çoğunlukla aynı nesne) için mevcut sürüm döner"""
+    version = _playlist_versions.get(key)
+    if version is None or (version.text is not text and version.text != text):
+        version = PlaylistVersion(text)
+        _playlist_versions.set(key, version)
+    return version
+
+@lru_cache(maxsize=256)
+def choose_encoding(accept_encoding):
+    """Accept-Encoding'in izin verdiği ilk ön-sıkıştırma (PLAYLIST_ENCODINGS sırasıyla) ya da None"""
+    allowed = {}
+    for part in accept_encoding.lower().split(','):
+        name, _, params = part.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        allowed[name.strip()] = q
+    for encoding in PLAYLIST_ENCODINGS:
+        if allowed.get(encoding, allowed.get('*', 0)) > 0:
+            return encoding
+    return None
+
+def playlist_response(version, if_none_match, accept_encoding):
+    """(status, gövde, header'lar): ETag eşleşirse 304, yoksa istemcinin kabul ettiği ön-sıkıştırılmış gövde"""
+    encoding = None
+    if accept_encoding and len(version.data) >= PLAYLIST_COMPRESS_MIN:
+        encoding = choose_encoding(accept_encoding)
+    headers = dict(PLAYLIST_HEADERS, ETag=version.tag(encoding))
+    if if_none_match and version.matches(if_none_match):
+        metrics['playlist_not_modified'] += 1
+        metrics['playlist_bytes_saved'] += len(version.data)
+        return 304, b'', headers
+    data = version.body(encoding)
+    if encoding is not None:
+        headers['Content-Encoding'] = encoding
+        metrics['playlist_compressed'] += 1
+        metrics['playlist_bytes_saved'] += len(version.data) - len(data)
+    return 200, data, headers
+
+# PERFORMANS İYİLEŞTİRMESİ: LL-HLS blocking playlist reload (_HLS_msn/_HLS_part) ve preload hint
+# Bekleyen istemciler upstream playlist'in tek bir kopyasını paylaşır: aynı hedef için tek upstream isteği
+LLHLS_BLOCK_MAX = float(os.environ.get('LLHLS_BLOCK_MAX', '15'))  # saniye - spec: 3 x TARGETDURATION
+LLHLS_EDGE_TTL = 30  # istemcisi kalmayan canlı uç kaydı bu sürede düşer
+MEDIA_SEQUENCE_RE = re.compile(r'#EXT-X-MEDIA-SEQUENCE:\s*(\d+)')
+PART_TARGET_RE = re.compile(r'#EXT-X-PART-INF:.*?PART-TARGET=(\d+(?:\.\d+)?)')
+_live_edges = TTLCache(PLAYLIST_CACHE_SIZE, LLHLS_EDGE_TTL)  # cache_key -> LiveEdge (süreç başına)
+_live_flight = SingleFlight()
+
+class LiveEdge:
+    """Canlı media playlist'in ucu: son tam segmentin MSN'i ve sonraki segmentin hazır part sayısı"""
+    __slots__ = ('msn', 'parts', 'body', 'target', 'part_target', 'can_block', 'hint')
+
+    def __init__(self, content, final, body):
+        segments = parts = 0
+        hint = None
+        for line in content.splitlines():
+            if line.startswith('#EXT-X-PART:'):
+                parts += 1
+            elif line.startswith('#EXT-X-PRELOAD-HINT:'):
+                # Aralıklı (BYTERANGE-START) hint'ler istemcinin Range'iyle gelir - ön-yüklenmez
+                m = hls_rewriter.URI_ATTR_RE.search(line)
+                if m and 'TYPE=PART' in line and 'BYTERANGE-START' not in line and hls_rewriter.proxyable(m.group(1)):
+                    hint = hls_rewriter.absolute_uri(m.group(1), final)
+            elif line and line[0] != '#':
+                segments += 1
+                parts = 0
+        m = MEDIA_SEQUENCE_RE.search(content)
+        self.msn = (int(m.group(1)) if m else 0) + segments - 1
+        self.parts = parts
+        self.body = body
+        m = TARGET_DURATION_RE.search(content)
+        self.target = float(m.group(1)) if m else PLAYLIST_DEFAULT_TTL
+        m = PART_TARGET_RE.search(content)
+        self.part_target = float(m.group(1)) if m else None
+        self.can_block = 'CAN-BLOCK-RELOAD=YES' in content
+        self.hint = hint
+
+    @property
+    def position(self):
+        return self.msn, self.parts
+
+    def reached(self, msn, part):
+        """İstenen segment (part verilmişse sonraki segmentin part'ı) playlist'te var mı"""
+        if self.msn >= msn:
+            return True
+        return part is not None and self.msn + 1 == msn and self.parts > part
+
+    def block_timeout(self):
+        return min(3 * self.target, LLHLS_BLOCK_MAX)
+
+    def poll_interval(self):
+        """Upstream bloklamıyorsa (ya da hata verdiyse) iki upstream isteği arasındaki bekleme"""
+        return self.part_target or max(self.target / 2, 0.5)
+
+def track_live_edge(cache_key, content, final, body):
+    """Canlı media playlist'in ucunu güncelle; yeni bir preload hint varsa URL'sini döndür"""
+    if '#EXT-X-TARGETDURATION' not in content or '#EXT-X-ENDLIST' in content:
+        return None
+    edge = LiveEdge(content, final, body)
+    old = _live_edges.get(cache_key)
+    if old is not None and edge.position < old.position:
+        return None  # geç gelen eski yanıt ucu geri almasın
+    _live_edges.set(cache_key, edge)
+    if edge.hint is not None and (old is None or old.hint != edge.hint):
+        return edge.hint
+    return None
+
+def ll_request(args):
+    """_HLS_msn/_HLS_part sorgusu -> (msn, part) ya da None (normal istek). Geçersizse ValueError"""
+    msn = args.get('_HLS_msn')
+    part = args.get('_HLS_part')
+    if msn is None:
+        if part is not None:
+            raise ValueError("_HLS_part requires _HLS_msn")
+        return None
+    return int(msn), (None if part is None else int(part))
+
+def blocking_url(url, msn, part):
+    """Upstream'e iletilen blocking reload isteği"""
+    query = f"_HLS_msn={msn}" if part is None else f"_HLS_msn={msn}&_HLS_part={part}"
+    return f"{url}{'&' if '?' in url else '?'}{query}"
+
+def live_result(edge, msn, part, deadline):
+    """Bekleme döngüsünün kararı: (status, body) ya da None (upstream'in ilerlemesini bekle)"""
+    if edge.reached(msn, part):
+        return 200, edge.body
+    if msn > edge.msn + 2:
+        return 400, "_HLS_msn is more than two segments ahead of the playlist"
+    if time.time() >= deadline:
+        metrics['llhls_timeouts'] += 1
+        return 503, "Playlist did not reach the requested segment in time"
+    return None
+
+def get_live_playlist(resolved_url, headers, msn, part):
+    """Blocking playlist reload: playlist istenen MSN/part'a ulaşınca yanıtla. (status, body) döner"""
+    cache_key = resolve_cache_key(resolved_url, headers)
+    edge = _live_edges.get(cache_key)
+    if edge is None:
+        body = get_cached_playlist(resolved_url, headers)
+        edge = _live_edges.get(cache_key)
+        if edge is None:
+            return 200, body  # canlı media playlist değil (master, VOD, hata)
+    deadline = time.time() + edge.block_timeout()
+    result = live_result(edge, msn, part, deadline)
+    if result is not None and result[0] == 400:
+        # Önbellekteki uç eski olabilir (kimse poll etmiyordu) - reddetmeden önce upstream'den bir kez tazele
+        try:
+            _live_flight.do(cache_key, _load_playlist, cache_key, resolved_url, headers)
+        except Exception as e:
+            logger.debug(f"Live edge refresh failed: {e}")
+        edge = _live_edges.get(cache_key) or edge
+        result = live_result(edge, msn, part, deadline)
+    if result is not None:
+        if result[0] == 200:
+            metrics['llhls_immediate'] += 1
+        return result
+
+    metrics['llhls_blocked'] += 1
+    with tracing.span('llhls_block', msn=msn, part=part):
+        while result is None:
+            _live_flight.do((cache_key, msn, part), _fetch_live, cache_key, resolved_url, headers, edge, msn, part)
+            edge = _live_edges.get(cache_key) or edge
+            result = live_result(edge, msn, part, deadline)
+    return result
+
+def _fetch_live(cache_key, resolved_url, headers, edge, msn, part):
+    """Upstream'den istenen ucu içeren playlist'i al - upstream bloklamıyorsa kısa aralıklarla poll"""
+    if edge.can_block:
+        url = blocking_url(resolved_url, msn, part)
+    else:
+        time.sleep(edge.poll_interval())
+        url = resolved_url
+    s = get_session()
+    resp = s.get(url, headers=headers, timeout=(2, edge.block_timeout() + 2))
+    metrics['llhls_upstream'] += 1
+    _, hint = store_playlist(cache_key, resp.text, resp.url, resp.status_code, headers)
+    if hint is not None:
+        preload_part(hint, headers)
+    current = _live_edges.get(cache_key)
+    if edge.can_block and (current is None or current.position <= edge.position):
+        time.sleep(edge.poll_interval())  # ilerlemeyen yanıt döngüyü upstream'e karşı sıkıştırmasın
+
+def preload_part(url, headers):
+    """Preload hint'teki part'ı hemen indirmeye başla - istemciler aynı indirmeye katılır"""
+    if url in _inflight_segments or segment_cache.get(url) is not None:
+        return
+    with _inflight_lock:
+        if url in _inflight_segments:
+            return
+        fetch = _inflight_segments[url] = SegmentFetch(url, headers)
+        fetch.background = True
+    metrics['llhls_preloads'] += 1
+    spawn(fetch.run)
+
+# PERFORMANS İYİLEŞTİRMESİ: Playlist'ten tahmine dayalı segment ön-yükleme (opsiyonel)
+PREFETCH_SEGMENTS = int(os.environ.get('PREFETCH_SEGMENTS', '0'))  # 0 = kapalı
+PREFETCH_HOSTS = parse_host_map(os.environ.get('PREFETCH_HOSTS', ''))  # "cdn.example.com=3,other.net=0"
+PREFETCH_ENABLED = PREFETCH_SEGMENTS > 0 or any(PREFETCH_HOSTS.values())
+PREFETCH_CONCURRENCY = int(os.environ.get('PREFETCH_CONCURRENCY', '8'))
+PREFETCH_MAX_BYTES = int(os.environ.get('PREFETCH_MAX_MB', '64')) * 1024 * 1024
+PREFETCH_IDLE_SECONDS = int(os.environ.get('PREFETCH_IDLE_SECONDS', '20'))
+_playlist_polls = TTLCache(PLAYLIST_CACHE_SIZE, PREFETCH_IDLE_SECONDS)  # son poll zamanları
+_prefetched = OrderedDict()  # url -> [size, started] (henüz istenmemiş ön-yüklemeler)
+_prefetch_state = {'active': 0, 'bytes': 0}
+
+def prefetch_count(url):
+    """Host için ön-yüklenecek segment sayısı"""
+    return PREFETCH_HOSTS.get(urlparse(url).hostname, PREFETCH_SEGMENTS)
+
+def schedule_prefetch(channel_key, segments, headers):
+    """Playlist'teki en yeni N segmenti arka planda segment önbelleğine indir"""
+    n = prefetch_count(segments[-1])
+    if n <= 0:
+        return
+    _prune_prefetched()
+    for url in segments[-n:]:
+        if url in _prefetched or url in _inflight_segments or segment_cache.get(url) is not None:
+            continue
+        if _prefetch_state['active'] >= PREFETCH_CONCURRENCY or _prefetch_state['bytes'] >= PREFETCH_MAX_BYTES:
+            metrics['prefetch_skipped'] += 1
+            continue
+        _prefetch_state['active'] += 1
+        _prefetched[url] = [0, time.time()]
+        spawn_prefetch(channel_key, url, headers)
+
+def spawn_prefetch(channel_key, url, headers):
+    """Sunucu modu ön-yükleyicisi (asyncio modu kendi indirme tablosu için bunu değiştirir)"""
+    spawn(_prefetch_segment, channel_key, url, headers)
+
+def _prefetch_segment(channel_key, url, headers):
+    try:
+        if not prefetch_wanted(channel_key, url):
+            return
+        with _inflight_lock:
+            if url in _inflight_segments:
+                return
+            fetch = SegmentFetch(url, headers)
+            fetch.background = True
+            _inflight_segments[url] = fetch
+        metrics['prefetch_started'] += 1
+        fetch.run()
+        prefetch_done(url, fetch.size)
+    finally:
+        _prefetch_state['active'] -= 1
+
+def prefetch_wanted(channel_key, url):
+    """Kimse poll etmiyorsa kanalı ön-yükleme"""
+    if channel_key in _playlist_polls:
+        return True
+    _prefetched.pop(url, None)
+    metrics['prefetch_skipped'] += 1
+    return False
+
+def prefetch_done(url, size):
+    """Tamamlanan ön-yüklemeyi bütçeye yaz"""
+    metrics['prefetch_bytes'] += size
+    entry = _prefetched.get(url)
+    if entry is not None:
+        entry[0] = size
+        _prefetch_state['bytes'] += size
+
+def _prune_prefetched():
+    """Önbellek ömrünü aşmış ön-yükleme kayıtlarını bütçeden düş"""
+    limit = time.time() - SEGMENT_CACHE_TTL
+    while _prefetched:
+        url, (size, started) = next(iter(_prefetched.items()))
+        if started > limit:
+            break
+        del _prefetched[url]
+        _prefetch_state['bytes'] -= size
+
+def mark_prefetch_used(url):
+    """İstemci ön-yüklenen segmenti istedi"""
+    entry = _prefetched.pop(url, None)
+    if entry is not None:
+        metrics['prefetch_hits'] += 1
+        _prefetch_state['bytes'] -= entry[0]
+
+DEFAULT_M3U_HEADERS = {"User-Agent": "Mozilla/5.0", "Referer": "https://vavoo.to/", "Origin": "https://vavoo.to"}
+TS_HEADERS = {
+    'Cache-Control': 'public, max-age=3600',
+    'X-Accel-Buffering': 'no',
+    'Accept-Ranges': 'bytes'
+}
+
+# PERFORMANS İYİLEŞTİRMESİ: HTTP Range / HEAD - yarım kalan segment baştan indirilmez
+MAX_RANGES = 16  # daha fazla aralıklı istek tam yanıtla karşılanır
+BYTERANGES_BOUNDARY = 'streamflow-byteranges'
+
+def parse_range(value, size):
+    """Range başlığını [(başlangıç, bitiş hariç)] listesine çevir.
+    None: başlık yok/geçersiz (tam yanıt), []: hiçbir aralık karşılanamaz (416)"""
+    if not value or not value.startswith('bytes='):
+        return None
+    specs = value[6:].split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+    ranges = []
+    for spec in specs:
+        first, sep, last = spec.strip().partition('-')
+        if not sep or not (first or last):
+            return None
+        try:
+            if not first:
+                # bytes=-n: son n byte
+                n = int(last)
+                if n > 0:
+                    ranges.append((max(size - n, 0), size))
+                continue
+            start = int(first)
+            end = int(last) + 1 if last else size
+        except ValueError:
+            return None
+        if start < 0 or (last and end <= start):
+            return None
+        if start < size:
+            ranges.append((start, min(end, size)))
+    return ranges
+
+def range_plan(value, size, content_type):
+    """Boyutu bilinen gövde için yanıt planı: (status, headers, parts).
+    parts: gönderilecek (başlangıç, bitiş) dilimleri ve multipart ayraçları (bytes)"""
+    ranges = parse_range(value, size)
+    if ranges is None:
+        return 200, {'Content-Type': content_type, 'Content-Length': str(size)}, [(0, size)]
+    if not ranges:
+        return 416, {'Content-Range': f'bytes */{size}', 'Content-Length': '0'}, []
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        return 206, {
+            'Content-Type': content_type,
+            'Content-Length': str(end - start),
+            'Content-Range': f'bytes {start}-{end - 1}/{size}'
+        }, ranges
+    parts, length = [], 0
+    for start, end in ranges:
+        head = (f"\r\n--{BYTERANGES_BOUNDARY}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n").encode()
+        parts += (head, (start, end))
+        length += len(head) + end - start
+    parts.append(f"\r\n--{BYTERANGES_BOUNDARY}--\r\n".encode())
+    return 206, {
+        'Content-Type': f'multipart/byteranges; boundary={BYTERANGES_BOUNDARY}',
+        'Content-Length': str(length + len(parts[-1]))
+    }, parts
+
+def range_pieces(body, parts):
+    """Plan parçalarını gövde dilimlerine çevir (body: memoryview ya da bytes)"""
+    return [p if isinstance(p, bytes) else body[p[0]:p[1]] for p in parts]
+
+def passthrough_headers(upstream_headers):
+    """Upstream'e iletilen Range/HEAD isteğinin yanıt başlıkları"""
+    headers = dict(TS_HEADERS)
+    content_type = upstream_headers.get('Content-Type', '')
+    headers['Content-Type'] = content_type if content_type.startswith('multipart/') else 'video/mp2t'
+    if upstream_headers.get('Content-Range'):
+        headers['Content-Range'] = upstream_headers['Content-Range']
+    # Sıkıştırılmış gövde açılarak aktarılır - uzunluk bilinmez
+    if upstream_headers.get('Content-Length') and not upstream_headers.get('Content-Encoding'):
+        headers['Content-Length'] = upstream_headers['Content-Length']
+    return headers
+
+def request_headers(base=None):
+    """Flask isteğinin upstream header seti (bkz. parse_headers)"""
+    return parse_headers(request.args, base)
+
+def parse_headers(args, base=None):
+    """Query parametrelerinden upstream header setini çöz: hs token'ı veya eski h_ parametreleri.
+
+    base verilmezse ve istek sadece hs token'ı taşıyorsa paylaşılan (salt okunur)
+    dict döner - segment yolunda parse yapılmaz. base verilirse onun üzerine yazılır.
+    """
+    with tracing.span('headers'):
+        return _parse_headers(args, base)
+
+def _parse_headers(args, base):
+    token = args.get('hs')
+    if token:
+        hs = hls_rewriter.header_sets.get(token)  # geçersiz token: InvalidHeaderToken -> 400
+        if base is None and len(args) - ('br' in args) <= 2:
+            return hs
+        elif base is None:
+            base = dict(hs)
+        else:
+            base.update(hs)
+    if base is None:
+        base = {}
+    for k, v in args.items():
+        if k.startswith('h_'):
+            base[unquote(k[2:]).replace("_", "-")] = unquote(v).strip()
+    return base
+
+@app.errorhandler(hls_rewriter.InvalidHeaderToken)
+def invalid_header_token(e):
+    # Yanlış header'larla upstream'e gitmek yerine: istemci URL'yi yeniden almalı
+    logger.warning(f"Rejected header set token: {e}")
+    return f"Invalid header token: {e}", 400
+
+def normalize_stream_url(url):
+    """Bilinen site URL'lerini çözülebilir embed sayfasına çevir"""
+    url = url.replace('/stream/stream-', '/embed/stream-')
+    pm = re.search(r'/premium(\d+)/mono\.m3u8$', url)
+    if pm:
+        url = f"https://daddylive.dad/embed/stream-{pm.group(1)}.php"
+    return url
+
+def resolve_playlist_body(resolved_url, headers):
+    """/proxy/resolve yanıtı - tek girişli M3U"""
+    hq = hls_rewriter.header_query(tuple(headers.items()))
+    return f"#EXTM3U\n#EXTINF:-1,Stream\n/proxy/m3u?url={quote(resolved_url)}&{hq}"
+
+def m3u_response(version):
+    """Flask isteği için playlist yanıtı (If-None-Match / Accept-Encoding'e göre)"""
+    status, data, headers = playlist_response(version, request.headers.get('If-None-Match'),
+                                              request.headers.get('Accept-Encoding'))
+    return Response(data, status=status, headers=headers, content_type="application/vnd.apple.mpegurl")
+
 @app.route('/proxy/m3u')
 def proxy_m3u():
     """Ultra-fast M3U8 proxy with caching"""
@@ -487,62 +2318,36 @@ def proxy_m3u():
     metrics['total_requests'] += 1
 
     # Headers
-    h = {"User-Agent": "Mozilla/5.0", "Referer": "https://vavoo.to/", "Origin": "https://vavoo.to"}
-    for k, v in request.args.items():
-        if k.startswith('h_'):
-            h[unquote(k[2:]).replace("_", "-")] = unquote(v).strip()
+    h = request_headers(dict(DEFAULT_M3U_HEADERS))
 
     # URL transform
-    url = url.replace('/stream/stream-', '/embed/stream-')
-    pm = re.search(r'/premium(\d+)/mono\.m3u8$', url)
-    if pm:
-        url = f"https://daddylive.dad/embed/stream-{pm.group(1)}.php"
+    url = normalize_stream_url(url)
 
     try:
-        metrics['active_streams'] += 1
-        
-        # PERFORMANS İYİLEŞTİRMESİ: Önbellekli çözümleme kullan
-        result = get_cached_resolve(url, h)
-        if not result["resolved_url"]:
-            return "Failed to resolve", 500
+        ll = ll_request(request.args)
+    except ValueError as e:
+        return f"Invalid LL-HLS request: {e}", 400
 
-        s = get_session()
-        resp = s.get(result["resolved_url"], headers=result["headers"], timeout=(2, 8))
-        content = resp.text
-        final = resp.url
-
-        # Direkt M3U ise döndür
-        if "#EXTM3U" in content[:100] and "#EXTINF" not in content[:300]:
-            return Response(content, content_type="application/vnd.apple.mpegurl")
-
-        # M3U8 rewrite
-        parsed = urlparse(final)
-        base = f"{parsed.scheme}://{parsed.netloc}{parsed.path.rsplit('/', 1)[0]}/"
-        hq = "&".join([f"h_{quote(k)}={quote(v)}" for k, v in result["headers"].items()])
-
-        lines = []
-        for line in content.split('\n'):
-            line = line.strip()
-            if not line:
-                lines.append(line)
-            elif line.startswith("#EXT-X-KEY"):
-                # Key rewrite
-                m = re.search(r'URI="([^"]+)"', line)
-                if m:
-                    line = line.replace(m.group(1), f"/proxy/key?url={quote(m.group(1))}&{hq}")
-                lines.append(line)
-            elif line[0] != '#':
-                # Segment rewrite
-                seg = urljoin(base, line)
-                lines.append(f"/proxy/ts?url={quote(seg)}&{hq}")
+    try:
+        with active_stream():
+            # PERFORMANS İYİLEŞTİRMESİ: Önbellekli çözümleme kullan
+            result = get_cached_resolve(url, h)
+            if not result["resolved_url"]:
+                return "Failed to resolve", 500
+
+            if ll is not None:
+                # PERFORMANS İYİLEŞTİRMESİ: LL-HLS blocking reload - upstream ucu ilerleyince yanıtla
+                status, body = get_live_playlist(result["resolved_url"], result["headers"], *ll)
+                if status != 200:
+                    return body, status
             else:
-                lines.append(line)
+                # PERFORMANS İYİLEŞTİRMESİ: Önbellekli playlist (eşzamanlı istekler tek upstream yenilemesi paylaşır)
+                body = get_cached_playlist(result["resolved_url"], result["headers"])
 
-        metrics['active_streams'] -= 1
-        return Response('\n'.join(lines), content_type="application/vnd.apple.mpegurl")
+        # PERFORMANS İYİLEŞTİRMESİ: Değişmeyen playlist 304, gövde sürüm başına bir kez sıkıştırılır
+        return m3u_response(playlist_version(resolve_cache_key(result["resolved_url"], result["headers"]), body))
 
     except Exception as e:
-        metrics['active_streams'] -= 1
         logger.error(f"M3U error: {e}")
         return f"Error: {e}", 500
 
@@ -555,10 +2360,7 @@ def proxy_resolve():
 
     metrics['total_requests'] += 1
 
-    h = {}
-    for k, v in request.args.items():
-        if k.startswith('h_'):
-            h[unquote(k[2:]).replace("_", "-")] = unquote(v).strip()
+    h = request_headers({})
 
     try:
         # PERFORMANS İYİLEŞTİRMESİ: Önbellekli çözümleme kullan
@@ -566,12 +2368,8 @@ def proxy_resolve():
         if not result["resolved_url"]:
             return "Failed", 500
             
-        hq = "&".join([f"h_{quote(k)}={quote(v)}" for k, v in result["headers"].items()])
-        
-        return Response(
-            f"#EXTM3U\n#EXTINF:-1,Stream\n/proxy/m3u?url={quote(result['resolved_url'])}&{hq}",
-            content_type="application/vnd.apple.mpegurl"
-        )
+        body = resolve_playlist_body(result['resolved_url'], result["headers"])
+        return m3u_response(playlist_version(f"resolve:{result['resolved_url']}", body))
     except Exception as e:
         return f"Error: {e}", 500
 
@@ -581,83 +2379,1264 @@ def proxy_ts():
     url = request.args.get('url', '').strip()
     if not url:
         return "No URL", 400
+    byterange = request.args.get('br')
+    if byterange and not BYTERANGE_RE.match(byterange):
+        return "Bad byte range", 400
+    key = segment_key(url, byterange)
 
-    h = {}
-    for k, v in request.args.items():
-        if k.startswith('h_'):
-            h[unquote(k[2:]).replace("_", "-")] = unquote(v).strip()
+    h = request_headers()
 
     try:
-        s = get_session()
-        resp = s.get(url, headers=h, stream=True, timeout=(2, 20))
-        
-        def generate():
-            try:
-                # PERFORMANS İYİLEŞTİRMESİ: Daha büyük chunk boyutu (128KB)
-                for chunk in resp.iter_content(chunk_size=131072):  # 65536'dan 131072'ye
-                    if chunk:
-                        yield chunk
-            finally:
-                try:
-                    resp.close()
-                except:
-                    pass
-        
+        # PERFORMANS İYİLEŞTİRMESİ: Önce paylaşılan segment önbelleği
+        if _prefetched:
+            mark_prefetch_used(key)
+        cached = segment_cache.acquire(key)
+        if cached is not None:
+            data, content_type, _ = cached
+            metrics['segment_cache_hits'] += 1
+            return stored_response(url, data, content_type, 'cache')
+
+        # Disk deposu: mmap'lenmiş dosya, sayfa önbelleğinden gönderilir
+        if disk_store is not None:
+            data = disk_store.open(key)
+            if data is not None:
+                return stored_response(url, data, 'video/mp2t', 'disk')
+
+        client_range = request.headers.get('Range')
+        if request.method == 'HEAD':
+            if byterange:
+                # Alt aralığın boyutu biliniyor - upstream'e gitmeye gerek yok
+                _, (start, end) = split_segment_key(key)
+                status, headers, _ = range_plan(client_range, end - start, 'video/mp2t')
+                return Response([], status=status, headers=dict(TS_HEADERS, **headers))
+            return upstream_passthrough(url, h, 'HEAD', client_range)
+        if client_range and not byterange:
+            # Önbellekte yok: aralık upstream'e iletilir (alt aralık segmentlerinde
+            # Range yok sayılır - tam alt aralık bir kez indirilip paylaşılır)
+            return upstream_passthrough(url, h, 'GET', client_range)
+
+        # Aynı segment için tek upstream indirmesi
+        fetch, leader = get_segment_fetch(key, h)
+        if leader:
+            metrics['segment_cache_misses'] += 1
+        else:
+            metrics['segment_coalesced'] += 1
+
+        if not fetch.wait_headers():
+            fetch.detach()
+            if isinstance(fetch.error, admission.Overloaded):
+                return overloaded_response(fetch.error)
+            return f"Error: {fetch.error or 'upstream timeout'}", 500
+
+        headers = TS_HEADERS
+        if fetch.length:
+            headers = dict(TS_HEADERS, **{'Content-Length': str(fetch.length)})
         return Response(
-            generate(),
-            content_type="video/mp2t",
-            headers={
-                'Cache-Control': 'public, max-age=3600',
-                'X-Accel-Buffering': 'no'
-            }
+            relay_stream(url, fetch.iter_chunks(), 'upstream' if leader else 'coalesced'),
+            status=fetch.status,
+            content_type=fetch.content_type,
+            headers=headers
         )
+    except admission.Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         return f"Error: {e}", 500
 
+def stored_response(url, data, content_type, source):
+    """Hazır segment yanıtı (Range/HEAD dahil) - memoryview dilimleri, pywsgi doğrudan
+    sendall ile gönderir (kopya yok)"""
+    status, headers, parts = range_plan(request.headers.get('Range'), len(data), content_type)
+    headers = dict(TS_HEADERS, **headers)
+    if request.method == 'HEAD' or not parts:
+        data.release()
+        return Response([], status=status, headers=headers)
+    return Response(
+        relay_stream(url, range_pieces(data.view(), parts), source, data.release),
+        status=status,
+        headers=headers
+    )
+
+def upstream_passthrough(url, headers, method, client_range=None):
+    """Önbellekte olmayan segment için HEAD/Range isteğini upstream'e ilet"""
+    if client_range:
+        headers = dict(headers, Range=client_range)
+    s = get_session()
+    slot = admit(url)
+    if method == 'HEAD':
+        try:
+            resp = s.head(url, headers=headers, timeout=(2, 5), allow_redirects=True)
+            resp.close()
+        finally:
+            release_slot(slot)
+        return Response([], status=resp.status_code, headers=passthrough_headers(resp.headers))
+    try:
+        resp = s.get(url, headers=headers, stream=True, timeout=(2, 20))
+    except Exception:
+        release_slot(slot)
+        raise
+    # Slot, istemci akışı bitene (ya da yavaş istemci koparılana) kadar tutulur
+    return Response(
+        relay_stream(url, _upstream_chunks(resp), 'range', lambda: release_slot(slot)),
+        status=resp.status_code,
+        headers=passthrough_headers(resp.headers)
+    )
+
+def _upstream_chunks(resp):
+    started = time.time() - resp.elapsed.total_seconds()
+    received = 0
+    try:
+        for chunk in resp.iter_content(chunk_size=SEGMENT_CHUNK_SIZE):
+            if chunk:
+                received += len(chunk)
+                yield chunk
+        observe_upstream_total(resp.url, started, received)
+    finally:
+        resp.close()
+
+def relay_stream(url, pieces, source, release=None):
+    """Parçaları istemciye aktar; bitince buffer'ı bırak ve akış istatistiğini kaydet"""
+    start = time.time()
+    sent = 0
+    pace = ClientPace()
+    try:
+        with active_stream():
+            for piece in pieces:
+                sent += len(piece)
+                written = time.time()
+                yield piece  # pywsgi parçayı istemciye yazdıktan sonra döner
+                if pace.wrote(len(piece), time.time() - written):
+                    raise SlowClientError()
+    finally:
+        close = getattr(pieces, 'close', None)
+        if close is not None:
+            close()
+        if release is not None:
+            release()
+        record_stream(url, sent, time.time() - start, source)
+
+# PERFORMANS İYİLEŞTİRMESİ: /proxy/live - kanal başına tek upstream çekici, aboneler halka buffer'dan okur
+# HLS oynatamayan IPTV istemcileri için sürekli MPEG-TS; segmentler HLS istemcileriyle aynı
+# playlist/segment önbelleğinden ve indirmelerden gelir
+LIVE_BUFFER_BYTES = int(os.environ.get('LIVE_BUFFER_MB', '16')) * 1024 * 1024  # kanal başına
+LIVE_IDLE_SECONDS = float(os.environ.get('LIVE_IDLE_SECONDS', '10'))  # son abone gidince çekici kapanır
+LIVE_START_TIMEOUT = 20  # ilk segment bu sürede gelmezse 502
+LIVE_READ_TIMEOUT = 30
+LIVE_HEADERS = {'Cache-Control': 'no-cache, no-store'}
+BANDWIDTH_RE = re.compile(r'[:,]BANDWIDTH=(\d+)')
+ENCRYPTED_RE = re.compile(r'^#EXT-X-KEY:(?!.*METHOD=NONE)', re.M)
+_live_channels = {}  # resolve_cache_key -> LiveChannel
+_live_lock = threading.Lock()
+
+class LiveStreamError(ValueError):
+    """Kanal sürekli TS olarak yayınlanamaz (şifreli, fMP4 vb.)"""
+
+def _proxied_url(line):
+    """/proxy/ts ya da /proxy/m3u satırından upstream URL'si (br= varsa segment anahtarı)"""
+    query = parse_qs(line.partition('?')[2])
+    url = query['url'][0]
+    if 'br' in query:
+        return segment_key(url, query['br'][0])
+    return url
+
+def live_variant(body):
+    """Master playlist ise en yüksek BANDWIDTH'li varyantın upstream URL'si, değilse None"""
+    best, variant, bandwidth = None, False, 0
+    for line in body.split('\n'):
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            m = BANDWIDTH_RE.search(line)
+            bandwidth = int(m.group(1)) if m else 0
+            variant = True
+        elif variant and line.startswith('/proxy/m3u?'):
+            if best is None or bandwidth > best[0]:
+                best = (bandwidth, _proxied_url(line))
+            variant = False
+    return best[1] if best else None
+
+def live_segments(body):
+    """Yeniden yazılmış media playlist'ten ([(MSN, segment anahtarı)], TARGETDURATION)"""
+    if not body.startswith('#EXTM3U'):
+        raise ValueError("upstream did not return a playlist")
+    if ENCRYPTED_RE.search(body):
+        raise LiveStreamError("encrypted stream - use /proxy/m3u")
+    if '#EXT-X-MAP:' in body:
+        raise LiveStreamError("fragmented MP4 stream - use /proxy/m3u")
+    m = MEDIA_SEQUENCE_RE.search(body)
+    msn = int(m.group(1)) if m else 0
+    segments = []
+    for line in body.split('\n'):
+        if line.startswith('/proxy/ts?'):
+            segments.append((msn, _proxied_url(line)))
+        if line and line[0] != '#':
+            msn += 1
+    m = TARGET_DURATION_RE.search(body)
+    return segments, float(m.group(1)) if m else PLAYLIST_DEFAULT_TTL
+
+class LiveBroadcast:
+    """/proxy/live kanalı: tek çekicinin yazdığı byte bütçeli halka buffer (chunk kuyruğu).
+
+    Her abonenin kendi imleci (chunk sırası) vardır; buffer'dan düşmüş imleç en yeni
+    segmentin başına atlar - yavaş abone diğerlerini ve çekiciyi bekletmez.
+    """
+
+    def _init_broadcast(self, key, url, headers):
+        self.key = key
+        self.url = url
+        self.headers = headers
+        self.chunks = deque()  # bytes (abonelerle paylaşılır, değişmez)
+        self.first = 0  # en eski chunk'ın sırası
+        self.next = 0  # yazılacak chunk'ın sırası
+        self.bytes = 0
+        self.segment_start = 0  # en yeni segmentin ilk chunk'ı
+        self.next_msn = None  # sıradaki indirilecek segment
+        self.subscribers = 0
+        self.idle_since = time.time()
+        self.started = time.time()
+        self.closed = False
+        self.error = None
+
+    def _append(self, data, segment_start):
+        if segment_start:
+            self.segment_start = self.next
+        self.chunks.append(data)
+        self.next += 1
+        self.bytes += len(data)
+        while self.bytes > LIVE_BUFFER_BYTES and len(self.chunks) > 1:
+            self.bytes -= len(self.chunks.popleft())
+            self.first += 1
+        metrics['live_bytes'] += len(data)
+
+    def _read(self, cursor):
+        """cursor'dan itibaren hazır chunk'lar ve yeni cursor"""
+        if cursor < self.first:
+            metrics['live_skips'] += 1
+            cursor = max(self.segment_start, self.first)
+        chunks = list(itertools.islice(self.chunks, cursor - self.first, None))
+        return chunks, cursor + len(chunks)
+
+    def start_cursor(self):
+        """Yeni abone en yeni segmentin başından başlar (TS paket sınırı)"""
+        return max(self.segment_start, self.first)
+
+    def pending(self, segments):
+        """Playlist'te henüz yazılmamış segmentler; ilk turda, MSN sıfırlanınca ya da
+        çekici geride kalınca canlı uçtaki segmentten devam edilir"""
+        if not segments:
+            return []
+        first, last = segments[0][0], segments[-1][0]
+        if self.next_msn is None or self.next_msn < first or self.next_msn > last + 1:
+            self.next_msn = last
+        return [seg for seg in segments if seg[0] >= self.next_msn]
+
+    def join(self):
+        self.subscribers += 1
+
+    def leave(self):
+        with _live_lock:
+            self.subscribers -= 1
+            if not self.subscribers:
+                self.idle_since = time.time()
+
+    def expire(self):
+        """Abonesiz kalma süresi dolduysa kanalı kapat ve kayıttan sil (abone eklemeyle atomik)"""
+        with _live_lock:
+            if self.subscribers or time.time() - self.idle_since < LIVE_IDLE_SECONDS:
+                return False
+            self.closed = True
+            self.unregister()
+            return True
+
+    def unregister(self):
+        if _live_channels.get(self.key) is self:
+            del _live_channels[self.key]
+
+    def failed(self, error):
+        """Çekici hatası: kalıcıysa ya da hiç veri gelmeden başlangıç süresi dolduysa True"""
+        metrics['live_errors'] += 1
+        self.error = error
+        logger.warning(f"Live channel error: {error}")
+        return isinstance(error, LiveStreamError) or (not self.next and time.time() - self.started > LIVE_START_TIMEOUT)
+
+    def poll_interval(self, target):
+        return max(target / 2, 0.5)
+
+class LiveChannel(LiveBroadcast):
+    def __init__(self, key, url, headers):
+        self._init_broadcast(key, url, headers)
+        self._cond = threading.Condition()
+
+    def write(self, data, segment_start=False):
+        with self._cond:
+            self._append(data, segment_start)
+            self._cond.notify_all()
+
+    def read(self, cursor, timeout=LIVE_READ_TIMEOUT):
+        with self._cond:
+            if cursor >= self.next and not self.closed:
+                self._cond.wait_for(lambda: self.next > cursor or self.closed, timeout)
+            return self._read(cursor)
+
+    def wait_ready(self, timeout=LIVE_START_TIMEOUT):
+        with self._cond:
+            self._cond.wait_for(lambda: self.next or self.closed, timeout)
+        return self.next > 0
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def run(self):
+        """Çekici: playlist'i izle, her yeni segmenti bir kez indirip buffer'a yaz"""
+        try:
+            while not self.expire():
+                target = PLAYLIST_DEFAULT_TTL
+                try:
+                    segments, target, headers = self._playlist()
+                    for msn, key in self.pending(segments):
+                        self._pull_segment(key, headers)
+                        self.next_msn = msn + 1
+                except Exception as e:
+                    if self.failed(e):
+                        return
+                time.sleep(self.poll_interval(target))
+        finally:
+            with _live_lock:
+                self.unregister()
+            self.close()
+
+    def _playlist(self):
+        result = get_cached_resolve(self.url, self.headers)
+        if not result["resolved_url"]:
+            raise ValueError("failed to resolve")
+        headers = result["headers"]
+        body = get_cached_playlist(result["resolved_url"], headers)
+        variant = live_variant(body)
+        if variant is not None:
+            body = get_cached_playlist(variant, headers)
+        return live_segments(body) + (headers,)
+
+    def _pull_segment(self, key, headers):
+        metrics['live_segments'] += 1
+        cached = segment_cache.acquire(key)
+        if cached is not None:
+            data = cached[0]
+            try:
+                view = data.view()
+                for start in range(0, len(view), SEGMENT_CHUNK_SIZE):
+                    self.write(bytes(view[start:start + SEGMENT_CHUNK_SIZE]), start == 0)
+            finally:
+                data.release()
+            return
+        # HLS istemcileriyle aynı indirmeye katıl (ya da başlat)
+        fetch, _ = get_segment_fetch(key, headers)
+        if not fetch.wait_headers() or fetch.status != 200:
+            fetch.detach()
+            raise ValueError(f"segment fetch failed: {fetch.error or fetch.status}")
+        first = True
+        for piece in fetch.iter_chunks():
+            self.write(bytes(piece), first)
+            first = False
+
+def join_live_channel(url, headers):
+    """Kanalın çalışan yayınına abone ol, yoksa çekiciyi başlat"""
+    key = resolve_cache_key(url, headers)
+    with _live_lock:
+        channel = _live_channels.get(key)
+        if channel is None or channel.closed:
+            channel = _live_channels[key] = LiveChannel(key, url, headers)
+            spawn(channel.run)
+        channel.join()
+    return channel
+
+def live_pieces(channel):
+    """Abonenin chunk akışı (kendi imleciyle)"""
+    cursor = channel.start_cursor()
+    try:
+        while True:
+            chunks, cursor = channel.read(cursor)
+            if not chunks and channel.closed:
+                return
+            yield from chunks
+    finally:
+        channel.leave()
+
+def live_stats():
+    channels = list(_live_channels.values())
+    return {
+        "channels": len(channels),
+        "subscribers": sum(ch.subscribers for ch in channels),
+        "buffer_bytes": sum(ch.bytes for ch in channels),
+        "segments": metrics['live_segments'],
+        "bytes": metrics['live_bytes'],
+        "skips": metrics['live_skips'],
+        "errors": metrics['live_errors']
+    }
+
+@app.route('/proxy/live')
+def proxy_live():
+    """Sürekli MPEG-TS yayını - kanal başına tek upstream çekici, tüm aboneler paylaşır"""
+    url = request.args.get('url', '').strip()
+    if not url:
+        return "No URL", 400
+
+    metrics['total_requests'] += 1
+    h = request_headers(dict(DEFAULT_M3U_HEADERS))
+    url = normalize_stream_url(url)
+
+    channel = join_live_channel(url, h)
+    if not channel.wait_ready():
+        channel.leave()
+        return f"Error: {channel.error or 'no data from upstream'}", 502
+    return Response(relay_stream(url, live_pieces(channel), 'live'), content_type='video/mp2t',
+                    headers=LIVE_HEADERS)
+
+# PERFORMANS İYİLEŞTİRMESİ: Toplu M3U dönüştürme ve toplu resolve
+# Binlerce girişli IPTV listeleri satır satır okunup yazılır (liste belleğe alınmaz); istenirse
+# girişler sınırlı bir havuzda eşzamanlı çözülür ve _resolve_cache /proxy/m3u'nun anahtarıyla ısınır
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '16'))  # iş başına eşzamanlı resolve
+BATCH_MAX_URLS = int(os.environ.get('BATCH_MAX_URLS', '5000'))  # /api/resolve/batch istek başına
+BATCH_JOBS_KEPT = 50  # ilerlemesi sorgulanabilen son işler
+BATCH_ERRORS_KEPT = 20  # iş başına saklanan son hatalar
+BATCH_WRITE_BYTES = 65536  # dönüştürülen liste bu boyutta parçalarla yazılır
+M3U_FETCH_TIMEOUT = (5, 30)
+MEDIA_EXTENSIONS = ('.ts', '.mp4', '.mkv', '.avi', '.aac', '.mp3')  # HLS değil - girişe dokunulmaz
+VLC_HEADER_OPTS = {'http-user-agent': 'User-Agent', 'http-referrer': 'Referer', 'http-referer': 'Referer',
+                   'http-origin': 'Origin'}
+_batch_jobs = OrderedDict()  # id -> BatchJob
+
+class BatchJob:
+    """Toplu işin ilerlemesi (/api/batch/<id>); id worker'lar arasında da tekildir"""
+
+    def __init__(self, kind, total=None):
+        self.id = os.urandom(6).hex()
+        self.kind = kind  # 'm3u' | 'resolve'
+        self.total = total  # M3U akışında baştan bilinmez
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.started = time.time()
+        self.finished = None
+        self.errors = deque(maxlen=BATCH_ERRORS_KEPT)
+        self.results = None
+        _batch_jobs[self.id] = self
+        while len(_batch_jobs) > BATCH_JOBS_KEPT:
+            _batch_jobs.popitem(last=False)
+
+    def resolved(self, url, error):
+        self.done += 1
+        metrics['batch_entries'] += 1
+        if error is not None:
+            self.failed += 1
+            metrics['batch_failed'] += 1
+            self.errors.append({"url": url, "error": error})
+
+    def finish(self):
+        if self.finished is None:
+            self.finished = time.time()
+
+    def progress(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": "running" if self.finished is None else "done",
+            "total": self.total,
+            "done": self.done,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "seconds": round((self.finished or time.time()) - self.started, 3),
+            "errors": list(self.errors)
+        }
+
+def bounded_map(fn, items, size):
+    """fn'i items üzerinde en çok size eşzamanlı çalıştır, sonuçları girdi sırasıyla ver.
+
+    items tembel okunur - aynı anda en çok size giriş bellekte/işte bulunur. fn hata yükseltmemeli.
+    gevent modunda greenlet'ler, asyncio modunda iş başına thread havuzu kullanılır.
+    """
+    window = deque()
+    executor = None if SERVER_MODE == 'gevent' else ThreadPoolExecutor(size, thread_name_prefix='batch')
+    try:
+        for item in items:
+            window.append(gevent.spawn(fn, item) if executor is None else executor.submit(fn, item))
+            if len(window) >= size:
+                task = window.popleft()
+                yield task.get() if executor is None else task.result()
+        while window:
+            task = window.popleft()
+            yield task.get() if executor is None else task.result()
+    finally:
+        # Yarıda bırakılırsa çalışan resolve'lar tamamlanır (sonuçları önbelleğe yine yazılır)
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def resolve_entry(job, url, headers):
+    """Girişi /proxy/m3u ile aynı header seti ve önbellek anahtarıyla çöz"""
+    started = time.time()
+    h = dict(DEFAULT_M3U_HEADERS)
+    h.update(headers)
+    url = normalize_stream_url(url)
+    try:
+        resolved = get_cached_resolve(url, h)["resolved_url"]
+        error = None if resolved else "failed to resolve"
+    except Exception as e:
+        resolved, error = None, str(e)
+    job.resolved(url, error)
+    entry = {"url": url, "ok": error is None, "ms": round((time.time() - started) * 1000, 1)}
+    if error is None:
+        entry["resolved_url"] = resolved
+    else:
+        entry["error"] = error
+    return entry
+
+def batch_items(payload):
+    """POST gövdesi -> [(url, headers)]: {"urls": [url | {"url", "headers"}], "headers": {...}}
+    ya da düz liste; geçersizse ValueError"""
+    if isinstance(payload, list):
+        payload = {"urls": payload}
+    if not isinstance(payload, dict) or not isinstance(payload.get("urls"), list):
+        raise ValueError('expected {"urls": [...]}')
+    common = payload.get("headers") or {}
+    if not isinstance(common, dict):
+        raise ValueError("headers must be an object")
+    if len(payload["urls"]) > BATCH_MAX_URLS:
+        raise ValueError(f"too many urls (max {BATCH_MAX_URLS})")
+    items = []
+    for item in payload["urls"]:
+        headers = common
+        if isinstance(item, dict):
+            extra = item.get("headers") or {}
+            if not isinstance(extra, dict):
+                raise ValueError("headers must be an object")
+            headers = dict(common, **extra)
+            item = item.get("url")
+        if not isinstance(item, str) or not item.strip():
+            raise ValueError("every entry needs a url")
+        items.append((item.strip(), {str(k): str(v).strip() for k, v in headers.items()}))
+    return items
+
+def resolve_batch(items, job):
+    """Girişleri BATCH_CONCURRENCY'lik havuzda çöz; sonuçlar giriş sırasıyla job.results'ta"""
+    try:
+        job.results = list(bounded_map(lambda item: resolve_entry(job, *item), items, BATCH_CONCURRENCY))
+    finally:
+        job.finish()
+    return job.results
+
+def open_m3u(url, headers):
+    """Uzak listeyi akış olarak aç (satır generator'ı); upstream hatasında ValueError"""
+    resp = get_session().get(url, headers=headers, stream=True, timeout=M3U_FETCH_TIMEOUT)
+    if resp.status_code >= 400:
+        resp.close()
+        raise ValueError(f"upstream returned {resp.status_code}")
+    return _response_lines(resp)
+
+def _response_lines(resp):
+    try:
+        yield from resp.iter_lines(chunk_size=BATCH_WRITE_BYTES)
+    finally:
+        resp.close()
+
+def m3u_entries(lines):
+    """M3U satırlarından (ön satırlar, URL satırı, URL, header'lar) girişleri.
+
+    Header'lar #EXTVLCOPT:http-user-agent/referrer/origin ve Kodi tarzı "url|User-Agent=..."
+    ekinden okunur; listenin sonundaki URL'siz satırlar (satırlar, None, None, None) olarak gelir.
+    """
+    meta = []
+    headers = {}
+    for raw in lines:
+        line = (raw.decode('utf-8', 'replace') if isinstance(raw, bytes) else raw).lstrip('\ufeff').strip()
+        if not line:
+            continue
+        if line[0] == '#':
+            meta.append(line)
+            if line.startswith('#EXTVLCOPT:'):
+                name, _, value = line[11:].partition('=')
+                header = VLC_HEADER_OPTS.get(name.strip().lower())
+                if header:
+                    headers[header] = value.strip()
+            continue
+        url, _, extra = line.partition('|')
+        for param in extra.split('&') if extra else ():
+            name, _, value = param.partition('=')
+            if name.strip():
+                headers[unquote(name).strip()] = unquote(value).strip()
+        yield meta, line, url.strip(), headers
+        meta, headers = [], {}
+    if meta:
+        yield meta, None, None, None
+
+def proxied_entry_url(base, url, headers):
+    """Girişin /proxy/m3u adresi - kalıcı listelerde yeniden başlatmadan etkilenmemesi için
+    hs token'ı yerine h_ parametreleri kullanılır"""
+    hq = "".join(f"&h_{quote(k)}={quote(v, safe='')}" for k, v in headers.items())
+    return f"{base}proxy/m3u?url={quote(url, safe='')}{hq}"
+
+def convert_m3u(lines, base, job, resolve=False):
+    """M3U'yu proxy URL'lerine çevirerek parça parça üret (generator).
+
+    HLS/embed girişleri /proxy/m3u'ya yönlenir; http olmayan ve doğrudan medya girişleri
+    (MEDIA_EXTENSIONS) olduğu gibi kalır. resolve: girişler sırayla yazılırken havuzda çözülür.
+    """
+    def convert(entry):
+        meta, line, url, headers = entry
+        if url is None:
+            return meta
+        if (not url.startswith(('http://', 'https://'))
+                or urlparse(url).path.lower().endswith(MEDIA_EXTENSIONS)):
+            job.skipped += 1
+            return meta + [line]
+        if resolve:
+            resolve_entry(job, url, headers)
+        else:
+            job.resolved(url, None)
+        return meta + [proxied_entry_url(base, url, headers)]
+
+    entries = m3u_entries(lines)
+    converted = bounded_map(convert, entries, BATCH_CONCURRENCY) if resolve else map(convert, entries)
+    out = []
+    size = 0
+    try:
+        for entry_lines in converted:
+            for line in entry_lines:
+                out.append(line)
+                size += len(line) + 1
+            if size >= BATCH_WRITE_BYTES:
+                yield "\n".join(out) + "\n"
+                out, size = [], 0
+        if not out and not job.done and not job.skipped:
+            out.append("#EXTM3U")
+        out.append(f"# streamflow: entries={job.done} failed={job.failed} skipped={job.skipped}")
+        yield "\n".join(out) + "\n"
+    finally:
+        job.finish()
+
+def playlist_base(base, default):
+    """Dönüştürülen listedeki mutlak proxy adreslerinin kökü (ters proxy arkasında ?base= ile)"""
+    base = base or default
+    return base if base.endswith('/') else base + '/'
+
+def batch_job_payload(job_id=None):
+    """/api/batch yanıtı: son işler ya da tek iş (biten resolve işi sonuçlarıyla); iş yoksa None.
+    İşler onları başlatan worker'da tutulur"""
+    if job_id is None:
+        return [job.progress() for job in list(_batch_jobs.values())]
+    job = _batch_jobs.get(job_id)
+    if job is None:
+        return None
+    payload = job.progress()
+    if job.results is not None:
+        payload["results"] = job.results
+    return payload
+
+def batch_stats():
+    return {
+        "running": sum(1 for job in list(_batch_jobs.values()) if job.finished is None),
+        "jobs": len(_batch_jobs),
+        "entries": metrics['batch_entries'],
+        "failed": metrics['batch_failed'],
+        "concurrency": BATCH_CONCURRENCY
+    }
+
+@app.route('/proxy/playlist', methods=['GET', 'POST'])
+def proxy_playlist():
+    """Tüm M3U listesini proxy URL'lerine çevir (akış olarak): ?url= ile uzak liste ya da
+    POST gövdesi / multipart 'file' alanı. ?resolve=1 girişleri çözüp önbelleği ısıtır"""
+    metrics['total_requests'] += 1
+    if request.method == 'POST':
+        upload = request.files.get('file') if request.mimetype == 'multipart/form-data' else None
+        lines = upload.stream if upload is not None else request.stream
+    else:
+        url = request.args.get('url', '').strip()
+        if not url:
+            return "No URL", 400
+        try:
+            lines = open_m3u(url, request_headers({'User-Agent': 'Mozilla/5.0'}))
+        except (requests.RequestException, ValueError) as e:
+            return f"Error: {e}", 502
+
+    job = BatchJob('m3u')
+    base = playlist_base(request.args.get('base'), request.host_url)
+    resolve = request.args.get('resolve') == '1'
+    # stream_with_context: yüklenen dosya yanıt bitene kadar açık kalır
+    return Response(stream_with_context(convert_m3u(lines, base, job, resolve)),
+                    content_type="audio/x-mpegurl", headers={'X-Batch-Job': job.id})
+
+@app.route('/api/resolve/batch', methods=['POST'])
+def resolve_batch_api():
+    """Çok sayıda URL'yi tek istekte çöz; ?wait=0 işi arka planda başlatır (202 + iş id'si)"""
+    try:
+        items = batch_items(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    metrics['total_requests'] += 1
+    job = BatchJob('resolve', len(items))
+    if request.args.get('wait') == '0':
+        spawn(resolve_batch, items, job)
+        return jsonify(job.progress()), 202
+    resolve_batch(items, job)
+    return jsonify(dict(job.progress(), results=job.results))
+
+@app.route('/api/batch')
+@app.route('/api/batch/<job_id>')
+def batch_progress(job_id=None):
+    payload = batch_job_payload(job_id)
+    if payload is None:
+        return jsonify({"error": "unknown job"}), 404
+    return jsonify(payload)
+
+# PERFORMANS İYİLEŞTİRMESİ: AES key önbelleği - (key URI, header seti) başına, tek upstream isteği
+KEY_CACHE_SIZE = int(os.environ.get('KEY_CACHE_SIZE', '5000'))
+KEY_CACHE_TTL = int(os.environ.get('KEY_CACHE_TTL', '300'))  # saniye
+KEY_ERROR_TTL = float(os.environ.get('KEY_ERROR_TTL', '2'))  # 4xx/5xx yanıtlar (kesinti önbellekte takılmasın)
+KEY_CACHE_POLICY = os.environ.get('KEY_CACHE_POLICY', 'fixed')  # fixed | upstream (Cache-Control'e uy)
+KEY_MAX_BYTES = 65536  # daha büyük gövde key değildir, önbelleğe alınmaz
+KEY_CONTENT_TYPE = 'application/octet-stream'
+MAX_AGE_RE = re.compile(r'(?:^|,)\s*(?:s-maxage|max-age)\s*=\s*"?(\d+)')
+_key_cache = make_cache('key', KEY_CACHE_SIZE, KEY_CACHE_TTL)
+_key_flight = SingleFlight()
+
+def key_ttl(status, cache_control):
+    """Key yanıtının önbellek ömrü (0 = önbelleğe alma)"""
+    if status >= 400:
+        return KEY_ERROR_TTL
+    if KEY_CACHE_POLICY == 'upstream' and cache_control:
+        value = cache_control.lower()
+        if 'no-store' in value or 'no-cache' in value:
+            return 0
+        m = MAX_AGE_RE.search(value)
+        if m:
+            return int(m.group(1))
+    return KEY_CACHE_TTL
+
+def store_key(cache_key, status, body, cache_control):
+    """Upstream key yanıtını önbelleğe koy: ((status, body), ttl)"""
+    value = (status, bytes(body))
+    ttl = key_ttl(status, cache_control)
+    if ttl > 0 and len(value[1]) <= KEY_MAX_BYTES:
+        _key_cache.set(cache_key, value, ttl)
+        if status >= 400:
+            metrics['key_errors_cached'] += 1
+    return value, ttl
+
+def cached_key(cache_key):
+    """Önbellekteki key: ((status, body), kalan süre) ya da None"""
+    entry = _key_cache.get_entry(cache_key)
+    if entry is None:
+        return None
+    remaining = entry.ttl - (time.time() - entry.stored)
+    if remaining <= 0:
+        return None
+    metrics['key_cache_hits'] += 1
+    return entry.value, remaining
+
+def get_cached_key(url, headers):
+    """Key'i önbellekten ya da (eşzamanlı isteklerle paylaşılan) tek upstream isteğiyle al"""
+    cache_key = resolve_cache_key(url, headers)
+    with tracing.span('key') as span:
+        found = cached_key(cache_key)
+        if found is not None:
+            span.set(cache='hit')
+            return found
+        found, shared_call = _key_flight.do(cache_key, _fetch_key, cache_key, url, headers)
+        metrics['key_coalesced' if shared_call else 'key_cache_misses'] += 1
+        span.set(cache='coalesced' if shared_call else 'miss')
+        return found
+
+def _fetch_key(cache_key, url, headers):
+    s = get_session()
+    resp = s.get(url, headers=headers, timeout=(2, 5))
+    return store_key(cache_key, resp.status_code, resp.content, resp.headers.get('Cache-Control'))
+
+def key_response(value, remaining, range_header):
+    """Key yanıt planı: (status, headers, gövde parçaları)"""
+    status, body = value
+    if status >= 400:
+        return status, {'Content-Type': KEY_CONTENT_TYPE, 'Content-Length': str(len(body)),
+                        'Cache-Control': 'no-store'}, [body]
+    status, headers, parts = range_plan(range_header, len(body), KEY_CONTENT_TYPE)
+    headers['Accept-Ranges'] = 'bytes'
+    headers['Cache-Control'] = f"private, max-age={int(remaining)}" if remaining > 0 else 'no-store'
+    return status, headers, range_pieces(body, parts)
+
 @app.route('/proxy/key')
 def proxy_key():
-    """Fast key proxy"""
+    """Fast key proxy (önbellekli)"""
     url = request.args.get('url', '').strip()
     if not url:
         return "No URL", 400
 
-    h = {}
-    for k, v in request.args.items():
-        if k.startswith('h_'):
-            h[unquote(k[2:]).replace("_", "-")] = unquote(v).strip()
+    h = request_headers()
 
     try:
-        s = get_session()
-        resp = s.get(url, headers=h, timeout=(2, 5))
-        return Response(resp.content, content_type="application/octet-stream")
+        value, remaining = get_cached_key(url, h)
+        status, headers, pieces = key_response(value, remaining, request.headers.get('Range'))
+        if request.method == 'HEAD':
+            return Response([], status=status, headers=headers)
+        return Response(b''.join(pieces), status=status, headers=headers)
     except Exception as e:
         return f"Error: {e}", 500
 
+@app.before_request
+def _start_timer():
+    request.environ['streamflow.start'] = time.time()
+    if not request.path.startswith(TRACE_SKIP_PATHS):
+        request.environ['streamflow.trace'] = tracer.begin(request.method, request.full_path.rstrip('?'))
+
+@app.after_request
+def _observe_request(response):
+    start = request.environ.get('streamflow.start')
+    if start is not None:
+        rule = request.url_rule
+        REQUEST_SECONDS.observe((rule.rule if rule is not None else 'other', response.status_code),
+                                time.time() - start)
+    trace = request.environ.get('streamflow.trace')
+    if trace is not None:
+        rule = request.url_rule
+        trace.route = rule.rule if rule is not None else 'other'
+        trace.headers_at = time.perf_counter()
+        # Akış yanıtlarında gövde after_request'ten sonra gönderilir - iz yanıt kapanınca biter
+        response.call_on_close(lambda: tracer.finish(trace, response.status_code, response.content_length))
+    return response
+
 @app.route('/')
 def index():
     return render_template_string(HTML_TEMPLATE)
 
 @app.route('/api/stats')
 def stats():
+    return jsonify(cluster_stats())
+
+def stats_payload():
+    """/api/stats içeriği (her iki sunucu modu için)"""
     uptime = (time.time() - metrics['start_time']) / 3600
-    return jsonify({
+    return {
         "requests": metrics['total_requests'],
         "streams": metrics['active_streams'],
         "uptime": f"{uptime:.1f}",
-        "cache_hits": metrics['cache_hits']
-    })
+        "cache_hits": metrics['cache_hits'],
+        "resolve_coalesced": metrics['resolve_coalesced'],
+        "header_sets": len(hls_rewriter.header_sets),
+        "header_tokens": {"decoded": hls_rewriter.header_sets.decoded, "rejected": hls_rewriter.header_sets.rejected},
+        "resolve_cache": {
+            "entries": len(_resolve_cache),
+            "max_entries": _resolve_cache.maxsize,
+            "evictions": _resolve_cache.evictions,
+            "stale_served": metrics['resolve_stale_served'],
+            "refreshes": metrics['resolve_refreshes'],
+            "layers": {
+                name: {"hits": hits, "misses": misses, "entries": len(resolve_layers[name])}
+                for name, (hits, misses) in resolve_layer_counts.items()
+            }
+        },
+        "playlist_cache": {
+            "hits": metrics['playlist_cache_hits'],
+            "misses": metrics['playlist_cache_misses'],
+            "coalesced": metrics['playlist_coalesced'],
+            "entries": len(_playlist_cache),
+            "not_modified": metrics['playlist_not_modified'],
+            "compressed": metrics['playlist_compressed'],
+            "compressions": metrics['playlist_compressions'],
+            "bytes_saved": metrics['playlist_bytes_saved'],
+            "versions": len(_playlist_versions),
+            "encodings": ",".join(PLAYLIST_ENCODINGS)
+        },
+        "admission": dict(admission_control.stats(), slow_clients=metrics['slow_clients']),
+        "live": live_stats(),
+        "batch": batch_stats(),
+        "snapshot": snapshot_stats(),
+        "tracing": tracer.stats(),
+        "dns_cache": dns_stats(),
+        "prewarm": prewarm_stats(),
+        "llhls": {
+            "blocked": metrics['llhls_blocked'],
+            "immediate": metrics['llhls_immediate'],
+            "upstream": metrics['llhls_upstream'],
+            "timeouts": metrics['llhls_timeouts'],
+            "preloads": metrics['llhls_preloads'],
+            "live_edges": len(_live_edges)
+        },
+        "prefetch": {
+            "enabled": PREFETCH_ENABLED,
+            "started": metrics['prefetch_started'],
+            "skipped": metrics['prefetch_skipped'],
+            "hits": metrics['prefetch_hits'],
+            "bytes": metrics['prefetch_bytes'],
+            "active": _prefetch_state['active'],
+            "pending_bytes": _prefetch_state['bytes']
+        },
+        "upstream_hosts": upstream_stats(),
+        "relay": {
+            "bytes": metrics['relay_bytes'],
+            "streams": metrics['relay_streams'],
+            "chunk_size": SEGMENT_CHUNK_SIZE,
+            "pool": {
+                "max_bytes": relay_pool.max_bytes,
+                "idle_bytes": relay_pool.bytes,
+                "reused": relay_pool.reused,
+                "allocated": relay_pool.allocated
+            },
+            "recent": list(_relay_streams)
+        },
+        "key_cache": {
+            "hits": metrics['key_cache_hits'],
+            "misses": metrics['key_cache_misses'],
+            "coalesced": metrics['key_coalesced'],
+            "errors_cached": metrics['key_errors_cached'],
+            "entries": len(_key_cache),
+            "policy": KEY_CACHE_POLICY
+        },
+        "segment_cache": {
+            "hits": metrics['segment_cache_hits'],
+            "misses": metrics['segment_cache_misses'],
+            "coalesced": metrics['segment_coalesced'],
+            "bytes_saved": metrics['segment_bytes_saved'],
+            "entries": len(segment_cache),
+            "bytes": segment_cache.bytes,
+            "max_bytes": segment_cache.max_bytes
+        },
+        "disk_store": dict(disk_store.stats(), enabled=True) if disk_store is not None else {"enabled": False}
+    }
+
+def cluster_stats():
+    """/api/stats: launcher.py altında tüm worker'ların birleşik görünümü, tek süreçte stats_payload()"""
+    payload = stats_payload()
+    if shared is None:
+        return payload
+    shared.publish(payload)
+    workers = shared.collect() or {shared.worker: payload}
+    merged = shared_cache.merge_stats(list(workers.values()))
+    merged["workers"] = {
+        worker: {"requests": p["requests"], "streams": p["streams"], "uptime": p["uptime"]}
+        for worker, p in sorted(workers.items())
+    }
+    merged["shared_cache"] = shared.info()
+    return merged
+
+def publish_stats_forever():
+    """Worker istatistiklerini düzenli olarak daemon'a yayınla (/api/stats hangi worker'a düşerse düşsün tam olsun)"""
+    while True:
+        try:
+            shared.publish(stats_payload())
+        except Exception as e:  # istatistik yayını servisi durdurmamalı
+            logger.warning(f"Stats publish error: {e}")
+        time.sleep(STATS_PUBLISH_INTERVAL)
+
+def cache_counts():
+    """Önbellek başına (hit, miss, coalesced) sayaçları"""
+    counts = {
+        'resolve': (metrics['cache_hits'], metrics['resolve_misses'], metrics['resolve_coalesced']),
+        'playlist': (metrics['playlist_cache_hits'], metrics['playlist_cache_misses'],
+                     metrics['playlist_coalesced']),
+        'segment': (metrics['segment_cache_hits'], metrics['segment_cache_misses'],
+                    metrics['segment_coalesced']),
+        'key': (metrics['key_cache_hits'], metrics['key_cache_misses'], metrics['key_coalesced'])
+    }
+    for name, (hits, misses) in resolve_layer_counts.items():
+        counts[f'resolve_{name}'] = (hits, misses, 0)
+    if disk_store is not None:
+        counts['disk'] = (disk_store.hits, disk_store.misses, 0)
+    return counts
+
+def _cache_requests():
+    series = {}
+    for cache, values in cache_counts().items():
+        for result, value in zip(('hit', 'miss', 'coalesced'), values):
+            series[(cache, result)] = value
+    return series
+
+def _cache_hit_ratios():
+    return {(cache,): hits / (hits + misses + coalesced) if hits + misses + coalesced else 0.0
+            for cache, (hits, misses, coalesced) in cache_counts().items()}
+
+registry.gauge('streamflow_active_streams', 'Eşzamanlı playlist/segment akışları', (),
+               lambda: {(): metrics['active_streams']})
+registry.collected_counter('streamflow_cache_requests_total', 'Önbellek aramaları (hit, miss, coalesced)',
+                           ('cache', 'result'), _cache_requests)
+registry.gauge('streamflow_cache_hit_ratio', 'Önbellek isabet oranı', ('cache',), _cache_hit_ratios)
+registry.gauge('streamflow_upstream_streams', 'Host başına açık upstream segment akışları', ('host',),
+               lambda: {(host,): n for host, n in admission_control.active_hosts().items()})
+registry.gauge('streamflow_admission_queue_depth', 'Upstream slotu bekleyen istekler', ('host',),
+               lambda: {(host,): n for host, n in admission_control.queue_depths().items()})
+registry.collected_counter('streamflow_admission_rejections_total', '503 ile reddedilen istekler', ('reason',),
+                           lambda: {(reason,): n for reason, n in admission_control.rejected.items()})
+registry.collected_counter('streamflow_slow_clients_total', 'Yavaş okuduğu için koparılan istemciler', (),
+                           lambda: {(): metrics['slow_clients']})
+registry.collected_counter('streamflow_playlist_not_modified_total', 'If-None-Match ile 304 dönen playlist istekleri',
+                           (), lambda: {(): metrics['playlist_not_modified']})
+registry.collected_counter('streamflow_playlist_bytes_saved_total',
+                           '304 ve sıkıştırmayla gönderilmeyen playlist byte sayısı', (),
+                           lambda: {(): metrics['playlist_bytes_saved']})
+registry.gauge('streamflow_segment_cache_bytes', 'RAM segment önbelleği doluluğu', (),
+               lambda: {(): segment_cache.bytes})
+registry.collected_counter('streamflow_prewarm_connections_total', 'Yayın host\'una önceden açılan bağlantılar',
+                           ('result',), lambda: {('opened',): _prewarm_counts['opened'],
+                                                 ('failed',): _prewarm_counts['failed']})
+registry.collected_counter('streamflow_dns_cache_requests_total', 'Upstream DNS önbelleği aramaları', ('result',),
+                           lambda: {(result,): _dns_counts[result] for result in ('hits', 'misses', 'coalesced')})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(registry.render(), content_type=telemetry.CONTENT_TYPE)
+
+# PERFORMANS İYİLEŞTİRMESİ: /api/debug/traces (son istek izleri) ve /api/debug/profile (örnekleyici profiler)
+# launcher.py altında worker başınadır (istek hangi worker'a düştüyse onun izleri)
+_native_sleep = gevent.monkey.get_original('time', 'sleep') if SERVER_MODE == 'gevent' else time.sleep
+
+def debug_denied(args, headers):
+    """None (izinli) ya da (status, hata). DEBUG_TOKEN yoksa endpoint'ler hiç yokmuş gibi davranır"""
+    if not DEBUG_TOKEN:
+        return 404, "not found"
+    if not hmac.compare_digest(DEBUG_TOKEN, args.get('token') or headers.get('X-Debug-Token') or ''):
+        return 403, "forbidden"
+    return None
+
+def traces_payload(args):
+    """?limit=50&slow=1|min_ms=&failed=1&route=/proxy/ts&id= filtreleriyle izler (hatalı değerde ValueError)"""
+    min_ms = float(args.get('min_ms', 0))
+    if args.get('slow') == '1':
+        min_ms = max(min_ms, TRACE_SLOW_MS)
+    trace_id = args.get('id')
+    traces = tracer.query(limit=max(1, int(args.get('limit', 50))), min_ms=min_ms,
+                          failed=args.get('failed') == '1', route=args.get('route'),
+                          trace_id=int(trace_id) if trace_id else None)
+    return {"tracing": tracer.stats(), "traces": traces}
+
+def profile_params(args):
+    """(seconds, interval, idle) - hatalı değerde ValueError"""
+    seconds = float(args.get('seconds', 10))
+    hz = float(args.get('hz', 100))
+    if not 0 < seconds <= PROFILE_MAX_SECONDS or not 1 <= hz <= 1000:
+        raise ValueError(f"seconds must be in (0, {PROFILE_MAX_SECONDS:g}], hz in [1, 1000]")
+    return seconds, 1 / hz, args.get('idle') == '1'
+
+_profile_last = {'finished': 0.0}
+
+def profile_retry_after():
+    """Sonraki profile kadar kalan saniye (0 = çalıştırılabilir) - örnekleyici sürekli açık tutulamaz"""
+    return max(0.0, _profile_last['finished'] + PROFILE_MIN_INTERVAL - time.time())
+
+def run_profile(seconds, interval, idle):
+    """Collapsed yığınlar (flamegraph.pl / speedscope) ve örnek sayısı; başka profil sürüyorsa None.
+    OS thread'inde çağrılır (hata threadpool'dan taşmasın diye ProfileBusy burada yakalanır)"""
+    try:
+        lines, samples = tracing.profile(seconds, interval, idle, _native_sleep)
+    except tracing.ProfileBusy:
+        return None
+    _profile_last['finished'] = time.time()
+    return ''.join(f"{line}\n" for line in lines), samples
+
+@app.route('/api/debug/traces')
+def debug_traces():
+    denied = debug_denied(request.args, request.headers)
+    if denied is not None:
+        return jsonify({"error": denied[1]}), denied[0]
+    try:
+        return jsonify(traces_payload(request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/api/debug/profile')
+def debug_profile():
+    denied = debug_denied(request.args, request.headers)
+    if denied is not None:
+        return jsonify({"error": denied[1]}), denied[0]
+    try:
+        params = profile_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    wait = profile_retry_after()
+    if wait:
+        return jsonify({"error": "profile rate limited"}), 429, {'Retry-After': str(int(wait) + 1)}
+    # Örnekleyici gerçek bir thread'de: hub'ı bloklamadan tüm greenlet'lerin çalıştığı thread'i görür
+    result = gevent.get_hub().threadpool.apply(run_profile, params)
+    if result is None:
+        return jsonify({"error": "profile already running"}), 409
+    text, samples = result
+    return Response(text, content_type='text/plain; charset=utf-8', headers={'X-Profile-Samples': str(samples)})
+
+# PERFORMANS İYİLEŞTİRMESİ: Önbellek snapshot'ları - yeniden başlatmada resolve zinciri baştan çalışmaz
+# Kalıcı önbellekler (cache_snapshot.NAMESPACES) periyodik olarak ve kapanışta diske yazılır; açılışta
+# yüklenir, en sıcak resolve kayıtları arka planda yenilenir ve bu sürede /health 503 döner
+CACHE_SNAPSHOT_PATH = os.environ.get('CACHE_SNAPSHOT_PATH', '')  # boş = kapalı
+CACHE_SNAPSHOT_INTERVAL = float(os.environ.get('CACHE_SNAPSHOT_INTERVAL', '60'))  # saniye
+CACHE_WARMUP_KEYS = int(os.environ.get('CACHE_WARMUP_KEYS', '50'))  # 0 = açılışta yenileme yok
+CACHE_WARMUP_TIMEOUT = float(os.environ.get('CACHE_WARMUP_TIMEOUT', '20'))  # /health en çok bu kadar bekletilir
+# resolve kaydının girdisi (url, headers) - anahtar hash olduğu için snapshot'tan yenilemede gerekir
+_resolve_sources = (make_cache('resolve_source', RESOLVE_CACHE_SIZE, _cache_ttl, RESOLVE_STALE_TTL)
+                    if CACHE_SNAPSHOT_PATH else None)
+_snapshot_state = {'changes': None, 'saved_at': 0.0, 'entries': 0, 'bytes': 0, 'seconds': 0.0,
+                   'restored': 0, 'errors': 0}
+_warmup = {'pending': 0, 'until': 0.0, 'refreshed': 0}
+
+def persisted_caches():
+    return {ns: caches[ns] for ns in cache_snapshot.NAMESPACES if ns in caches}
+
+def save_snapshot():
+    """Kalıcı önbellekleri yaz (tek süreç - launcher.py altında master yazar); değişiklik yoksa atlanır"""
+    persisted = persisted_caches()
+    changes = sum(cache.changes for cache in persisted.values())
+    if changes == _snapshot_state['changes']:
+        return
+    started = time.time()
+    spaces = {ns: cache.snapshot() for ns, cache in persisted.items()}
+    size = cache_snapshot.write(CACHE_SNAPSHOT_PATH, spaces)
+    _snapshot_state.update(changes=changes, saved_at=time.time(), entries=cache_snapshot.count(spaces),
+                           bytes=size, seconds=round(time.time() - started, 3))
+
+def snapshot_forever():
+    while True:
+        time.sleep(CACHE_SNAPSHOT_INTERVAL)
+        try:
+            save_snapshot()
+        except Exception as e:
+            _snapshot_state['errors'] += 1
+            logger.warning(f"Cache snapshot failed: {e}")
+
+def hot_resolve_entries(spaces, limit):
+    """Yenilenecek kayıtlar [(cache_key, url, headers)]: isabet ve yeniliğe göre en sıcak, girdisi
+    bilinen ve TTL'sinin RESOLVE_REFRESH_AHEAD kadarı geçmiş (taze kayıt yenilenmez) olanlar"""
+    sources = {entry[0]: entry[1] for entry in spaces.get('resolve_source', ())}
+    entries = spaces.get('resolve', [])
+    now = time.time()
+    hot = []
+    for i in sorted(range(len(entries)), key=lambda i: (entries[i][5], i), reverse=True):
+        key, _, stored, ttl = entries[i][:4]
+        if key in sources and now - stored >= ttl * RESOLVE_REFRESH_AHEAD:
+            hot.append((key, *sources[key]))
+            if len(hot) >= limit:
+                break
+    return hot
+
+def warm_resolve(hot):
+    """Sıcak resolve kayıtlarını BATCH_CONCURRENCY'lik havuzda yenile"""
+    def refresh(item):
+        cache_key, url, headers = item
+        try:
+            _resolve_flight.do(cache_key, _resolve_and_store, cache_key, url, dict(headers) if headers else None)
+            _warmup['refreshed'] += 1
+        except Exception as e:
+            logger.warning(f"Warm-up resolve failed: {e}")
+        finally:
+            _warmup['pending'] -= 1
+    for _ in bounded_map(refresh, hot, BATCH_CONCURRENCY):
+        pass
+
+def start_snapshots():
+    """Açılış: snapshot'ı yükle (launcher.py altında master yükler, ilk worker sadece yenileme için okur),
+    sıcak kayıtları arka planda yenile ve periyodik yazmayı başlat"""
+    if not CACHE_SNAPSHOT_PATH or (shared is not None and WORKER_ID != '0'):
+        return
+    spaces = cache_snapshot.read(CACHE_SNAPSHOT_PATH) or {}
+    if shared is None:
+        started = time.time()
+        persisted = persisted_caches()
+        _snapshot_state['restored'] = sum(persisted[ns].load(entries) for ns, entries in spaces.items()
+                                          if ns in persisted)
+        _snapshot_state['changes'] = sum(cache.changes for cache in persisted.values())  # yüklenen hal yazılmaz
+        logger.info(f"Restored {_snapshot_state['restored']} cache entries in {time.time() - started:.2f}s")
+        spawn(snapshot_forever)
+    hot = hot_resolve_entries(spaces, CACHE_WARMUP_KEYS) if CACHE_WARMUP_KEYS > 0 else []
+    if hot:
+        _warmup.update(pending=len(hot), until=time.time() + CACHE_WARMUP_TIMEOUT)
+        spawn(warm_resolve, hot)
+
+def stop_snapshots():
+    """Kapanışta son snapshot (tek süreç)"""
+    if CACHE_SNAPSHOT_PATH and shared is None:
+        try:
+            save_snapshot()
+        except Exception as e:
+            logger.warning(f"Cache snapshot failed: {e}")
+
+def snapshot_stats():
+    return {
+        "enabled": bool(CACHE_SNAPSHOT_PATH),
+        "saved_at": _snapshot_state['saved_at'],
+        "entries": _snapshot_state['entries'],
+        "bytes": _snapshot_state['bytes'],
+        "seconds": _snapshot_state['seconds'],
+        "restored": _snapshot_state['restored'],
+        "errors": _snapshot_state['errors'],
+        "warmup": {"pending": _warmup['pending'], "refreshed": _warmup['refreshed']}
+    }
+
+def health_status():
+    """(payload, status): açılış yenilemesi sürerken 503 (warming)"""
+    if _warmup['pending'] > 0 and time.time() < _warmup['until']:
+        return dict(HEALTH_PAYLOAD, status="warming", pending=_warmup['pending']), 503
+    return HEALTH_PAYLOAD, 200
+
+HEALTH_PAYLOAD = {"status": "ok", "version": "3.5-optimized"}
 
 @app.route('/health')
 def health():
-    return jsonify({"status": "ok", "version": "3.5-optimized"})
+    payload, status = health_status()
+    return jsonify(payload), status
 
 # PERFORMANS İYİLEŞTİRMESİ: Önbellek temizleme endpoint'i
+def clear_caches():
+    """Tüm önbellekleri boşalt (her iki sunucu modu için)"""
+    _resolve_cache.clear()
+    for layer in resolve_layers.values():
+        layer.clear()
+    _playlist_cache.clear()
+    _live_edges.clear()
+    _key_cache.clear()
+    segment_cache.clear()
+    if disk_store is not None:
+        disk_store.clear()
+
 @app.route('/api/cache/clear')
 def clear_cache():
-    global _resolve_cache
-    _resolve_cache.clear()
+    clear_caches()
     return jsonify({"status": "cache cleared"})
 
+GRACEFUL_TIMEOUT = float(os.environ.get('GRACEFUL_TIMEOUT', '30'))  # SIGTERM sonrası açık isteklerin süresi
+
+def inherited_listener():
+    """launcher.py'nin devrettiği dinleme soketi (LISTEN_FD), yoksa None"""
+    fd = os.environ.get('LISTEN_FD')
+    return socket.socket(fileno=int(fd)) if fd else None
+
 if __name__ == '__main__':
-    logger.info("StreamFlow Turbo v3.5 starting (Optimized)...")
-    app.run(host="0.0.0.0", port=7860, debug=False, threaded=True)
+    port = int(os.environ.get('PORT', '7860'))
+    listener = inherited_listener()
+    if SERVER_MODE == 'asyncio':
+        import aio_server
+        aio_server.main(port, sock=listener)
+    else:
+        from gevent.pool import Pool
+        from gevent.pywsgi import WSGIHandler, WSGIServer
+
+        class ClientHandler(WSGIHandler):
+            """Okumayan istemcinin yazması CLIENT_WRITE_TIMEOUT sonra kesilir (boşta keep-alive da kapanır);
+            zaman aşımı kopmuş bağlantı gibi sessizce işlenir"""
+            ignored_socket_errors = WSGIHandler.ignored_socket_errors + ('timed out',)
+
+            def handle(self):
+                self.socket.settimeout(CLIENT_WRITE_TIMEOUT)
+                # Nagle + istemcinin gecikmeli ACK'i keep-alive'daki her yanıtı ~40 ms bekletiyordu (aiohttp varsayılanı da NODELAY)
+                self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                super().handle()
+
+            def _sendall(self, data):
+                try:
+                    super()._sendall(data)
+                except socket.timeout:
+                    metrics['slow_clients'] += 1
+                    raise
+        logger.info("StreamFlow Turbo v3.5 starting (Optimized)...")
+        # pywsgi: keep-alive + memoryview parçaları kopyasız sendall
+        # Pool: SIGTERM'de yeni bağlantı kabulü durur, açık istekler GRACEFUL_TIMEOUT kadar tamamlanır
+        server = WSGIServer(listener or ("0.0.0.0", port), app, log=None, spawn=Pool(),
+                            handler_class=ClientHandler)
+        server.stop_timeout = GRACEFUL_TIMEOUT
+        gevent.signal_handler(signal.SIGTERM, server.close)
+        if shared is not None:
+            threading.Thread(target=publish_stats_forever, daemon=True).start()
+        start_snapshots()
+        server.serve_forever()
+        stop_snapshots()
+        if shared is not None:
+            shared.publish(None)  # çıkan worker birleşik istatistiklerden düşer
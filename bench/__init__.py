@@ -0,0 +1 @@
+"""StreamFlow benchmark araçları"""
@@ -0,0 +1,117 @@
+"""Kanal açılış gecikmesi: yayın host'una ön bağlantı (PREWARM_CONNECTIONS) açık ve kapalı
+
+Sahte upstream her kanalı localhost üzerinde ayrı bir TLS portuna (ayrı yayın host'u) dağıtır ve
+yeni bağlantıları --connect-latency-ms kadar geciktirir. Her kanal için sırayla ölçülür:
+/proxy/m3u (resolve + playlist) ve playlist'teki ilk segmentin tamamı.
+
+Senaryolar:
+  cold         kanal ilk kez açılır (resolve, playlist ve segment aynı istek zincirinde)
+  preresolved  kanallar önce /api/resolve/batch ile çözülür (liste içe aktarma, yenileme, snapshot)
+
+Kullanım: python -m bench.channel_start [--modes gevent asyncio] [--channels 10] [--connect-latency-ms 40]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+from aiohttp import ClientSession
+
+from bench.server_bench import ROOT, percentile, start_proxy, wait_ready
+
+SCENARIOS = ('cold', 'preresolved')
+
+
+async def timed_get(session, url):
+    start = time.perf_counter()
+    async with session.get(url) as resp:
+        body = await resp.read()
+        if resp.status != 200:
+            raise RuntimeError(f"{url} -> {resp.status}")
+    return (time.perf_counter() - start) * 1000, body
+
+
+async def start_channel(session, base, page_url):
+    """(m3u ms, ilk segment ms)"""
+    m3u_ms, body = await timed_get(session, f"{base}/proxy/m3u?url={quote(page_url, safe='')}")
+    first = next(line for line in body.decode().splitlines() if line and not line.startswith('#'))
+    segment_ms, _ = await timed_get(session, first if first.startswith('http') else base + first)
+    return m3u_ms, segment_ms
+
+
+async def run_scenario(base, upstream_url, scenario, channels, offset, settle):
+    pages = [f"{upstream_url}/page/ch{offset + i}.html" for i in range(channels)]
+    async with ClientSession() as session:
+        if scenario == 'preresolved':
+            async with session.post(f"{base}/api/resolve/batch", json={"urls": pages}) as resp:
+                await resp.read()
+            await asyncio.sleep(settle)  # ısıtma arka planda tamamlansın
+        return [await start_channel(session, base, page) for page in pages]
+
+
+def summarize(samples):
+    m3u = [s[0] for s in samples]
+    segment = [s[1] for s in samples]
+    total = [a + b for a, b in samples]
+    return {name: {"p50": percentile(values, 50), "mean": statistics.mean(values), "max": max(values)}
+            for name, values in (("m3u", m3u), ("segment", segment), ("total", total))}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--modes', nargs='+', default=['gevent', 'asyncio'])
+    ap.add_argument('--channels', type=int, default=10, help="senaryo başına açılan kanal")
+    ap.add_argument('--connect-latency-ms', type=float, default=40, help="yeni upstream bağlantısı gecikmesi")
+    ap.add_argument('--latency-ms', type=float, default=10, help="upstream TTFB")
+    ap.add_argument('--segment-kb', type=int, default=200)
+    ap.add_argument('--prewarm', type=int, default=2, help="açık ölçümde PREWARM_CONNECTIONS")
+    ap.add_argument('--settle', type=float, default=1.0, help="preresolved: batch sonrası bekleme (sn)")
+    ap.add_argument('--port', type=int, default=17860)
+    ap.add_argument('--upstream-port', type=int, default=18080)
+    ap.add_argument('--tls-port', type=int, default=18443)
+    args = ap.parse_args()
+
+    cert_dir = os.path.join(tempfile.gettempdir(), 'streamflow-bench-cert')
+    upstream_url = f"http://127.0.0.1:{args.upstream_port}"
+    upstream = subprocess.Popen(
+        [sys.executable, '-m', 'bench.fake_upstream', '--port', str(args.upstream_port),
+         '--tls-port', str(args.tls_port), '--cert-dir', cert_dir, '--latency-ms', str(args.latency_ms),
+         '--segment-kb', str(args.segment_kb), '--stream-ports', str(args.channels * len(SCENARIOS)),
+         '--connect-latency-ms', str(args.connect_latency_ms)],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    cert = os.path.join(cert_dir, 'cert.pem')
+
+    try:
+        asyncio.run(wait_ready(f"{upstream_url}/_stats"))
+        print(f"channels={args.channels} connect_latency={args.connect_latency_ms}ms "
+              f"ttfb={args.latency_ms}ms segment={args.segment_kb}KB (ms: p50 / mean / max)")
+        print(f"{'mode':>8} {'prewarm':>7} {'scenario':>12} {'m3u':>22} {'first segment':>22} {'total':>22}")
+        for mode in args.modes:
+            for prewarm in (0, args.prewarm):
+                env = {'REQUESTS_CA_BUNDLE': cert, 'SSL_CERT_FILE': cert, 'PREWARM_CONNECTIONS': str(prewarm)}
+                proxy = start_proxy(mode, args.port, env)
+                try:
+                    base = f"http://127.0.0.1:{args.port}"
+                    asyncio.run(wait_ready(f"{base}/health"))
+                    for i, scenario in enumerate(SCENARIOS):
+                        # her senaryo kendi kanal (dolayısıyla yayın host'u) aralığını kullanır - havuzlar soğuk
+                        samples = asyncio.run(run_scenario(base, upstream_url, scenario, args.channels,
+                                                           i * args.channels, args.settle))
+                        result = summarize(samples)
+                        cells = ' '.join(f"{r['p50']:8.1f}/{r['mean']:6.1f}/{r['max']:6.1f}" for r in result.values())
+                        print(f"{mode:>8} {prewarm:>7} {scenario:>12} {cells}")
+                finally:
+                    proxy.terminate()
+                    proxy.wait()
+    finally:
+        upstream.terminate()
+        upstream.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+"""Yerel sahte upstream - embed sayfası, auth, server_lookup, playlist, segment ve key sunar (ağ gerektirmez)
+
+resolve_fast zinciri (sayfa -> iframe -> auth -> server_lookup -> mono.m3u8) https
+adresleri kurduğu için --tls-port ile aynı uygulama kendinden imzalı sertifikayla
+ikinci bir portta da sunulur; proxy'ye sertifika REQUESTS_CA_BUNDLE/SSL_CERT_FILE ile verilir.
+
+/ll/<kanal>/index.m3u8 LL-HLS playlist'i sunar (part'lar, preload hint, _HLS_msn/_HLS_part
+ile blocking reload); --target-duration 2 gibi kısa segmentlerle kullanılır.
+
+/list.m3u?n=N N girişli IPTV listesi sunar (embed sayfaları, #EXTVLCOPT header'lı ve doğrudan
+TS girişleriyle) - /proxy/playlist ve /api/resolve/batch denemeleri için.
+
+--stream-ports N ile server_lookup kanalları localhost üzerinde --tls-port'tan sonraki N porta dağıtır
+(kanal başına ayrı yayın host'u); --connect-latency-ms her yeni TLS bağlantısını geciktirir (ağ RTT'si).
+
+Kullanım: python -m bench.fake_upstream --port 18080 --tls-port 18443 --latency-ms 20 --bandwidth-mbps 200
+"""
+import argparse
+import asyncio
+import os
+import socket
+import ssl
+import subprocess
+import tempfile
+import time
+
+from aiohttp import web
+
+TARGET_DURATION = 6
+WINDOW = 6  # canlı playlist'teki segment sayısı
+PARTS = 4  # LL-HLS: segment başına part sayısı
+
+# app.PATTERNS'in beklediği script şekilleri
+EMBED_PAGE = """<!DOCTYPE html>
+<html><head><title>{channel}</title></head><body>
+<iframe src="{tls}/embed/{channel}.php" width="100%" height="100%"></iframe>
+</body></html>
+"""
+EMBED_SCRIPT = """<!DOCTYPE html>
+<html><head><script>
+const channelKey = "{channel}";
+const authTs = "{ts}";
+const authRnd = "4f2a9c";
+const authSig = "c2lnbmF0dXJl+/=";
+const m3u8 = serverKey + '/s/' + serverKey + '/' + channelKey + '/mono.m3u8';
+function authenticate() {{
+    const url = buildUrl();
+}} fetchWithRetry('{tls}/auth.php?channel_id=');
+function lookupServer() {{
+    return fetchWithRetry('/server_lookup.php?channel_id=');
+}}
+</script></head><body><video id="player"></video></body></html>
+"""
+
+
+def make_certificate(directory):
+    """127.0.0.1 için kendinden imzalı sertifika üret: (cert, key) yolları"""
+    cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+    if not (os.path.exists(cert) and os.path.exists(key)):
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '30',
+                        '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1,DNS:localhost',
+                        '-keyout', key, '-out', cert],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert, key
+
+
+class Upstream:
+    def __init__(self, latency=0.0, bandwidth=0, segment_size=1_000_000, chunk=65536,
+                 target_duration=TARGET_DURATION, tls_base='', stream_ports=()):
+        self.latency = latency  # saniye (TTFB)
+        self.bandwidth = bandwidth  # byte/sn, 0 = sınırsız
+        self.segment_size = segment_size
+        self.chunk = chunk
+        self.target_duration = target_duration
+        self.tls_base = tls_base  # https://127.0.0.1:<tls-port>
+        self.stream_ports = stream_ports  # boş = yayın sayfayla aynı host'tan
+        self.counts = {}
+        self.started = time.time()
+        # 188 byte'lık TS paketleri (0x47 sync byte + paket numarası - aralık kontrolleri için)
+        packets = segment_size // 188 + 1
+        self.payload = b''.join(b'\x47' + n.to_bytes(4, 'big') + b'\x00' * 183 for n in range(packets))[:segment_size]
+
+    def count(self, kind):
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    async def delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    @staticmethod
+    def key_line(channel):
+        """clear* kanalları şifresiz (örn. /proxy/live testleri için)"""
+        if channel.startswith('clear'):
+            return "#EXT-X-KEY:METHOD=NONE"
+        return f'#EXT-X-KEY:METHOD=AES-128,URI="/key/{channel}.key"'
+
+    def live_playlist(self, channel):
+        duration = self.target_duration
+        seq = int((time.time() - self.started) / duration) + 1000
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{duration}",
+                 f"#EXT-X-MEDIA-SEQUENCE:{seq}",
+                 self.key_line(channel)]
+        for n in range(seq, seq + WINDOW):
+            lines += [f"#EXTINF:{duration}.000,", f"seg_{n}.ts"]
+        return "\n".join(lines) + "\n"
+
+    def ll_position(self):
+        """LL-HLS canlı ucu: (yazılmakta olan segmentin MSN'i, hazır part sayısı)"""
+        elapsed = time.time() - self.started
+        part = self.target_duration / PARTS
+        return int(elapsed // self.target_duration) + 1000, int(elapsed % self.target_duration // part)
+
+    def ll_available_at(self, msn, part=None):
+        """Segmentin (part verilirse part'ın) tamamlandığı an"""
+        duration = self.target_duration
+        if part is None:
+            return self.started + (msn - 1000 + 1) * duration
+        return self.started + (msn - 1000) * duration + (part + 1) * duration / PARTS
+
+    def ll_playlist(self, channel):
+        duration = self.target_duration
+        part = duration / PARTS
+        current, ready = self.ll_position()
+        first = max(1000, current - WINDOW)
+        lines = ["#EXTM3U", "#EXT-X-VERSION:6", f"#EXT-X-TARGETDURATION:{duration}",
+                 f"#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,PART-HOLD-BACK={3 * part:.3f}",
+                 f"#EXT-X-PART-INF:PART-TARGET={part:.3f}", f"#EXT-X-MEDIA-SEQUENCE:{first}",
+                 self.key_line(channel)]
+        for n in range(first, current):
+            if n >= current - 2:  # part'lar sadece son segmentler için listelenir
+                lines += [f'#EXT-X-PART:DURATION={part:.3f},URI="part_{n}_{p}.ts"' for p in range(PARTS)]
+            lines += [f"#EXTINF:{duration}.000,", f"seg_{n}.ts"]
+        lines += [f'#EXT-X-PART:DURATION={part:.3f},URI="part_{current}_{p}.ts"' for p in range(ready)]
+        lines.append(f'#EXT-X-PRELOAD-HINT:TYPE=PART,URI="part_{current}_{ready}.ts"')
+        return "\n".join(lines) + "\n"
+
+    async def wait_until(self, at):
+        """LL-HLS blocking: istenen an gelene kadar (en çok 3 x TARGETDURATION) beklet"""
+        wait = min(at - time.time(), 3 * self.target_duration)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def vod_playlist(self, channel, segments=600):
+        duration = self.target_duration
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{duration}",
+                 "#EXT-X-PLAYLIST-TYPE:VOD", "#EXT-X-MEDIA-SEQUENCE:0",
+                 self.key_line(channel)]
+        for n in range(segments):
+            lines += [f"#EXTINF:{duration}.000,", f"seg_{n}.ts"]
+        lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    async def playlist(self, request):
+        kind = request.match_info.get('kind', 'live')
+        self.count(f'{kind}_playlist')
+        await self.delay()
+        channel = request.match_info['channel']
+        if kind == 'll':
+            msn = request.query.get('_HLS_msn')
+            if msn is not None:
+                self.count('ll_blocking')
+                part = request.query.get('_HLS_part')
+                await self.wait_until(self.ll_available_at(int(msn), None if part is None else int(part)))
+            body = self.ll_playlist(channel)
+        else:
+            body = self.live_playlist(channel) if kind == 'live' else self.vod_playlist(channel)
+        return web.Response(text=body, content_type='application/vnd.apple.mpegurl')
+
+    async def page(self, request):
+        """Kanal sayfası: embed iframe'i içerir"""
+        self.count('page')
+        await self.delay()
+        body = EMBED_PAGE.format(channel=request.match_info['channel'], tls=self.tls_base)
+        return web.Response(text=body, content_type='text/html')
+
+    async def embed(self, request):
+        """iframe içeriği: channelKey/authTs/authSig/fetchWithRetry script'i"""
+        self.count('embed')
+        await self.delay()
+        body = EMBED_SCRIPT.format(channel=request.match_info['channel'], ts=int(time.time()), tls=self.tls_base)
+        return web.Response(text=body, content_type='text/html')
+
+    async def auth(self, request):
+        self.count('auth')
+        await self.delay()
+        ok = all(request.query.get(k) for k in ('channel_id', 'ts', 'rnd', 'sig'))
+        return web.json_response({'status': 'ok' if ok else 'denied'}, status=200 if ok else 403)
+
+    async def server_lookup(self, request):
+        self.count('server_lookup')
+        await self.delay()
+        host = request.host
+        if self.stream_ports:
+            number = int(''.join(filter(str.isdigit, request.query.get('channel_id', ''))) or 0)
+            host = f"localhost:{self.stream_ports[number % len(self.stream_ports)]}"
+        return web.json_response({'server_key': host})
+
+    async def segment(self, request):
+        name = request.match_info['name']
+        size = self.segment_size
+        if name.startswith('part_'):
+            # Preload hint'teki part henüz yazılıyor - hazır olana kadar yanıt bekletilir
+            self.count('part')
+            msn, part = name[5:].split('_')
+            await self.wait_until(self.ll_available_at(int(msn), int(part)))
+            size //= PARTS
+        else:
+            self.count('segment')
+        await self.delay()
+        # Tek aralıklı Range desteği (bytes=a-b / a- / -n)
+        start, end, status = 0, size, 200
+        rng = request.http_range
+        if rng.start is not None or rng.stop is not None:
+            start, end, _ = rng.indices(size)
+            status = 206
+            self.count('segment_range')
+        resp = web.StreamResponse(status=status, headers={'Content-Length': str(end - start)})
+        if status == 206:
+            resp.headers['Content-Range'] = f"bytes {start}-{end - 1}/{size}"
+        resp.content_type = 'video/mp2t'
+        await resp.prepare(request)
+        if request.method == 'HEAD':
+            return resp
+        view = memoryview(self.payload)
+        for i in range(start, end, self.chunk):
+            part = view[i:min(i + self.chunk, end)]
+            await resp.write(part)
+            if self.bandwidth:
+                await asyncio.sleep(len(part) / self.bandwidth)
+        return resp
+
+    async def key(self, request):
+        self.count('key')
+        await self.delay()
+        if request.match_info['channel'].startswith('down'):  # key sunucusu kesintisi
+            return web.Response(status=503, text='key server unavailable')
+        return web.Response(body=b'0123456789abcdef', content_type='application/octet-stream',
+                            headers={'Cache-Control': 'max-age=30'})
+
+    async def channel_list(self, request):
+        """N girişli IPTV M3U listesi (parça parça gönderilir)"""
+        self.count('list')
+        n = int(request.query.get('n', '1000'))
+        base = f"http://{request.host}"
+        resp = web.StreamResponse()
+        resp.content_type = 'audio/x-mpegurl'
+        await resp.prepare(request)
+        lines = ['#EXTM3U x-tvg-url="epg.xml"']
+        for i in range(n):
+            lines.append(f'#EXTINF:-1 tvg-id="ch{i}" group-title="Group {i % 10}",Channel {i}')
+            if i % 3 == 0:
+                lines.append('#EXTVLCOPT:http-user-agent=FakePlayer/1.0')
+            lines.append(f"{base}/vod/ch{i}/seg_0.ts" if i % 50 == 49 else f"{base}/page/ch{i}.html")
+            if len(lines) >= 500:
+                await resp.write(("\n".join(lines) + "\n").encode())
+                lines = []
+        await resp.write(("\n".join(lines) + "\n").encode())
+        return resp
+
+    async def stats(self, request):
+        return web.json_response(self.counts)
+
+    async def reset(self, request):
+        self.counts.clear()
+        return web.json_response({})
+
+    def make_app(self):
+        application = web.Application()
+        application.router.add_get('/{kind:live|vod|ll}/{channel}/index.m3u8', self.playlist)
+        application.router.add_get('/{kind:live|vod|ll}/{channel}/{name}.ts', self.segment)
+        application.router.add_get('/page/{channel}.html', self.page)
+        application.router.add_get('/embed/{channel}.php', self.embed)
+        application.router.add_get('/auth.php', self.auth)
+        application.router.add_get('/server_lookup.php', self.server_lookup)
+        # resolve_fast'in kurduğu adres: https://<server_key>/s/<server_key>/<kanal>/mono.m3u8
+        application.router.add_get('/s/{server}/{channel}/mono.m3u8', self.playlist)
+        application.router.add_get('/s/{server}/{channel}/{name}.ts', self.segment)
+        application.router.add_get('/key/{channel}.key', self.key)
+        application.router.add_get('/list.m3u', self.channel_list)
+        application.router.add_get('/_stats', self.stats)
+        application.router.add_get('/_reset', self.reset)
+        return application
+
+
+async def _pipe(reader, writer):
+    try:
+        while data := await reader.read(65536):
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def delayed_forward(reader, writer, port, delay):
+    """Bağlantıyı delay kadar beklettikten sonra iç TLS portuna aktar"""
+    await asyncio.sleep(delay)
+    try:
+        up_reader, up_writer = await asyncio.open_connection('127.0.0.1', port)
+    except OSError:
+        writer.close()
+        return
+    await asyncio.gather(_pipe(reader, up_writer), _pipe(up_reader, writer))
+
+
+async def serve(upstream, port, tls_port, cert_dir, connect_latency=0.0):
+    runner = web.AppRunner(upstream.make_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    if tls_port:
+        ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ctx.load_cert_chain(*make_certificate(cert_dir))
+        if connect_latency:
+            inner = socket.socket()
+            inner.bind(('127.0.0.1', 0))
+            await web.SockSite(runner, inner, ssl_context=ctx).start()
+            inner_port = inner.getsockname()[1]
+        for tls in (tls_port, *upstream.stream_ports):
+            if connect_latency:
+                await asyncio.start_server(lambda r, w: delayed_forward(r, w, inner_port, connect_latency),
+                                           '127.0.0.1', tls)
+            else:
+                await web.TCPSite(runner, '127.0.0.1', tls, ssl_context=ctx).start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--port', type=int, default=18080)
+    ap.add_argument('--tls-port', type=int, default=0, help="https portu (0 = kapalı)")
+    ap.add_argument('--cert-dir', default=os.path.join(tempfile.gettempdir(), 'streamflow-bench-cert'))
+    ap.add_argument('--latency-ms', type=float, default=20)
+    ap.add_argument('--bandwidth-mbps', type=float, default=0, help="segment başına bant genişliği (0 = sınırsız)")
+    ap.add_argument('--segment-kb', type=int, default=1000)
+    ap.add_argument('--target-duration', type=int, default=TARGET_DURATION, help="segment süresi (sn)")
+    ap.add_argument('--stream-ports', type=int, default=0, help="kanallara dağıtılan ayrı yayın portu sayısı")
+    ap.add_argument('--connect-latency-ms', type=float, default=0, help="yeni TLS bağlantısı başına gecikme")
+    args = ap.parse_args()
+    os.makedirs(args.cert_dir, exist_ok=True)
+    stream_ports = tuple(range(args.tls_port + 1, args.tls_port + 1 + args.stream_ports)) if args.tls_port else ()
+    upstream = Upstream(latency=args.latency_ms / 1000, bandwidth=int(args.bandwidth_mbps * 125_000),
+                        segment_size=args.segment_kb * 1000, target_duration=args.target_duration,
+                        tls_base=f"https://127.0.0.1:{args.tls_port}" if args.tls_port else '',
+                        stream_ports=stream_ports)
+    try:
+        asyncio.run(serve(upstream, args.port, args.tls_port, args.cert_dir, args.connect_latency_ms / 1000))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""Uçtan uca yük testi - N izleyici playlist poll eder ve segment çeker
+
+Yerel sahte upstream (embed sayfası -> auth -> server_lookup -> canlı playlist,
+VOD playlist, segment, key) ve proxy ayrı süreçlerde başlatılır; ağ gerekmez.
+Her mod için endpoint başına throughput, p50/p99 gecikme, upstream istek çarpanı
+(upstream isteği / proxy isteği) ve proxy'nin tepe RSS değeri raporlanır.
+
+Kullanım: python -m bench.load_test [--modes gevent asyncio] [--viewers 200] [--channels 10] [--duration 30]
+          python -m bench.load_test --json sonuc.json                  # sonucu kaydet
+          python -m bench.load_test --baseline sonuc.json --tolerance 20  # gerilemede çıkış kodu 1
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from bench.server_bench import ROOT, percentile, rss_peak_mb, start_proxy, wait_ready
+
+ENDPOINTS = ('m3u', 'ts', 'key')
+KEY_URI_RE = re.compile(r'URI="([^"]+)"')
+# Proxy isteği başına upstream'e giden istek türleri
+UPSTREAM_KINDS = {
+    'm3u': ('page', 'embed', 'auth', 'server_lookup', 'live_playlist', 'vod_playlist'),
+    'ts': ('segment',),
+    'key': ('key',),
+}
+
+
+class Recorder:
+    """Endpoint başına istek sayısı, byte, hata ve gecikme"""
+
+    def __init__(self):
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.bytes = dict.fromkeys(ENDPOINTS, 0)
+        self.errors = dict.fromkeys(ENDPOINTS, 0)
+
+    async def get(self, session, endpoint, url):
+        """İsteği yap, gövdeyi sonuna kadar oku; gövde (m3u için) ya da None döndürür"""
+        start = time.perf_counter()
+        body = None
+        try:
+            async with session.get(url) as resp:
+                if endpoint == 'm3u':
+                    body = await resp.text()
+                    size = len(body)
+                else:
+                    size = 0
+                    async for chunk in resp.content.iter_any():
+                        size += len(chunk)
+                if resp.status != 200:
+                    self.errors[endpoint] += 1
+                    body = None
+                self.bytes[endpoint] += size
+        except Exception:
+            self.errors[endpoint] += 1
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        return body
+
+
+def playlist_uris(body):
+    """Proxy'nin yeniden yazdığı playlist'ten (segment yolları, key yolları)"""
+    segments, keys = [], []
+    for line in body.splitlines():
+        if line.startswith('#EXT-X-KEY'):
+            keys.extend(KEY_URI_RE.findall(line))
+        elif line and not line.startswith('#'):
+            segments.append(line)
+    return segments, keys
+
+
+async def live_viewer(session, rec, base, page_url, deadline, target_duration, live_edge=3):
+    """Canlı izleyici: her target duration'da playlist yeniler, yeni segmentleri çeker"""
+    await asyncio.sleep(random.uniform(0, target_duration))
+    seen, keys = set(), set()
+    first = True
+    while time.time() < deadline:
+        started = time.time()
+        body = await rec.get(session, 'm3u', f"{base}/proxy/m3u?url={quote(page_url, safe='')}")
+        if body:
+            segments, key_uris = playlist_uris(body)
+            for uri in key_uris:
+                if uri not in keys:
+                    keys.add(uri)
+                    await rec.get(session, 'key', base + uri)
+            fresh = [s for s in segments if s not in seen]
+            if first:
+                fresh = fresh[-live_edge:]  # oyuncu canlı kenardan başlar
+                seen.update(segments)
+                first = False
+            for uri in fresh:
+                seen.add(uri)
+                await rec.get(session, 'ts', base + uri)
+        await asyncio.sleep(max(0.0, target_duration - (time.time() - started)))
+
+
+async def vod_viewer(session, rec, base, playlist_url, deadline, target_duration, buffer_ahead=3):
+    """VOD izleyici: playlist'i bir kez alır, ilk buffer_ahead segmenti art arda, sonrasını gerçek zamanda çeker"""
+    await asyncio.sleep(random.uniform(0, target_duration))
+    body = await rec.get(session, 'm3u', f"{base}/proxy/m3u?url={quote(playlist_url, safe='')}")
+    if not body:
+        return
+    segments, key_uris = playlist_uris(body)
+    for uri in dict.fromkeys(key_uris):
+        await rec.get(session, 'key', base + uri)
+    for n, uri in enumerate(segments):
+        if time.time() >= deadline:
+            break
+        started = time.time()
+        await rec.get(session, 'ts', base + uri)
+        if n >= buffer_ahead:
+            await asyncio.sleep(max(0.0, target_duration - (time.time() - started)))
+
+
+async def http_json(url):
+    async with ClientSession() as session:
+        async with session.get(url) as resp:
+            return await resp.json()
+
+
+async def run_load(base, upstream, args):
+    """viewers izleyiciyi duration saniye çalıştır, Recorder ve geçen süreyi döndür"""
+    rec = Recorder()
+    deadline = time.time() + args.duration
+    vod_viewers = int(args.viewers * args.vod_share)
+    timeout = ClientTimeout(total=60)
+    async with ClientSession(connector=TCPConnector(limit=0), timeout=timeout) as session:
+        tasks = []
+        for n in range(args.viewers):
+            channel = f"ch{n % args.channels}"
+            if n < vod_viewers:
+                tasks.append(vod_viewer(session, rec, base, f"{upstream}/vod/{channel}/index.m3u8",
+                                        deadline, args.target_duration))
+            else:
+                tasks.append(live_viewer(session, rec, base, f"{upstream}/page/{channel}.html",
+                                         deadline, args.target_duration))
+        start = time.perf_counter()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    return rec, elapsed
+
+
+def summarize(rec, elapsed, upstream_counts, rss):
+    """Endpoint başına rapor satırları (JSON'a da yazılır)"""
+    result = {'rss_mb': round(rss, 1), 'upstream': upstream_counts, 'endpoints': {}}
+    for name in ENDPOINTS:
+        latencies = rec.latencies[name]
+        upstream_requests = sum(upstream_counts.get(kind, 0) for kind in UPSTREAM_KINDS[name])
+        result['endpoints'][name] = {
+            'requests': len(latencies),
+            'rps': round(len(latencies) / elapsed, 1),
+            'mbps': round(rec.bytes[name] * 8 / elapsed / 1e6, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+            'errors': rec.errors[name],
+            'amplification': round(upstream_requests / len(latencies), 3) if latencies else 0.0,
+        }
+    return result
+
+
+def print_report(mode, result):
+    print(f"\n[{mode}] RSS peak {result['rss_mb']:.0f} MB   upstream: "
+          + ' '.join(f"{k}={v}" for k, v in sorted(result['upstream'].items())))
+    print(f"{'endpoint':>9} {'requests':>9} {'req/s':>8} {'Mbit/s':>8} {'p50 ms':>8} {'p99 ms':>9} "
+          f"{'errors':>7} {'upstream x':>10}")
+    for name, r in result['endpoints'].items():
+        print(f"{name:>9} {r['requests']:>9} {r['rps']:>8.1f} {r['mbps']:>8.1f} {r['p50_ms']:>8.1f} "
+              f"{r['p99_ms']:>9.1f} {r['errors']:>7} {r['amplification']:>10.3f}")
+
+
+def compare(results, baseline, tolerance):
+    """Baseline'a göre gerileme listesi (throughput düşüşü / p99 artışı / yeni hatalar)"""
+    regressions = []
+    for mode, result in results.items():
+        base = baseline.get(mode)
+        if not base:
+            continue
+        for name, r in result['endpoints'].items():
+            b = base['endpoints'].get(name)
+            if not b or not b['requests']:
+                continue
+            if r['rps'] < b['rps'] * (1 - tolerance / 100):
+                regressions.append(f"{mode} {name}: req/s {b['rps']} -> {r['rps']}")
+            if r['p99_ms'] > b['p99_ms'] * (1 + tolerance / 100):
+                regressions.append(f"{mode} {name}: p99 {b['p99_ms']} ms -> {r['p99_ms']} ms")
+            if r['errors'] > b['errors']:
+                regressions.append(f"{mode} {name}: errors {b['errors']} -> {r['errors']}")
+            if r['amplification'] > b['amplification'] * (1 + tolerance / 100) + 0.01:
+                regressions.append(f"{mode} {name}: upstream x {b['amplification']} -> {r['amplification']}")
+        if result['rss_mb'] > base['rss_mb'] * (1 + tolerance / 100):
+            regressions.append(f"{mode}: RSS {base['rss_mb']} MB -> {result['rss_mb']} MB")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--modes', nargs='+', default=['gevent', 'asyncio'])
+    ap.add_argument('--viewers', type=int, default=200)
+    ap.add_argument('--channels', type=int, default=10)
+    ap.add_argument('--vod-share', type=float, default=0.2, help="VOD izleyici oranı (0-1)")
+    ap.add_argument('--duration', type=float, default=30, help="mod başına test süresi (sn)")
+    ap.add_argument('--target-duration', type=int, default=2, help="segment süresi (sn)")
+    ap.add_argument('--segment-kb', type=int, default=500)
+    ap.add_argument('--latency-ms', type=float, default=20)
+    ap.add_argument('--bandwidth-mbps', type=float, default=0)
+    ap.add_argument('--port', type=int, default=17860)
+    ap.add_argument('--upstream-port', type=int, default=18080)
+    ap.add_argument('--tls-port', type=int, default=18443)
+    ap.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help="proxy ortam değişkeni")
+    ap.add_argument('--json', help="sonuçları bu dosyaya yaz")
+    ap.add_argument('--baseline', help="karşılaştırılacak önceki --json çıktısı")
+    ap.add_argument('--tolerance', type=float, default=20, help="gerileme eşiği (yüzde)")
+    args = ap.parse_args()
+
+    cert_dir = os.path.join(tempfile.gettempdir(), 'streamflow-bench-cert')
+    upstream_url = f"http://127.0.0.1:{args.upstream_port}"
+    upstream = subprocess.Popen(
+        [sys.executable, '-m', 'bench.fake_upstream', '--port', str(args.upstream_port),
+         '--tls-port', str(args.tls_port), '--cert-dir', cert_dir,
+         '--latency-ms', str(args.latency_ms), '--bandwidth-mbps', str(args.bandwidth_mbps),
+         '--segment-kb', str(args.segment_kb), '--target-duration', str(args.target_duration)],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # Proxy kendinden imzalı sertifikaya güvensin (requests ve aiohttp)
+    cert = os.path.join(cert_dir, 'cert.pem')
+    proxy_env = {'REQUESTS_CA_BUNDLE': cert, 'SSL_CERT_FILE': cert}
+    proxy_env.update(item.split('=', 1) for item in args.env)
+
+    results = {}
+    try:
+        asyncio.run(wait_ready(f"{upstream_url}/_stats"))
+        print(f"viewers={args.viewers} channels={args.channels} vod_share={args.vod_share} "
+              f"duration={args.duration}s segment={args.segment_kb}KB/{args.target_duration}s "
+              f"upstream_latency={args.latency_ms}ms")
+        for mode in args.modes:
+            proxy = start_proxy(mode, args.port, proxy_env)
+            try:
+                base = f"http://127.0.0.1:{args.port}"
+                asyncio.run(wait_ready(f"{base}/health"))
+                asyncio.run(http_json(f"{upstream_url}/_reset"))
+                rec, elapsed = asyncio.run(run_load(base, upstream_url, args))
+                counts = asyncio.run(http_json(f"{upstream_url}/_stats"))
+                results[mode] = summarize(rec, elapsed, counts, rss_peak_mb(proxy.pid))
+                print_report(mode, results[mode])
+            finally:
+                proxy.terminate()
+                proxy.wait()
+    finally:
+        upstream.terminate()
+        upstream.wait()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"\nbaseline ile fark %{args.tolerance:.0f} eşiğinin içinde")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""HLS rewriter mikro-benchmark'ı (DVR tarzı büyük playlist'ler)
+
+Kullanım: python -m bench.rewrite_bench [--segments 5000 20000] [--repeat 20]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from urllib.parse import quote, urljoin, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hls_rewriter  # noqa: E402
+
+HEADERS = {"User-Agent": "Mozilla/5.0", "Referer": "https://vavoo.to/", "Origin": "https://vavoo.to"}
+FINAL = "https://cdn.example.com/live/channel1/index.m3u8?token=abc"
+
+
+def make_playlist(segments, key_every=100):
+    """ENDLIST'li DVR playlist üret"""
+    lines = ["#EXTM3U", "#EXT-X-VERSION:6", "#EXT-X-TARGETDURATION:6",
+             "#EXT-X-MEDIA-SEQUENCE:1000", '#EXT-X-MAP:URI="init.mp4"']
+    for i in range(segments):
+        if i % key_every == 0:
+            lines.append(f'#EXT-X-KEY:METHOD=AES-128,URI="https://keys.example.com/k/{i // key_every}.key",IV=0x{i:032x}')
+        lines.append(f"#EXT-X-PROGRAM-DATE-TIME:2024-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}.000Z")
+        lines.append("#EXTINF:6.000,")
+        lines.append(f"seg_{1000 + i}.ts?token=abc")
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+def legacy_rewrite(content, final, headers):
+    """Eski proxy_m3u içindeki satır döngüsü (karşılaştırma için)"""
+    if "#EXTM3U" in content[:100] and "#EXTINF" not in content[:300]:
+        return content
+    parsed = urlparse(final)
+    base = f"{parsed.scheme}://{parsed.netloc}{parsed.path.rsplit('/', 1)[0]}/"
+    hq = "&".join([f"h_{quote(k)}={quote(v)}" for k, v in headers.items()])
+    lines = []
+    for line in content.split('\n'):
+        line = line.strip()
+        if not line:
+            lines.append(line)
+        elif line.startswith("#EXT-X-KEY"):
+            m = re.search(r'URI="([^"]+)"', line)
+            if m:
+                line = line.replace(m.group(1), f"/proxy/key?url={quote(m.group(1))}&{hq}")
+            lines.append(line)
+        elif line[0] != '#':
+            seg = urljoin(base, line)
+            lines.append(f"/proxy/ts?url={quote(seg)}&{hq}")
+        else:
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def bench(fn, content, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn(content, FINAL, HEADERS)
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--segments', type=int, nargs='+', default=[5000, 20000])
+    ap.add_argument('--repeat', type=int, default=20)
+    args = ap.parse_args()
+
+    print(f"{'segments':>9} {'size KB':>8} {'legacy ms':>10} {'rewriter ms':>12} {'speedup':>8} {'MB/s':>7}")
+    for n in args.segments:
+        content = make_playlist(n)
+        old = bench(legacy_rewrite, content, args.repeat)
+        new = bench(hls_rewriter.rewrite, content, args.repeat)
+        print(f"{n:>9} {len(content) / 1024:>8.0f} {old * 1000:>10.2f} {new * 1000:>12.2f} "
+              f"{old / new:>7.2f}x {len(content) / new / 1e6:>7.1f}")
+
+
+if __name__ == '__main__':
+    main()
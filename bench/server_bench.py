@@ -0,0 +1,137 @@
+"""gevent ve asyncio sunucu modlarının karşılaştırmalı benchmark'ı
+
+Her mod için proxy ayrı bir süreçte başlatılır, yerel sahte upstream üzerinden
+eşzamanlı segment indirmeleri yapılır.
+
+Kullanım: python -m bench.server_bench [--modes gevent asyncio] [--clients 500] [--requests 5000]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def rss_peak_mb(pid):
+    """Sürecin tepe RSS değeri (VmHWM)"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+async def wait_ready(url, timeout=15):
+    deadline = time.time() + timeout
+    async with ClientSession() as session:
+        while time.time() < deadline:
+            try:
+                async with session.get(url) as resp:
+                    if resp.status == 200:
+                        return
+            except Exception:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} hazır olmadı")
+
+
+async def load(base, upstream, clients, requests, scenario):
+    """clients eşzamanlı istemciyle toplam requests segment indirmesi"""
+    latencies, errors, total_bytes = [], 0, 0
+    counter = iter(range(requests))
+    timeout = ClientTimeout(total=60)
+
+    async def worker(session):
+        nonlocal errors, total_bytes
+        for n in counter:
+            # unique: her istek farklı segment (önbellek devre dışı), shared: 20 segment paylaşılır
+            seg = n if scenario == 'unique' else n % 20
+            url = f"{base}/proxy/ts?url={upstream}/vod/bench/seg_{seg}.ts"
+            start = time.perf_counter()
+            try:
+                async with session.get(url) as resp:
+                    size = 0
+                    async for chunk in resp.content.iter_any():
+                        size += len(chunk)
+                    if resp.status != 200:
+                        errors += 1
+                    total_bytes += size
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    async with ClientSession(connector=TCPConnector(limit=0), timeout=timeout) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+    return {
+        'rps': requests / elapsed,
+        'mbps': total_bytes * 8 / elapsed / 1e6,
+        'p50': percentile(latencies, 50) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'errors': errors,
+    }
+
+
+def start_proxy(mode, port, env_extra):
+    env = dict(os.environ, SERVER_MODE=mode, PORT=str(port), **env_extra)
+    return subprocess.Popen([sys.executable, 'app.py'], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--modes', nargs='+', default=['gevent', 'asyncio'])
+    ap.add_argument('--clients', type=int, default=500)
+    ap.add_argument('--requests', type=int, default=5000)
+    ap.add_argument('--scenario', choices=['unique', 'shared'], default='unique')
+    ap.add_argument('--segment-kb', type=int, default=500)
+    ap.add_argument('--latency-ms', type=float, default=20)
+    ap.add_argument('--port', type=int, default=17860)
+    ap.add_argument('--upstream-port', type=int, default=18080)
+    args = ap.parse_args()
+
+    upstream_url = f"http://127.0.0.1:{args.upstream_port}"
+    upstream = subprocess.Popen(
+        [sys.executable, '-m', 'bench.fake_upstream', '--port', str(args.upstream_port),
+         '--latency-ms', str(args.latency_ms), '--segment-kb', str(args.segment_kb)],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        asyncio.run(wait_ready(f"{upstream_url}/_stats"))
+        print(f"scenario={args.scenario} clients={args.clients} requests={args.requests} "
+              f"segment={args.segment_kb}KB upstream_latency={args.latency_ms}ms")
+        print(f"{'mode':>8} {'req/s':>8} {'Mbit/s':>8} {'p50 ms':>8} {'p99 ms':>9} {'errors':>7} {'RSS MB':>7}")
+        for mode in args.modes:
+            # Önbellek tek başına sonucu belirlemesin diye unique senaryoda segment önbelleği küçük
+            proxy = start_proxy(mode, args.port, {'SEGMENT_CACHE_MB': '64'})
+            try:
+                base = f"http://127.0.0.1:{args.port}"
+                asyncio.run(wait_ready(f"{base}/health"))
+                r = asyncio.run(load(base, upstream_url, args.clients, args.requests, args.scenario))
+                print(f"{mode:>8} {r['rps']:>8.0f} {r['mbps']:>8.0f} {r['p50']:>8.1f} {r['p99']:>9.1f} "
+                      f"{r['errors']:>7} {rss_peak_mb(proxy.pid):>7.0f}")
+            finally:
+                proxy.terminate()
+                proxy.wait()
+    finally:
+        upstream.terminate()
+        upstream.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""İstek izleme (tracing.py) maliyet mikro-benchmark'ı
+
+Tipik iki isteğin izini (önbellekten playlist, upstream'den segment) açık ve kapalı
+Recorder ile kaydeder; istek başına ek maliyeti mikrosaniye olarak yazar.
+
+Kullanım: python -m bench.trace_bench [--requests 200000] [--buffer 500]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tracing  # noqa: E402
+
+
+def playlist_hit(recorder):
+    trace = recorder.begin('GET', '/proxy/m3u?url=https%3A%2F%2Fexample.com%2Fpage%2Fch1.html')
+    with tracing.span('headers'):
+        pass
+    with tracing.span('resolve') as span:
+        span.set(cache='hit')
+    with tracing.span('playlist') as span:
+        span.set(cache='hit')
+    if trace is not None:
+        trace.route = '/proxy/m3u'
+        recorder.finish(trace, 200, 833)
+
+
+def segment_miss(recorder):
+    trace = recorder.begin('GET', '/proxy/ts?url=https%3A%2F%2Fcdn.example.com%2Fseg_1.ts&hs=abc')
+    with tracing.span('headers'):
+        pass
+    with tracing.span('admission', host='cdn.example.com'):
+        pass
+    with tracing.upstream('GET', 'cdn.example.com') as span:
+        tracing.upstream_timing('dns', 0.001)
+        tracing.upstream_timing('connect', 0.002)
+        span.set(status=200)
+    tracing.upstream_done(500000)
+    tracing.sent(500000, source='upstream')
+    if trace is not None:
+        trace.route = '/proxy/ts'
+        recorder.finish(trace, 200)
+
+
+def run(fn, recorder, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn(recorder)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--requests', type=int, default=200000)
+    ap.add_argument('--buffer', type=int, default=500)
+    args = ap.parse_args()
+
+    print(f"{'request':>14} {'off us':>8} {'on us':>8} {'overhead us':>12}")
+    for fn in (playlist_hit, segment_miss):
+        off = run(fn, tracing.Recorder(0, 1000), args.requests)
+        on = run(fn, tracing.Recorder(args.buffer, 1000), args.requests)
+        print(f"{fn.__name__:>14} {off:8.2f} {on:8.2f} {on - off:12.2f}")
+
+    recorder = tracing.Recorder(args.buffer, 1000)
+    for _ in range(args.buffer):
+        segment_miss(recorder)
+    start = time.perf_counter()
+    recorder.query(limit=args.buffer)
+    print(f"query {args.buffer} traces: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
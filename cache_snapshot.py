@@ -0,0 +1,70 @@
+"""Önbellek snapshot'ları (yeniden başlatmada sıcak açılış için)
+
+Dosya: MAGIC + zlib(pickle({namespace: [(key, value, stored, ttl, keep_until, hits), ...]})).
+Kayıtlar LRU sırasıyla (eskiden yeniye) yazılır, yüklemede bu sırayla eklenir; keep_until
+(TTL + stale penceresi) geçmiş kayıtlar atlanır. Yazma geçici dosya + os.replace ile atomiktir,
+yarım kalan snapshot okunmaz.
+
+Tek süreçte app.py kendi TTLCache'lerini, launcher.py altında master shared_cache deposunu
+yazar/yükler - dosya biçimi aynıdır. Dosya sadece uygulamanın kendisi tarafından yazılır
+(pickle); dizin başka kullanıcıların yazabileceği bir yerde olmamalı.
+"""
+import logging
+import os
+import pickle
+import tempfile
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SFSNAP1\n'
+COMPRESS_LEVEL = 1  # hız öncelikli - resolve kayıtları yine de ~5x küçülür
+# Kalıcı namespace'ler (make_cache / shared_cache adlarıyla). Playlist gövdelerindeki header seti
+# token'ları kendi içinde taşınır (HMAC + sıkıştırılmış header'lar) - header_sets tablosu gerekmez
+NAMESPACES = ('resolve', 'resolve_source', 'embed', 'site', 'server_key', 'auth', 'playlist', 'key')
+
+
+def write(path, spaces):
+    """{namespace: [kayıt]} yaz; dosya boyutunu döndür"""
+    data = MAGIC + zlib.compress(pickle.dumps(spaces, pickle.HIGHEST_PROTOCOL), COMPRESS_LEVEL)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return len(data)
+
+
+def read(path):
+    """{namespace: [kayıt]} (süresi dolanlar atılmış) ya da None: dosya yok, bozuk veya eski biçim"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f"Cache snapshot unreadable: {e}")
+        return None
+    if not data.startswith(MAGIC):
+        logger.warning(f"Cache snapshot {path} has an unknown format, ignored")
+        return None
+    try:
+        spaces = pickle.loads(zlib.decompress(data[len(MAGIC):]))
+    except Exception as e:
+        logger.warning(f"Cache snapshot {path} is corrupt, ignored: {e}")
+        return None
+    now = time.time()
+    return {ns: [entry for entry in entries if entry[4] > now] for ns, entries in spaces.items()}
+
+
+def count(spaces):
+    return sum(len(entries) for entries in spaces.values())
@@ -0,0 +1,317 @@
+"""Tek geçişli HLS playlist yeniden yazıcı (master + media playlist)"""
+import base64
+import hashlib
+import hmac
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from urllib.parse import quote, urljoin, urlparse
+
+# PERFORMANS İYİLEŞTİRMESİ: Pattern'lar bir kez derlenir
+URI_ATTR_RE = re.compile(r'URI="([^"]+)"')
+BYTERANGE_ATTR_RE = re.compile(r'BYTERANGE="(\d+)(?:@(\d+))?",?')
+SCHEME_RE = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.\-]*:')
+
+# URI taşıyan tag'ler -> hedef proxy endpoint'i
+URI_TAGS = {
+    '#EXT-X-KEY': '/proxy/key',
+    '#EXT-X-SESSION-KEY': '/proxy/key',
+    '#EXT-X-MAP': '/proxy/ts',
+    '#EXT-X-PART': '/proxy/ts',
+    '#EXT-X-PRELOAD-HINT': '/proxy/ts',
+    '#EXT-X-MEDIA': '/proxy/m3u',
+    '#EXT-X-I-FRAME-STREAM-INF': '/proxy/m3u',
+    '#EXT-X-RENDITION-REPORT': '/proxy/m3u',
+}
+CHUNK_LINES = 512
+# Alt aralık segment anahtarı: <url>#bytes=<başlangıç>-<bitiş> (fragment upstream'e gitmez)
+BYTERANGE_KEY = '#bytes='
+
+# quote(s) (safe='/') ile aynı sonuç - ASCII için C seviyesinde str.translate
+_QUOTE_TABLE = {
+    c: f'%{c:02X}' for c in range(128)
+    if not (chr(c).isalnum() or chr(c) in '_.-~/')
+}
+
+
+def fast_quote(s):
+    """urllib.parse.quote hızlı yolu"""
+    if s.isascii():
+        return s.translate(_QUOTE_TABLE)
+    return quote(s)
+
+
+# PERFORMANS İYİLEŞTİRMESİ: Header seti URL'de kısa, imzalı ve kendi içinde taşınan token olarak gider
+HEADER_TOKENS = os.environ.get('HEADER_TOKENS', '1') != '0'
+HEADER_SETS_MAX = int(os.environ.get('HEADER_SETS_MAX', '10000'))
+TOKEN_MAC_BYTES = 9
+MAX_TOKEN_CHARS = 2048
+MAX_HEADER_BYTES = 8192  # çözülmüş header seti üst sınırı (sıkıştırma bombasına karşı)
+# deflate preset sözlüğü: yaygın header adları ve tarayıcı UA'sı token'da birkaç byte'a iner
+_ZDICT = (b"Origin:https://\nReferer:https://\nUser-Agent:Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+          b"AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36\nUser-Agent:Mozilla/5.0")
+
+
+class InvalidHeaderToken(Exception):
+    """hs token'ı çözülemedi ya da imzası tutmadı"""
+
+
+def _pack(items):
+    deflate = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=_ZDICT)
+    return deflate.compress("\n".join(f"{k}:{v}" for k, v in items).encode()) + deflate.flush()
+
+
+def _unpack(payload):
+    inflate = zlib.decompressobj(-15, zdict=_ZDICT)
+    data = inflate.decompress(payload, MAX_HEADER_BYTES)
+    if inflate.unconsumed_tail or not inflate.eof:
+        raise ValueError("truncated or oversized header set")
+    headers = {}
+    for line in data.decode().split("\n"):
+        name, sep, value = line.partition(":")
+        if not sep or not name:
+            raise ValueError("malformed header line")
+        headers[name] = value
+    return headers
+
+
+class HeaderSets:
+    """Header seti <-> imzalı token tablosu (LRU sınırlı).
+
+    Token = base64url(HMAC[:9] + deflate(header seti)): tabloda olmayan token (yeniden başlatma,
+    LRU'dan düşme, başka worker) çözülüp imzası doğrulanır. Tablo sadece sıcak yolda çözme
+    maliyetini kaldırır; token deterministiktir.
+    """
+
+    def __init__(self, secret, maxsize):
+        self.secret = secret.encode() if isinstance(secret, str) else secret
+        self.maxsize = maxsize
+        self._tokens = OrderedDict()  # token -> headers dict
+        self._by_items = {}  # items tuple -> token
+        self._lock = threading.Lock()
+        self.decoded = 0  # tabloda olmayıp çözülen token'lar
+        self.rejected = 0
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def sign(self, payload):
+        return hmac.new(self.secret, payload, hashlib.sha256).digest()[:TOKEN_MAC_BYTES]
+
+    def intern(self, items):
+        """Header setini kaydet, token'ını döndür (items: tuple(headers.items()))"""
+        token = self._by_items.get(items)
+        if token is not None and token in self._tokens:
+            return token
+        payload = _pack(items)
+        token = base64.urlsafe_b64encode(self.sign(payload) + payload).rstrip(b'=').decode()
+        self._add(token, dict(items))
+        return token
+
+    def _add(self, token, headers):
+        with self._lock:
+            if token in self._tokens:
+                return
+            self._tokens[token] = headers
+            self._by_items[tuple(headers.items())] = token
+            while len(self._tokens) > self.maxsize:
+                old, old_headers = self._tokens.popitem(last=False)
+                self._by_items.pop(tuple(old_headers.items()), None)
+
+    def get(self, token):
+        """Token'ın header setini döndür (paylaşılan dict - değiştirmeyin); geçersizse InvalidHeaderToken"""
+        headers = self._tokens.get(token)
+        if headers is not None:
+            self._tokens.move_to_end(token)
+            return headers
+        try:
+            headers = self._decode(token)
+        except InvalidHeaderToken:
+            self.rejected += 1
+            raise
+        self.decoded += 1
+        self._add(token, headers)
+        return headers
+
+    def _decode(self, token):
+        if len(token) > MAX_TOKEN_CHARS:
+            raise InvalidHeaderToken("token too long")
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        except ValueError:
+            raise InvalidHeaderToken("token is not base64") from None
+        mac, payload = raw[:TOKEN_MAC_BYTES], raw[TOKEN_MAC_BYTES:]
+        if not payload or not hmac.compare_digest(mac, self.sign(payload)):
+            raise InvalidHeaderToken("bad token signature")
+        try:
+            return _unpack(payload)
+        except (zlib.error, ValueError) as e:
+            raise InvalidHeaderToken(f"bad token payload: {e}") from None
+
+
+header_sets = HeaderSets(os.environ.get('SECRET_KEY', 'streamflow-fast'), HEADER_SETS_MAX)
+
+
+@lru_cache(maxsize=256)
+def _legacy_query(items):
+    return "&".join([f"h_{quote(k)}={quote(v)}" for k, v in items])
+
+
+def header_query(items):
+    """Header seti için query string'i: hs=<token> veya eski h_ parametreleri
+    (items: tuple(headers.items()))"""
+    if HEADER_TOKENS:
+        return f"hs={header_sets.intern(items)}"
+    return _legacy_query(items)
+
+
+class _Resolver:
+    """Göreli URI'leri playlist URL'sine göre mutlak yap (sık durumlar urljoin'siz)"""
+    __slots__ = ('final', 'origin', 'base', 'qbase')
+
+    def __init__(self, final):
+        parsed = urlparse(final)
+        self.final = final
+        self.origin = f"{parsed.scheme}://{parsed.netloc}"
+        self.base = f"{self.origin}{parsed.path.rsplit('/', 1)[0]}/"
+        self.qbase = fast_quote(self.base)
+
+    def __call__(self, uri):
+        if '://' in uri:
+            return uri
+        if uri[0] == '/':
+            if uri[:2] == '//':
+                return urljoin(self.final, uri)
+            return self.origin + uri
+        if uri[0] == '.' or uri[0] == '?' or uri[0] == '#':
+            return urljoin(self.base, uri)
+        return self.base + uri
+
+    def quoted(self, uri):
+        """fast_quote(self(uri)) - sık durumda sadece göreli kısım quote'lanır"""
+        if '://' in uri or uri[0] in '/.?#':
+            return fast_quote(self(uri))
+        return self.qbase + fast_quote(uri)
+
+
+def absolute_uri(uri, final):
+    """URI'nin rewrite çıktısındaki mutlak hali (segment önbellek anahtarıyla aynı)"""
+    return _Resolver(final)(uri)
+
+
+def proxyable(uri):
+    """Sadece http(s) ve göreli URI'ler proxy'lenir (skd://, data: vb. aynen kalır)"""
+    m = SCHEME_RE.match(uri)
+    return m is None or m.group(0).lower() in ('http:', 'https:')
+
+
+def _byterange(length, offset, prev_end):
+    """EXT-X-BYTERANGE n[@o] -> "başlangıç-bitiş" (bitiş dahil, HTTP Range sözdizimi)"""
+    start = prev_end if offset is None else int(offset)
+    return f"{start}-{start + int(length) - 1}", start + int(length)
+
+
+def iter_rewrite(content, final, headers, segments=None):
+    """Playlist'i tek geçişte yeniden yaz, çıktıyı parça parça üret.
+
+    segments listesi verilirse media segmentlerinin mutlak URL'leri sırayla eklenir.
+    #EXT-X-BYTERANGE alt aralıkları ayrı proxy URL'lerine (br=) çevrilir; her aralık
+    bir kez indirilip paylaşılır, segment anahtarı <url>#bytes=<aralık> olur.
+    """
+    if not content.lstrip()[:7] == '#EXTM3U':
+        # Playlist değil (hata sayfası vb.) - dokunma
+        yield content
+        return
+
+    hq = header_query(tuple(headers.items()))
+    resolve = _Resolver(final)
+    uri_tags = URI_TAGS
+    variant = False  # önceki satır #EXT-X-STREAM-INF ise sıradaki URI bir playlist
+    byterange = None  # bekleyen #EXT-X-BYTERANGE (uzunluk, offset, tag satırı)
+    range_end = 0  # önceki alt aralığın sonu (offset'siz BYTERANGE için)
+
+    def sub_uri(tag_target):
+        def repl(m):
+            uri = m.group(1)
+            if not proxyable(uri):
+                return m.group(0)
+            return f'URI="{tag_target}?url={resolve.quoted(uri)}&{hq}"'
+        return repl
+
+    def sub_ranged_uri(line, default_offset):
+        # EXT-X-MAP / EXT-X-PART: BYTERANGE özniteliği URI'ye (br=) taşınır
+        br = BYTERANGE_ATTR_RE.search(line)
+        offset = br.group(2) if br.group(2) is not None else default_offset
+        if offset is None:
+            return None
+        rng = _byterange(br.group(1), offset, 0)[0]
+        m = URI_ATTR_RE.search(line)
+        if m is None or not proxyable(m.group(1)):
+            return None
+        line = BYTERANGE_ATTR_RE.sub('', line, 1).rstrip(',')
+        return URI_ATTR_RE.sub(f'URI="/proxy/ts?url={resolve.quoted(m.group(1))}&br={rng}&{hq}"', line, 1)
+
+    repls = {target: sub_uri(target) for target in set(uri_tags.values())}
+    out = []
+    append = out.append
+
+    for line in content.split('\n'):
+        line = line.strip()
+        if not line:
+            append(line)
+        elif line[0] != '#':
+            if not proxyable(line):
+                if byterange is not None:
+                    # URI proxy'lenmiyor: tag aynen kalır, aralığın sonu offset'siz sonraki tag için yine ilerler
+                    range_end = _byterange(byterange[0], byterange[1], range_end)[1]
+                    append(byterange[2])
+                    byterange = None
+                append(line)
+            elif variant:
+                variant = False
+                byterange = None
+                append(f"/proxy/m3u?url={resolve.quoted(line)}&{hq}")
+            elif byterange is not None:
+                rng, range_end = _byterange(byterange[0], byterange[1], range_end)
+                byterange = None
+                if segments is not None:
+                    segments.append(f"{resolve(line)}{BYTERANGE_KEY}{rng}")
+                append(f"/proxy/ts?url={resolve.quoted(line)}&br={rng}&{hq}")
+            else:
+                if segments is not None:
+                    segments.append(resolve(line))
+                append(f"/proxy/ts?url={resolve.quoted(line)}&{hq}")
+                if len(out) >= CHUNK_LINES:
+                    # Büyük (DVR) playlist'lerde çıktıyı parça parça ver
+                    out.append('')
+                    yield '\n'.join(out)
+                    out.clear()
+        elif line[:7] == '#EXT-X-':
+            colon = line.find(':')
+            name = line[:colon] if colon > 0 else line
+            if name == '#EXT-X-STREAM-INF':
+                variant = True
+            elif name == '#EXT-X-BYTERANGE':
+                length, _, offset = line[colon + 1:].strip().partition('@')
+                byterange = (length, offset or None, line)
+                continue  # proxy'lenen URI'de aralık URL'ye (br=) taşınır - tag kaldırılır
+            else:
+                target = uri_tags.get(name)
+                if target is not None and 'URI="' in line:
+                    ranged = None
+                    if 'BYTERANGE="' in line and name in ('#EXT-X-MAP', '#EXT-X-PART'):
+                        ranged = sub_ranged_uri(line, 0 if name == '#EXT-X-MAP' else None)
+                    line = ranged or URI_ATTR_RE.sub(repls[target], line)
+            append(line)
+        else:
+            append(line)
+
+    yield '\n'.join(out)
+
+
+def rewrite(content, final, headers, segments=None):
+    """Yeniden yazılmış playlist'i tek string olarak döndür"""
+    return ''.join(iter_rewrite(content, final, headers, segments))
@@ -0,0 +1,209 @@
+"""Çok süreçli üretim başlatıcısı (pre-fork master)
+
+Master dinleme soketini bir kez açar ve N worker'a (app.py, gevent veya asyncio)
+devreder; çekirdek bağlantıları worker'lar arasında dağıtır. Resolve, playlist ve
+key önbellekleri master'daki shared_cache daemon'u üzerinden paylaşılır.
+
+Sinyaller:
+  SIGHUP         yeni worker'ları başlat, hazır olunca eskileri nazikçe kapat (graceful reload)
+  SIGTERM/SIGINT worker'ları nazikçe kapat (GRACEFUL_TIMEOUT) ve çık
+
+CACHE_SNAPSHOT_PATH verilirse paylaşılan önbellek açılışta snapshot'tan yüklenir, periyodik
+olarak ve worker'lar kapandıktan sonra yazılır.
+
+Kullanım: WORKERS=4 python launcher.py
+"""
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import cache_snapshot
+import shared_cache
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s launcher %(message)s')
+logger = logging.getLogger('launcher')
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+HOST = os.environ.get('HOST', '0.0.0.0')
+PORT = int(os.environ.get('PORT', '7860'))
+GRACEFUL_TIMEOUT = float(os.environ.get('GRACEFUL_TIMEOUT', '30'))
+RELOAD_TIMEOUT = 30  # yeni worker'ların hazır olması için beklenecek süre
+SHARED_CACHE_MAX_BYTES = int(os.environ.get('SHARED_CACHE_MB', '256')) * 1024 * 1024
+SHARED_CACHE_ENTRIES = int(os.environ.get('SHARED_CACHE_ENTRIES', '50000'))  # namespace başına
+RESTART_DELAY_MAX = 30  # art arda çöken worker için en uzun bekleme
+CACHE_SNAPSHOT_PATH = os.environ.get('CACHE_SNAPSHOT_PATH', '')  # boş = kapalı
+CACHE_SNAPSHOT_INTERVAL = float(os.environ.get('CACHE_SNAPSHOT_INTERVAL', '60'))
+
+
+def cpu_limit():
+    """Kullanılabilir çekirdek sayısı (cgroup v2 CPU kotası dahil)"""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cpus = min(cpus, -(-int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+WORKERS = int(os.environ.get('WORKERS', '0')) or cpu_limit()
+
+
+class Worker:
+    __slots__ = ('slot', 'proc', 'started', 'failures')
+
+    def __init__(self, slot, proc, failures=0):
+        self.slot = slot
+        self.proc = proc
+        self.started = time.time()
+        self.failures = failures
+
+    @property
+    def key(self):
+        """shared_cache'teki istatistik anahtarı (app.shared.worker ile aynı)"""
+        return f"{self.slot}/{self.proc.pid}"
+
+
+class Master:
+    def __init__(self, workers):
+        self.count = workers
+        self.workers = []
+        self.listener = self._listen()
+        cache_path = os.environ.get('SHARED_CACHE_SOCKET') or os.path.join(
+            tempfile.gettempdir(), f'streamflow-{os.getpid()}', 'cache.sock')
+        self.cache = shared_cache.CacheServer(cache_path, SHARED_CACHE_ENTRIES, SHARED_CACHE_MAX_BYTES).start()
+        self.reload_requested = False
+        self.stopping = False
+        self.snapshot_changes = None
+        self.next_snapshot = time.time() + CACHE_SNAPSHOT_INTERVAL
+        if CACHE_SNAPSHOT_PATH:
+            self.restore_snapshot()
+
+    @staticmethod
+    def _listen():
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((HOST, PORT))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        return sock
+
+    def spawn(self, slot, failures=0):
+        fd = self.listener.fileno()
+        env = dict(os.environ, LISTEN_FD=str(fd), WORKER_ID=str(slot), WORKER_COUNT=str(self.count),
+                   SHARED_CACHE_SOCKET=self.cache.path, PORT=str(PORT))
+        proc = subprocess.Popen([sys.executable, os.path.join(ROOT, 'app.py')], cwd=ROOT, env=env, pass_fds=(fd,))
+        return Worker(slot, proc, failures)
+
+    def run(self):
+        signal.signal(signal.SIGHUP, self._on_reload)
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        self.workers = [self.spawn(slot) for slot in range(self.count)]
+        logger.info(f"listening on {HOST}:{PORT} with {self.count} workers "
+                    f"({os.environ.get('SERVER_MODE', 'gevent')}), shared cache {self.cache.path}")
+        try:
+            while not self.stopping:
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.reload()
+                self.reap()
+                if CACHE_SNAPSHOT_PATH and time.time() >= self.next_snapshot:
+                    self.save_snapshot()
+                time.sleep(0.5)
+        finally:
+            self.stop(self.workers)
+            if CACHE_SNAPSHOT_PATH:
+                self.save_snapshot()
+            self.cache.close()
+            self.listener.close()
+
+    def reap(self):
+        """Beklenmedik şekilde çıkan worker'ı yeniden başlat (art arda çökmelerde artan bekleme)"""
+        for n, worker in enumerate(self.workers):
+            code = worker.proc.poll()
+            if code is None:
+                continue
+            failures = worker.failures + 1 if time.time() - worker.started < 10 else 0
+            delay = min(RESTART_DELAY_MAX, 2 ** failures - 1)
+            logger.warning(f"worker {worker.key} exited with {code}, restarting in {delay}s")
+            time.sleep(delay)
+            self.workers[n] = self.spawn(worker.slot, failures)
+
+    def reload(self):
+        """Yeni nesil worker'lar hazır olunca eskileri kapat - dinleme soketi hiç kapanmaz"""
+        old = self.workers
+        new = [self.spawn(w.slot) for w in old]
+        deadline = time.time() + RELOAD_TIMEOUT
+        while True:
+            ready = self.cache.store.collect()
+            if all(w.key in ready for w in new):
+                break
+            if any(w.proc.poll() is not None for w in new):
+                logger.error("reload failed: new worker exited, keeping old workers")
+                self.stop(new)
+                return
+            if time.time() >= deadline or self.stopping:
+                logger.error(f"reload failed: new workers not ready within {RELOAD_TIMEOUT:g}s, keeping old workers")
+                self.stop(new)
+                return
+            time.sleep(0.2)
+        self.workers = new
+        logger.info(f"reload: {len(new)} new workers ready, stopping {len(old)} old workers")
+        self.stop(old)
+
+    def restore_snapshot(self):
+        """Snapshot'ı worker'lar başlamadan paylaşılan önbelleğe yükle"""
+        spaces = cache_snapshot.read(CACHE_SNAPSHOT_PATH)
+        if not spaces:
+            return
+        started = time.time()
+        added = self.cache.store.load(spaces)
+        self.snapshot_changes = self.cache.store.changes
+        logger.info(f"restored {added} cache entries from {CACHE_SNAPSHOT_PATH} in {time.time() - started:.2f}s")
+
+    def save_snapshot(self):
+        """Paylaşılan önbelleğin kalıcı namespace'lerini yaz (değişiklik yoksa atlanır)"""
+        self.next_snapshot = time.time() + CACHE_SNAPSHOT_INTERVAL
+        store = self.cache.store
+        changes = store.changes
+        if changes == self.snapshot_changes:
+            return
+        try:
+            spaces = store.snapshot(cache_snapshot.NAMESPACES)
+            cache_snapshot.write(CACHE_SNAPSHOT_PATH, spaces)
+        except Exception as e:
+            logger.warning(f"cache snapshot failed: {e}")
+            return
+        self.snapshot_changes = changes
+
+    @staticmethod
+    def stop(workers):
+        for worker in workers:
+            if worker.proc.poll() is None:
+                worker.proc.terminate()
+        deadline = time.time() + GRACEFUL_TIMEOUT + 5
+        for worker in workers:
+            try:
+                worker.proc.wait(max(0.1, deadline - time.time()))
+            except subprocess.TimeoutExpired:
+                logger.warning(f"worker {worker.key} did not stop in time, killing")
+                worker.proc.kill()
+                worker.proc.wait()
+
+    def _on_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def _on_stop(self, signum, frame):
+        self.stopping = True
+
+
+if __name__ == '__main__':
+    Master(WORKERS).run()
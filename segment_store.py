@@ -0,0 +1,261 @@
+"""Disk tabanlı segment deposu (DVR/VOD geri sarma için)
+
+Segmentler dosya olarak tutulur: <kök>/<ab>/<sha1(url)>.<l|v>.ts
+- l: canlı segment (kısa ömür), v: #EXT-X-ENDLIST playlist'inin segmenti (uzun ömür)
+- mtime = yazılma zamanı, atime = son erişim -> başlangıçta sadece dizin taranarak indeks kurulur
+"""
+import hashlib
+import logging
+import mmap
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+SUFFIX = '.ts'
+TMP_SUFFIX = '.tmp'
+VOD_MARKS_MAX = 200000  # hatırlanan ENDLIST segment URL sayısı
+
+
+def url_key(url):
+    return hashlib.sha1(url.encode()).hexdigest()
+
+
+class MappedSegment:
+    """mmap'lenmiş segment dosyası - SegmentData ile aynı arayüz (view/release)"""
+    __slots__ = ('_mm', '_view', 'length')
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+        self.length = len(self._mm)
+
+    def __len__(self):
+        return self.length
+
+    def view(self, start=0, end=None):
+        return self._view[start:self.length if end is None else end]
+
+    def release(self):
+        try:
+            self._view.release()
+            self._mm.close()
+        except BufferError:
+            pass  # gönderilmekte olan dilim varsa GC kapatır
+
+
+class DiskSegmentStore:
+    """Byte bütçeli, LRU indeksli disk segment deposu"""
+
+    def __init__(self, root, max_bytes, live_ttl, vod_ttl, adopt=False, shard=None):
+        self.root = root
+        self.adopt = adopt  # çok süreçli mod: başka süreçlerin yazdığı dosyalar indekste yoksa diskte aranır
+        # (sıra, adet): dizini paylaşan süreçlerden biri - bütçenin payı ve taramada sahiplenilen anahtarlar
+        self.shard = shard
+        self.max_bytes = max_bytes // shard[1] if shard else max_bytes
+        self.live_ttl = live_ttl
+        self.vod_ttl = vod_ttl
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.scan_seconds = 0.0
+        self._index = OrderedDict()  # key -> [size, stored, vod, written] (en eski erişim başta)
+        self._vod_urls = OrderedDict()  # ENDLIST playlist'lerinden gelen segment URL'leri
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.scan()
+
+    def __len__(self):
+        return len(self._index)
+
+    def _path(self, key, vod):
+        return os.path.join(self.root, key[:2], f"{key}.{'v' if vod else 'l'}{SUFFIX}")
+
+    def _expired(self, entry, now):
+        return entry[1] + (self.vod_ttl if entry[2] else self.live_ttl) < now
+
+    def scan(self):
+        """Dizini tarayıp indeksi yeniden kur (süresi dolmuş ve yarım kalmış dosyalar silinir)"""
+        start = time.time()
+        found = []
+        for shard in os.scandir(self.root):
+            if not shard.is_dir(follow_symlinks=False):
+                continue
+            for f in os.scandir(shard.path):
+                name = f.name
+                try:
+                    if name.endswith(TMP_SUFFIX):
+                        os.unlink(f.path)
+                        continue
+                    if not name.endswith(SUFFIX):
+                        continue
+                    key, kind = name[:-len(SUFFIX)].rsplit('.', 1)
+                    if not self._owns(key):
+                        continue
+                    st = f.stat()
+                except (OSError, ValueError):
+                    continue
+                entry = [st.st_size, st.st_mtime, kind == 'v', False]
+                if self._expired(entry, start):
+                    self._unlink(f.path)
+                    continue
+                found.append((max(st.st_atime, st.st_mtime), key, entry))
+        found.sort()
+        with self._lock:
+            self._index.clear()
+            self.bytes = 0
+            for _, key, entry in found:
+                self._index[key] = entry
+                self.bytes += entry[0]
+            self._evict()
+        self.scan_seconds = time.time() - start
+        if found:
+            logger.info(f"Disk segment store: {len(self._index)} segments, "
+                           f"{self.bytes // (1024 * 1024)} MB indexed in {self.scan_seconds:.2f}s")
+
+    def mark_vod(self, urls):
+        """ENDLIST playlist'inin segmentleri - diske uzun ömürle yazılır"""
+        with self._lock:
+            for url in urls:
+                self._vod_urls[url] = True
+                self._vod_urls.move_to_end(url)
+            while len(self._vod_urls) > VOD_MARKS_MAX:
+                self._vod_urls.popitem(last=False)
+
+    def lookup(self, url):
+        """Geçerli kaydın dosya yolu ve boyutu: (path, size) ya da None"""
+        key = url_key(url)
+        now = time.time()
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None and self.adopt:
+                return self._shared_file(key, now)
+            if entry is None:
+                self.misses += 1
+                return None
+            path = self._path(key, entry[2])
+            if self._expired(entry, now):
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self.hits += 1
+            size, stored = entry[0], entry[1]
+        try:
+            os.utime(path, (now, stored))  # atime: yeniden başlatmada LRU sırası
+        except OSError:
+            self.forget(url)
+            return None
+        return path, size
+
+    def open(self, url):
+        """Kaydı mmap'le: MappedSegment ya da None"""
+        found = self.lookup(url)
+        if found is None:
+            return None
+        try:
+            return MappedSegment(found[0])
+        except (OSError, ValueError):
+            self.forget(url)
+            return None
+
+    def forget(self, url):
+        """Dosyası kaybolmuş/okunamayan kaydı indeksten düş"""
+        with self._lock:
+            if url_key(url) in self._index:
+                self._drop(url_key(url))
+
+    def put(self, url, view):
+        """Segmenti geçici dosyaya yazıp atomik olarak yerine taşı"""
+        size = len(view)
+        if not size or size > self.max_bytes:
+            return False
+        key = url_key(url)
+        vod = url in self._vod_urls
+        path = self._path(key, vod)
+        tmp = f"{path}.{threading.get_ident()}{TMP_SUFFIX}"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(view)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Disk segment write error: {e}")
+            self._unlink(tmp)
+            return False
+        with self._lock:
+            old = self._index.pop(key, None)
+            if old is not None:
+                self.bytes -= old[0]
+                if old[2] != vod:
+                    self._unlink(self._path(key, old[2]))
+            self._index[key] = [size, time.time(), vod, True]
+            self.bytes += size
+            self.writes += 1
+            self._evict()
+        return True
+
+    def clear(self):
+        with self._lock:
+            for key, entry in list(self._index.items()):
+                self._unlink(self._path(key, entry[2]))
+            self._index.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {
+            "root": self.root,
+            "entries": len(self._index),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "vod_marked": len(self._vod_urls),
+            "scan_seconds": round(self.scan_seconds, 3)
+        }
+
+    def _owns(self, key):
+        """Taramada bu sürecin indekslediği dosya mı (paylaşımlı dizinde her dosya tek bir payda sayılır)"""
+        return self.shard is None or int(key[:8], 16) % self.shard[1] == self.shard[0]
+
+    def _shared_file(self, key, now):
+        """Başka bir sürecin yazdığı dosya: (path, size) ya da None. Salt okunur sunulur - indekse ve bütçeye
+        girmez (dosya yazanın ya da payın sahibinin bütçesinde sayılır, silmek de onun işidir)"""
+        for vod in (False, True):
+            path = self._path(key, vod)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if self._expired((st.st_size, st.st_mtime, vod), now):
+                break
+            self.hits += 1
+            return path, st.st_size
+        self.misses += 1
+        return None
+
+    def _evict(self):
+        while self._index and self.bytes > self.max_bytes:
+            key = next(iter(self._index))
+            self._drop(key)
+            self.evictions += 1
+
+    def _drop(self, key):
+        size, _, vod, written = self._index.pop(key)
+        self.bytes -= size
+        if written or self._owns(key):  # başka worker'ın yazdığı, payı dışındaki dosyayı silme
+            self._unlink(self._path(key, vod))
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
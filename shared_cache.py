@@ -0,0 +1,354 @@
+"""Süreçler arası paylaşılan önbellek (çok süreçli mod için yerel cache daemon'u)
+
+launcher.py master süreci CacheServer'ı Unix socket üzerinde çalıştırır; worker'lar
+CacheClient ile bağlanır. Her worker'daki TTLCache birinci seviye kalır, daemon
+ikinci seviyedir - böylece worker sayısı arttıkça hit oranı N'e bölünmez.
+
+Mesajlar: 4 byte uzunluk + pickle. Socket sadece aynı kullanıcının erişebildiği
+dizinde (0700) oluşturulur; istemciler aynı uygulamanın worker'larıdır.
+"""
+import logging
+import os
+import pickle
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('!I')
+STATS_MAX_AGE = 30  # bu süre boyunca yayın yapmayan worker istatistiği düşer
+RECONNECT_DELAY = 2.0  # daemon'a ulaşılamazsa tekrar denemeden önce bekleme (sn)
+CALL_TIMEOUT = 0.1  # yanıt bu sürede gelmezse miss (takılan daemon worker'ı bekletmesin)
+MAX_CONNECTIONS = 8  # worker başına daemon bağlantısı (daemon'da her bağlantı bir thread)
+
+
+def _send(sock, message):
+    data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    pos = 0
+    while pos < size:
+        n = sock.recv_into(view[pos:])
+        if not n:
+            raise ConnectionError("shared cache connection closed")
+        pos += n
+    return buf
+
+
+def _recv(sock):
+    (size,) = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    data = _recv_exact(sock, size)
+    return pickle.loads(data), size
+
+
+class Store:
+    """Namespace başına LRU + toplam byte bütçesi (daemon tarafı)"""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.changes = 0  # snapshot yazıcısı için
+        self._spaces = {}  # namespace -> OrderedDict(key -> [value, stored, ttl, expires, size])
+        self._lru = OrderedDict()  # (namespace, key) -> None (byte bütçesi için global sıra)
+        self._stats = {}  # worker -> (updated, payload)
+        self._lock = threading.Lock()
+
+    def get(self, ns, key):
+        with self._lock:
+            entry = self._spaces.get(ns, {}).get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[3] <= time.time():
+                self._drop(ns, key)
+                self.misses += 1
+                return None
+            self._lru.move_to_end((ns, key))
+            self.hits += 1
+            return entry[0], entry[1], entry[2]
+
+    def set(self, ns, key, value, stored, ttl, keep, size):
+        with self._lock:
+            space = self._spaces.setdefault(ns, OrderedDict())
+            if key in space:
+                self._drop(ns, key)
+            space[key] = [value, stored, ttl, stored + keep, size]
+            self._lru[(ns, key)] = None
+            self.bytes += size
+            self.changes += 1
+            while len(space) > self.max_entries:
+                self._drop(ns, next(iter(space)))
+                self.evictions += 1
+            while self.bytes > self.max_bytes and self._lru:
+                self._drop(*next(iter(self._lru)))
+                self.evictions += 1
+
+    def delete(self, ns, key):
+        with self._lock:
+            if key in self._spaces.get(ns, ()):
+                self._drop(ns, key)
+                self.changes += 1
+
+    def clear(self, ns):
+        with self._lock:
+            for key in list(self._spaces.get(ns, ())):
+                self._drop(ns, key)
+            self.changes += 1
+
+    def snapshot(self, namespaces):
+        """cache_snapshot biçiminde kayıtlar (global LRU sırasıyla); isabet sayısı tutulmaz"""
+        wanted = set(namespaces)
+        spaces = {}
+        with self._lock:
+            for ns, key in self._lru:
+                if ns in wanted:
+                    value, stored, ttl, expires, _ = self._spaces[ns][key]
+                    spaces.setdefault(ns, []).append((key, value, stored, ttl, expires, 0))
+        return spaces
+
+    def load(self, spaces):
+        """Snapshot kayıtlarını ekle (süresi dolanlar atlanır); eklenen sayı"""
+        now = time.time()
+        added = 0
+        for ns, entries in spaces.items():
+            for key, value, stored, ttl, keep_until, _ in entries:
+                if keep_until > now:
+                    size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+                    self.set(ns, key, value, stored, ttl, keep_until - stored, size)
+                    added += 1
+        return added
+
+    def publish(self, worker, payload):
+        if payload is None:
+            self._stats.pop(worker, None)  # worker kapandı
+        else:
+            self._stats[worker] = (time.time(), payload)
+
+    def collect(self):
+        now = time.time()
+        for worker, (updated, _) in list(self._stats.items()):
+            if now - updated > STATS_MAX_AGE:
+                self._stats.pop(worker, None)
+        return {worker: payload for worker, (_, payload) in self._stats.items()}
+
+    def info(self):
+        return {
+            "entries": {ns: len(space) for ns, space in self._spaces.items()},
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+    def _drop(self, ns, key):
+        entry = self._spaces[ns].pop(key)
+        self._lru.pop((ns, key), None)
+        self.bytes -= entry[4]
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        store = self.server.store
+        sock = self.request
+        while True:
+            try:
+                message, size = _recv(sock)
+            except (ConnectionError, OSError, struct.error):
+                return
+            op = message[0]
+            if op == 'get':
+                _send(sock, store.get(message[1], message[2]))
+            elif op == 'set':
+                store.set(*message[1:], size=size)
+            elif op == 'del':
+                store.delete(message[1], message[2])
+            elif op == 'clear':
+                store.clear(message[1])
+            elif op == 'publish':
+                store.publish(message[1], message[2])
+            elif op == 'collect':
+                _send(sock, store.collect())
+            elif op == 'info':
+                _send(sock, store.info())
+
+
+class CacheServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Bağlantı başına thread'li Unix socket cache daemon'u"""
+    daemon_threads = True
+
+    def __init__(self, path, max_entries, max_bytes):
+        if os.path.exists(path):
+            os.unlink(path)
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        self.path = path
+        self.store = Store(max_entries, max_bytes)
+        old_umask = os.umask(0o077)
+        try:
+            super().__init__(path, _Handler)
+        finally:
+            os.umask(old_umask)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='shared-cache', daemon=True).start()
+        return self
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class CacheClient:
+    """Worker tarafı: havuzlu bağlantılarla daemon'a erişim.
+
+    Daemon'a ulaşılamazsa ya da yanıt timeout içinde gelmezse çağrılar miss gibi
+    davranır (servis kesilmez) ve RECONNECT_DELAY boyunca tekrar denenmez. Açık
+    bağlantı sayısı max_connections ile sınırlı: hepsi kullanımdaysa en çok timeout
+    kadar beklenir, sonra miss.
+    """
+
+    def __init__(self, path, worker=None, timeout=CALL_TIMEOUT, max_connections=MAX_CONNECTIONS):
+        self.path = path
+        self.worker = worker or str(os.getpid())
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.errors = 0
+        self.exhausted = 0  # havuz dolu olduğu için miss sayılan çağrılar
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        if time.time() < self._down_until:
+            return None
+        if not self._slots.acquire(timeout=self.timeout):
+            self.exhausted += 1
+            return None
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError as e:
+            self._discard(sock)
+            self._failed(e)
+            return None
+        return sock
+
+    def _release(self, sock):
+        with self._lock:
+            if len(self._idle) < self.max_connections:
+                self._idle.append(sock)
+                sock = None
+        if sock is not None:
+            sock.close()
+        self._slots.release()
+
+    def _discard(self, sock):
+        sock.close()
+        self._slots.release()
+
+    def _failed(self, error):
+        self.errors += 1
+        if time.time() >= self._down_until:
+            logger.warning(f"Shared cache unavailable: {error}")
+        self._down_until = time.time() + RECONNECT_DELAY
+
+    def _call(self, message, reply):
+        sock = self._acquire()
+        if sock is None:
+            return None
+        try:
+            _send(sock, message)
+            result = _recv(sock)[0] if reply else None
+        except (OSError, ConnectionError, struct.error, pickle.UnpicklingError) as e:
+            # socket.timeout da OSError: yarım kalan yanıt bağlantıyı kullanılmaz kılar
+            self._discard(sock)
+            self._failed(e)
+            return None
+        self._release(sock)
+        return result
+
+    def get(self, ns, key):
+        """(value, stored, ttl) ya da None"""
+        return self._call(('get', ns, key), True)
+
+    def set(self, ns, key, value, stored, ttl, keep):
+        """Yanıt beklenmez; keep: daemon'da tutulma süresi (ttl + stale penceresi)"""
+        self._call(('set', ns, key, value, stored, ttl, keep), False)
+
+    def delete(self, ns, key):
+        self._call(('del', ns, key), False)
+
+    def clear(self, ns):
+        self._call(('clear', ns), False)
+
+    def publish(self, payload):
+        """Bu worker'ın stats_payload()'ı; None = worker kapanıyor"""
+        self._call(('publish', self.worker, payload), False)
+
+    def collect(self):
+        return self._call(('collect',), True) or {}
+
+    def info(self):
+        return self._call(('info',), True)
+
+
+# /api/stats birleştirme kuralları: ayar değerleri toplanmaz, oranlar ortalanır
+CONFIG_KEYS = frozenset(('max_entries', 'max_bytes', 'chunk_size', 'root', 'enabled', 'state', 'slow_ms',
+                         'ttl', 'per_host'))
+AVERAGED_KEYS = frozenset(('score', 'latency_ms', 'error_rate', 'scan_seconds', 'p50_ms', 'p99_ms'))
+
+
+def merge_stats(payloads):
+    """Worker'ların stats_payload() çıktılarını tek görünümde birleştir"""
+    merged = {}
+    for payload in payloads:
+        _merge_into(merged, payload)
+    return _finish(merged, len(payloads))
+
+
+def _merge_into(target, source):
+    for key, value in source.items():
+        current = target.get(key)
+        if isinstance(value, dict):
+            _merge_into(target.setdefault(key, {}), value)
+        elif isinstance(value, list):
+            target[key] = (current or []) + value
+        elif key in CONFIG_KEYS or isinstance(value, (str, bool)) or value is None:
+            if current is None:
+                target[key] = value
+        elif key in AVERAGED_KEYS:
+            total, count = current or (0, 0)
+            target[key] = (total + value, count + 1)
+        else:
+            target[key] = (current or 0) + value
+
+
+def _finish(merged, count):
+    for key, value in merged.items():
+        if isinstance(value, dict):
+            _finish(value, count)
+        elif key in AVERAGED_KEYS and isinstance(value, tuple):
+            total, n = value
+            merged[key] = round(total / n, 3) if n else 0
+    return merged
@@ -0,0 +1,125 @@
+"""Hafif Prometheus metrikleri (bağımlılıksız, text exposition format 0.0.4)
+
+Kayıt sıcak yolda çalışır: bir dict araması + bisect, kilit yok (sayaçlar
+GIL/gevent altında birkaç yarış kaybedebilir - metrik için kabul edilebilir).
+"""
+from bisect import bisect_left
+from collections import OrderedDict
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+MAX_SERIES = 500  # aile başına etiket kombinasyonu; fazlası "other" altında toplanır
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # son hücre: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Family:
+    """Aynı isimli metrik serileri (etiket değerleri tuple'ı -> değer)"""
+
+    def __init__(self, name, kind, help_text, labelnames, buckets=None, collect=None):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.collect = collect  # gauge: render anında {etiketler: değer} döndüren fonksiyon
+        self.series = {}
+
+    def _key(self, labels):
+        if labels in self.series or len(self.series) < MAX_SERIES:
+            return labels
+        return ('other',) * len(self.labelnames)
+
+    def inc(self, labels=(), amount=1):
+        series = self.series
+        try:
+            series[labels] += amount
+        except KeyError:
+            key = self._key(labels)
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, labels, value):
+        hist = self.series.get(labels)
+        if hist is None:
+            hist = self.series.setdefault(self._key(labels), Histogram(self.buckets))
+        hist.observe(value)
+
+    def render(self, out):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} {self.kind}")
+        series = self.collect() if self.collect is not None else self.series
+        for labels, value in list(series.items()):
+            if self.kind == 'histogram':
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), value.counts):
+                    cumulative += count
+                    le = f'le="{_number(float(bound))}"'
+                    out.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+                out.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(value.sum)}")
+                out.append(f"{self.name}_count{_labels(self.labelnames, labels)} {value.count}")
+            else:
+                out.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+
+
+class Registry:
+    def __init__(self):
+        self._families = OrderedDict()
+
+    def _add(self, family):
+        self._families[family.name] = family
+        return family
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(Family(name, 'counter', help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Family(name, 'histogram', help_text, labelnames, buckets=buckets))
+
+    def gauge(self, name, help_text, labelnames, collect):
+        """Değeri render anında collect() ile okunan metrik (sıcak yolda maliyet yok)"""
+        return self._add(Family(name, 'gauge', help_text, labelnames, collect=collect))
+
+    def collected_counter(self, name, help_text, labelnames, collect):
+        """Mevcut sayaçlardan render anında okunan counter"""
+        return self._add(Family(name, 'counter', help_text, labelnames, collect=collect))
+
+    def render(self):
+        out = []
+        for family in self._families.values():
+            family.render(out)
+        out.append('')
+        return '\n'.join(out)
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
@@ -0,0 +1,315 @@
+"""İstek izleri (span'ler) için sabit boyutlu halka tampon + örnekleyici profiler
+
+Her istek bir Trace açar; aktif iz contextvar'da tutulur (gevent'te greenlet, asyncio'da
+task başına). Kod içindeki span()/upstream() çağrıları iz yoksa hiçbir şey kaydetmez -
+kapalıyken maliyet bir contextvar okumasıdır. Biten izler son N iz olarak deque'da kalır.
+
+Upstream çağrıları tek span'dir: dns/connect (yeni bağlantı açıldıysa), ttfb ve transfer
+süreleri ile byte sayısı aynı span'in alanlarıdır.
+"""
+import contextvars
+import os
+import sys
+import time
+from collections import Counter, deque
+
+MAX_SPANS = 64  # iz başına; uzun yaşayan akışlar izi büyütmesin
+MAX_PATH = 300
+MAX_ERROR = 300
+
+_trace = contextvars.ContextVar('streamflow_trace', default=None)
+_upstream = contextvars.ContextVar('streamflow_upstream', default=None)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+class Span:
+    __slots__ = ('name', 'start', 'duration', 'attrs')
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.start = time.perf_counter()
+        self.duration = None
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if exc is not None:
+            self.attrs['error'] = _describe(exc)
+        return False
+
+    def to_dict(self, origin):
+        return {"name": self.name, "start_ms": _ms(self.start - origin),
+                "ms": _ms(self.duration) if self.duration is not None else None, **self.attrs}
+
+
+class _NullSpan:
+    """İz yokken dönen span: tüm işlemler boş"""
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    __slots__ = ('id', 'method', 'path', 'route', 'time', 'start', 'headers_at', 'end', 'status',
+                 'bytes', 'error', 'attrs', 'spans', 'dropped')
+
+    def __init__(self, trace_id, method, path):
+        self.id = trace_id
+        self.method = method
+        self.path = path[:MAX_PATH]
+        self.route = None
+        self.time = time.time()
+        self.start = time.perf_counter()
+        self.headers_at = None
+        self.end = None
+        self.status = None
+        self.bytes = None
+        self.error = None
+        self.attrs = {}
+        self.spans = []
+        self.dropped = 0
+
+    def span(self, name, attrs):
+        span = Span(name, attrs)
+        if len(self.spans) < MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+        return span
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    @property
+    def failed(self):
+        return self.error is not None or (self.status is not None and self.status >= 500)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "time": round(self.time, 3),
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "ms": _ms(self.duration),
+            "headers_ms": _ms(self.headers_at - self.start) if self.headers_at is not None else None,
+            "bytes": self.bytes,
+            "error": self.error,
+            **self.attrs,
+            "spans": [span.to_dict(self.start) for span in list(self.spans)],
+            "dropped_spans": self.dropped
+        }
+
+
+def _describe(exc):
+    return f"{type(exc).__name__}: {exc}"[:MAX_ERROR]
+
+
+class Recorder:
+    """Son `size` izi tutan halka tampon (size=0: izleme kapalı)"""
+
+    def __init__(self, size, slow_ms):
+        self.size = size
+        self.slow_ms = slow_ms
+        self.traces = deque(maxlen=size or 1)
+        self.started = 0
+        self.failed = 0
+        self._ids = iter(range(1, sys.maxsize))
+
+    @property
+    def enabled(self):
+        return self.size > 0
+
+    def begin(self, method, path):
+        """İstek izini başlat ve aktif yap (kapalıysa None)"""
+        if not self.size:
+            return None
+        self.started += 1
+        trace = Trace(next(self._ids), method, path)
+        _trace.set(trace)
+        _upstream.set(None)
+        return trace
+
+    def finish(self, trace, status, nbytes=None):
+        """İzi kapat ve halka tampona ekle"""
+        trace.end = time.perf_counter()
+        trace.status = status
+        if trace.bytes is None:
+            trace.bytes = nbytes
+        if trace.failed:
+            self.failed += 1
+        self.traces.append(trace)
+        if _trace.get() is trace:
+            _trace.set(None)
+            _upstream.set(None)
+
+    def query(self, limit=50, min_ms=0, failed=False, route=None, trace_id=None):
+        """Yeniden eskiye izler (filtreli)"""
+        out = []
+        for trace in reversed(list(self.traces)):
+            if trace_id is not None and trace.id != trace_id:
+                continue
+            if failed and not trace.failed:
+                continue
+            if min_ms and trace.duration * 1000 < min_ms:
+                continue
+            if route and trace.route != route and not trace.path.startswith(route):
+                continue
+            out.append(trace.to_dict())
+            if len(out) >= limit:
+                break
+        return out
+
+    def stats(self):
+        durations = sorted(trace.duration for trace in list(self.traces))
+        return {
+            "enabled": self.enabled,
+            "max_entries": self.size,
+            "kept": len(durations) if self.size else 0,
+            "started": self.started,
+            "failed": self.failed,
+            "slow_ms": self.slow_ms,
+            "p50_ms": _ms(durations[len(durations) // 2]) if durations else None,
+            "p99_ms": _ms(durations[int(len(durations) * 0.99)]) if durations else None
+        }
+
+
+def current():
+    return _trace.get()
+
+
+def span(name, **attrs):
+    """Aktif izde süre ölçen span (with ile kullanılır); iz yoksa NULL_SPAN"""
+    trace = _trace.get()
+    if trace is None:
+        return NULL_SPAN
+    return trace.span(name, attrs)
+
+
+def annotate(**attrs):
+    """Aktif izin kendisine alan ekle (kaynak, cache sonucu vb.)"""
+    trace = _trace.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
+
+
+def sent(nbytes, **attrs):
+    """İstemciye aktarılan gövde byte'ları (akış yanıtlarında Content-Length yerine)"""
+    trace = _trace.get()
+    if trace is not None:
+        trace.bytes = nbytes
+        trace.attrs.update(attrs)
+
+
+def error(exc, where):
+    """Yutulan hatayı aktif ize yaz - istek yine de başarılı dönebilir"""
+    trace = _trace.get()
+    if trace is not None:
+        trace.error = f"{where}: {_describe(exc)}"[:MAX_ERROR]
+
+
+def upstream(method, host):
+    """Upstream çağrısı span'i; bağlantı ve gövde ölçümleri bu span'e eklenir"""
+    trace = _trace.get()
+    if trace is None:
+        return NULL_SPAN
+    span = trace.span('upstream', {"method": method, "host": host})
+    _upstream.set(span)
+    return span
+
+
+def upstream_timing(name, seconds):
+    """Aktif upstream span'ine aşama süresi ekle (dns, connect)"""
+    span = _upstream.get()
+    if span is not None:
+        span.attrs[f'{name}_ms'] = _ms(seconds)
+
+
+def upstream_done(nbytes=None):
+    """Upstream gövdesi tamamen okundu: transfer süresi = toplam - ttfb"""
+    span = _upstream.get()
+    if span is None or span.duration is None:
+        return
+    span.attrs['transfer_ms'] = _ms(time.perf_counter() - span.start - span.duration)
+    if nbytes is not None:
+        span.attrs['bytes'] = nbytes
+
+
+def bind(fn):
+    """fn'i çağıranın iz bağlamında çalıştıran sarmalayıcı (arka plan greenlet'leri için); iz yoksa fn"""
+    if _trace.get() is None:
+        return fn
+    ctx = contextvars.copy_context()
+
+    def run(*args):
+        return ctx.run(fn, *args)
+    return run
+
+
+# Örnekleyici profiler: her `interval`'de tüm thread'lerin çalışan yığınları toplanır,
+# çıktı flamegraph.pl / speedscope'un okuduğu "collapsed" biçimidir (a;b;c sayı)
+IDLE_FILES = ('threading.py', '_threading.py', 'selectors.py', 'queue.py')
+IDLE_FRAMES = {('hub.py', 'run'), ('hub.py', 'wait'), ('hub.py', 'switch'), ('thread.py', '_worker')}
+_profile_state = {}  # setdefault GIL altında atomik (gevent'in yamaladığı Lock native thread'de kullanılmaz)
+
+
+class ProfileBusy(Exception):
+    """Aynı anda tek profil alınabilir"""
+
+
+def _label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ':')
+
+
+def _is_idle(frame):
+    code = frame.f_code
+    name = os.path.basename(code.co_filename)
+    return name in IDLE_FILES or (name, code.co_name) in IDLE_FRAMES
+
+
+def profile(seconds, interval=0.005, idle=False, sleep=time.sleep):
+    """seconds boyunca örnekle; (collapsed satırlar, örnek sayısı) döndür. Ayrı bir OS
+    thread'inde çağrılmalı (gevent'te hub threadpool'u); sleep monkey patch'siz olmalı."""
+    token = object()
+    if _profile_state.setdefault('running', token) is not token:
+        raise ProfileBusy("profile already running")
+    try:
+        stacks = Counter()
+        samples = 0
+        me = sys._getframe()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            for frame in sys._current_frames().values():
+                if frame is me or (not idle and _is_idle(frame)):
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_label(frame.f_code))
+                    frame = frame.f_back
+                stacks[';'.join(reversed(labels))] += 1
+            samples += 1
+            sleep(interval)
+        return [f"{stack} {count}" for stack, count in stacks.most_common()], samples
+    finally:
+        del _profile_state['running']